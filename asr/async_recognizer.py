@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from websocket import ABNF
+
+from common.async_ws import AsyncWebSocket
+from common.log import logger
+from common import json_codec
+from common.state import CLOSE_TIMEOUT, session_state
+from asr import speech_recognizer
+from asr import realtime_recognizer_v2
+from asr.transcript import Transcript
+from asr.speech_recognizer import SpeechRecognizer, SpeechRecognitionListener
+from asr.realtime_recognizer_v2 import (RealtimeRecognizerV2,
+                                        RealtimeRecognitionListenerV2)
+
+
+# ---------------------------------------------------------------------------
+# asyncio 版实时识别：参数 setter、签名与消息分发均继承自同步版本，
+# 收发全部在事件循环内完成，不占用额外线程。
+#
+#   async with AsyncRealtimeRecognizerV2(appid, cred, "16k_zh") as rec:
+#       ...  # 另起任务 await rec.write(chunk)，最后 await rec.stop()
+#       async for event in rec.events():
+#           ...
+#
+# events() 产出的 dict 与同步版 listener 收到的 response 一致；传入 listener 时
+# 同样会在事件循环线程内回调。
+# write() 须在 start() 完成后调用，之前或会话出错后调用会抛出 RuntimeError。
+# 支持 set_client_vad / set_sentence_diff；set_preroll / set_reactor / set_coalesce_partials 只适用于同步版本，调用会抛出 NotImplementedError。
+# ---------------------------------------------------------------------------
+class _AsyncRecognizerMixin(object):
+
+    def _init_async(self, connect_timeout):
+        self.connect_timeout = connect_timeout
+        self._aws = None
+        self._recv_task = None
+        self._queue = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.stop()
+        else:
+            await self.close()
+
+    async def events(self):
+        while True:
+            event = await self._queue.get()
+            if event is None:
+                return
+            yield event
+
+    def set_preroll(self, max_bytes, burst=True):
+        raise NotImplementedError("preroll is not supported by async recognizer, await start() before write()")
+
+    def set_reactor(self, reactor):
+        raise NotImplementedError("async recognizer runs on the asyncio event loop, reactor is not supported")
+
+    def set_coalesce_partials(self, enable, max_queue=256, pool=None):
+        raise NotImplementedError("coalesce_partials is not supported by async recognizer, consume events() instead")
+
+    def _reset_client_vad(self):
+        if self.client_vad is not None:
+            if self.voice_format != 1:
+                raise ValueError("client vad requires pcm audio (voice_format=1)")
+            self.client_vad.reset()
+
+    async def write(self, data):
+        if not self._is_opened():
+            # 与同步版一致，已结束的会话忽略写入；未建连或已出错时抛出，避免音频被静默丢弃
+            session_state(self).raise_error()
+            if self._is_pending():
+                raise RuntimeError("voice_id: %s, write() called before start() completed"
+                                   % self.voice_id)
+            return
+        if self.client_vad is not None:
+            data = self.client_vad.process(data)
+            if not data:
+                return
+        await self._aws.send(data, ABNF.OPCODE_BINARY)
+
+    async def stop(self):
+        if self._is_opened():
+            try:
+                if self.client_vad is not None:
+                    tail = self.client_vad.flush()
+                    if tail:
+                        await self._aws.send(tail, ABNF.OPCODE_BINARY)
+                await self._aws.send(json_codec.dumps({"type": "end"}))
+            except Exception:
+                pass
+        if self._recv_task is not None:
+            try:
+                await asyncio.wait_for(self._recv_task, CLOSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("%s wait for final result timed out" % self.voice_id)
+        await self.close()
+
+    async def close(self):
+        if self._recv_task is not None and not self._recv_task.done():
+            self._recv_task.cancel()
+        if self._aws is not None:
+            await self._aws.close()
+        self._set_closed()
+        if self._queue is not None:
+            self._queue.put_nowait(None)
+
+    async def _connect(self, requrl):
+        self._queue = asyncio.Queue()
+        self._aws = await AsyncWebSocket.connect(requrl, timeout=self.connect_timeout)
+
+    def _start_receive(self):
+        self._recv_task = asyncio.ensure_future(self._receive_loop())
+
+    async def _receive_loop(self):
+        try:
+            while True:
+                opcode, data = await self._aws.recv()
+                if opcode == ABNF.OPCODE_CLOSE:
+                    break
+                event, done = self._dispatch(data)
+                if event is not None:
+                    self._queue.put_nowait(event)
+                if done:
+                    break
+        except Exception as e:
+            event = self._dispatch_error(e)
+            if event is not None:
+                self._queue.put_nowait(event)
+        self._queue.put_nowait(None)
+
+
+class AsyncSpeechRecognizer(_AsyncRecognizerMixin, SpeechRecognizer):
+
+    def __init__(self, appid, credential, engine_model_type, listener=None,
+                 connect_timeout=None):
+        SpeechRecognizer.__init__(self, appid, credential, engine_model_type,
+                                  listener or SpeechRecognitionListener())
+        self._init_async(connect_timeout)
+
+    def _is_opened(self):
+        return self.status == speech_recognizer.OPENED
+
+    def _is_pending(self):
+        return self.status in (speech_recognizer.NOTOPEN, speech_recognizer.STARTED)
+
+    def _set_closed(self):
+        if self.status != speech_recognizer.FINAL:
+            self.status = speech_recognizer.CLOSED
+
+    async def start(self):
+        self._reset_client_vad()
+        requrl = self.create_request_url()
+        session_state(self).reset(speech_recognizer.STARTED)
+        try:
+            await self._connect(requrl)
+        except Exception as e:
+            session_state(self).set(speech_recognizer.ERROR, e)
+            raise
+        self.status = speech_recognizer.OPENED
+        self._start_receive()
+        response = {'voice_id': self.voice_id}
+        self.listener.on_recognition_start(response)
+        logger.info("%s async recognition start" % self.voice_id)
+
+    def _dispatch(self, data):
+        response = self.dispatch_message(data)
+        done = response is not None and (
+            response['code'] != 0 or response.get('final', 0) == 1)
+        return response, done
+
+    def _dispatch_error(self, e):
+        if self.status in (speech_recognizer.FINAL, speech_recognizer.CLOSED):
+            return None
+        session_state(self).set(speech_recognizer.ERROR, e)
+        logger.error("websocket error %s  voice id %s" % (format(e), self.voice_id))
+        response = {'code': -1, 'message': str(e), 'voice_id': self.voice_id}
+        self.listener.on_fail(response)
+        return response
+
+
+class AsyncRealtimeRecognizerV2(_AsyncRecognizerMixin, RealtimeRecognizerV2):
+
+    def __init__(self, appid, credential, engine_model_type, listener=None,
+                 connect_timeout=None):
+        RealtimeRecognizerV2.__init__(self, appid, credential, engine_model_type,
+                                      listener or RealtimeRecognitionListenerV2())
+        self._init_async(connect_timeout)
+
+    def _is_opened(self):
+        return self._status == realtime_recognizer_v2._OPENED
+
+    def _is_pending(self):
+        return self._status in (realtime_recognizer_v2._NOTOPEN, realtime_recognizer_v2._STARTED)
+
+    def _set_closed(self):
+        if self._status != realtime_recognizer_v2._FINAL:
+            self._status = realtime_recognizer_v2._CLOSED
+
+    async def start(self):
+        self._reset_client_vad()
+        requrl = self._create_request_url()
+        session_state(self).reset(realtime_recognizer_v2._STARTED)
+        self._sentence_tracker = Transcript() if self._sentence_diff else None
+        try:
+            await self._connect(requrl)
+        except Exception as e:
+            session_state(self).set(realtime_recognizer_v2._ERROR, e)
+            raise
+        try:
+            opcode, first_msg = await self._aws.recv()
+            if opcode == ABNF.OPCODE_CLOSE:
+                raise RuntimeError("voice_id: %s, connection closed before start"
+                                   % self.voice_id)
+            start_resp = self._handle_first_message(first_msg)
+        except Exception as e:
+            await self._aws.close()
+            session_state(self).set(realtime_recognizer_v2._ERROR, e)
+            raise
+        self._status = realtime_recognizer_v2._OPENED
+        self._start_receive()
+        self.listener.on_recognition_start(start_resp)
+        logger.info("%s async realtime v2 recognition start" % self.voice_id)
+
+    def _dispatch(self, data):
+        return self._dispatch_message(data)
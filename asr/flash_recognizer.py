@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import requests
+from requests.adapters import HTTPAdapter
 import hmac
 import hashlib
 import base64
@@ -7,7 +8,162 @@ import time
 import random
 import os
 import json
+import mmap
+import contextlib
+import threading
+import asyncio
+import array
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from common import credential
+from common.cache import hash_key
+from common import json_codec
+from common.wav import parse_wav_header, wav_header
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _create_retry(total, backoff_factor, status_forcelist):
+    from urllib3.util.retry import Retry
+    kwargs = dict(total=total, backoff_factor=backoff_factor,
+                  status_forcelist=status_forcelist, raise_on_status=False)
+    # 默认不重试 POST，需显式放开；urllib3 1.26 之前参数名为 method_whitelist
+    try:
+        return Retry(allowed_methods=frozenset(['POST']), **kwargs)
+    except TypeError:
+        return Retry(method_whitelist=frozenset(['POST']), **kwargs)
+
+
+@contextlib.contextmanager
+def _open_audio(data):
+    '''
+    把 recognize 支持的输入转换为 requests 可流式发送的 body，内存占用与音频大小无关:
+    bytes/bytearray/memoryview 原样发送；本地文件路径 mmap 后以 memoryview 发送；
+    文件对象由 requests 按块读取；字节块迭代器以 chunked 方式上传。
+    '''
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield data
+    elif isinstance(data, str) or hasattr(data, '__fspath__'):
+        with open(data, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # 空文件或不支持 mmap 的文件系统
+                mm = None
+            if mm is None:
+                yield f
+                return
+            try:
+                with memoryview(mm) as view:
+                    yield view
+            finally:
+                try:
+                    mm.close()
+                except BufferError:
+                    # 异常的 traceback（或 requests 异常中的 request.body）仍引用切片，
+                    # 映射在最后一个引用释放后随对象回收，不能掩盖原始异常
+                    pass
+    elif hasattr(data, 'read'):
+        yield data
+    else:
+        yield (bytes(chunk) for chunk in data)
+
+
+def _close_when_idle(pool, session):
+    pool.shutdown(wait=True)
+    session.close()
+
+
+def _frame_energies(pcm, frame_bytes):
+    '''16bit 小端 PCM 按 frame_bytes 分帧，返回每帧样本平方和，有 numpy 时向量化计算'''
+    count = len(pcm) // frame_bytes
+    if count == 0:
+        return []
+    if np is not None:
+        samples = np.frombuffer(pcm, dtype='<i2', count=count * frame_bytes // 2)
+        frames = samples.reshape(count, -1).astype(np.int64)
+        return (frames * frames).sum(axis=1).tolist()
+    samples = array.array('h', bytes(pcm[:count * frame_bytes]))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    step = frame_bytes // 2
+    return [sum(x * x for x in samples[i:i + step]) for i in range(0, len(samples), step)]
+
+
+def _split_pcm(pcm, sample_rate, block_align, segment_ms, search_ms, frame_ms=20):
+    '''
+    每隔约 segment_ms 切一刀，切点取目标位置前后 search_ms 内能量最低的帧的中点，
+    尽量落在停顿处而不是句子中间。返回按顺序排列的 (start, end) 字节区间。
+    '''
+    def ms_to_bytes(ms):
+        return sample_rate * ms // 1000 * block_align
+
+    frame_bytes = max(ms_to_bytes(frame_ms), block_align)
+    segment_bytes = max(ms_to_bytes(segment_ms), frame_bytes)
+    search_bytes = min(ms_to_bytes(search_ms), segment_bytes // 2)
+    total = len(pcm) - len(pcm) % block_align
+    bounds = []
+    start = 0
+    while total - start > segment_bytes + search_bytes:
+        lo = start + segment_bytes - search_bytes
+        energies = _frame_energies(pcm[lo:lo + 2 * search_bytes], frame_bytes)
+        if energies:
+            quietest = energies.index(min(energies))
+            cut = lo + quietest * frame_bytes + frame_bytes // 2 // block_align * block_align
+        else:
+            # 搜索窗口不足一帧（search_ms 很小或为 0）：直接在目标位置切分
+            cut = start + segment_bytes
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, total))
+    return bounds
+
+
+def _words_relative(resp):
+    '''word_list 的时间是否相对所在句子：起点大于 0 的句子其首词早于句子起点即为相对时间'''
+    for result in resp.get('flash_result') or []:
+        for sentence in result.get('sentence_list') or []:
+            words = sentence.get('word_list')
+            start_time = sentence.get('start_time', 0)
+            if words and start_time > 0:
+                return words[0].get('start_time', 0) < start_time
+    return False
+
+
+def _shift_times(item, offset):
+    item = dict(item)
+    item['start_time'] = item.get('start_time', 0) + offset
+    item['end_time'] = item.get('end_time', 0) + offset
+    return item
+
+
+def _stitch_results(responses, offsets):
+    '''
+    合并各分段的返回：同一 channel_id 的 text 依次拼接，句子与词的时间加上分段起点，
+    audio_duration 求和，其余字段取第一个分段的值。
+    '''
+    merged = dict(responses[0])
+    merged['audio_duration'] = sum(r.get('audio_duration', 0) for r in responses)
+    channels = {}
+    for resp, offset in zip(responses, offsets):
+        shift_words = not _words_relative(resp)
+        for result in resp.get('flash_result') or []:
+            channel_id = result.get('channel_id', 0)
+            channel = channels.get(channel_id)
+            if channel is None:
+                channel = dict(result, text="", sentence_list=[])
+                channels[channel_id] = channel
+            channel['text'] += result.get('text', "")
+            for sentence in result.get('sentence_list') or []:
+                sentence = _shift_times(sentence, offset)
+                if shift_words and sentence.get('word_list'):
+                    sentence['word_list'] = [_shift_times(w, offset) for w in sentence['word_list']]
+                channel['sentence_list'].append(sentence)
+    merged['flash_result'] = [channels[k] for k in sorted(channels)]
+    return merged
+
 
 #录音识别极速版使用
 class FlashRecognitionRequest:
@@ -75,6 +231,15 @@ class FlashRecognitionRequest:
         self.replace_text_id = replace_text_id
 
 
+#recognize_many 的单条结果，key 为调用方传入的标识，成功时 result 为服务端返回的原始 json 文本，
+#失败时 error 为对应异常
+class FlashBatchResult:
+    def __init__(self, key, result=None, error=None):
+        self.key = key
+        self.result = result
+        self.error = error
+
+
 class FlashRecognizer:
     '''
     reponse:  
@@ -107,6 +272,75 @@ class FlashRecognizer:
     def __init__(self, appid, credential):
         self.credential = credential
         self.appid = appid
+        self.pool_size = 10
+        self.connect_timeout = 10
+        self.read_timeout = None
+        self.retry = 0
+        self.retry_backoff = 0.5
+        self.retry_status = (500, 502, 503, 504)
+        self._session = None
+        self._own_session = False
+        self._session_lock = threading.Lock()
+        self.cache = None
+
+    #连接池大小，并发调用 recognize 时建议不小于并发数
+    def set_pool_size(self, pool_size):
+        self.pool_size = pool_size
+        self._reset_session()
+
+    #单位秒，read_timeout 为 None 表示不限制读超时
+    def set_timeout(self, connect_timeout, read_timeout=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    #连接失败或返回 retry_status 中的状态码时重试，按 retry_backoff 指数退避
+    def set_retry(self, retry, retry_backoff=0.5, retry_status=(500, 502, 503, 504)):
+        self.retry = retry
+        self.retry_backoff = retry_backoff
+        self.retry_status = retry_status
+        self._reset_session()
+
+    #自定义传输层，需提供 post(url, headers=, data=, timeout=) 且返回值带 text 属性，
+    #如 requests.Session；调用方负责其生命周期
+    def set_session(self, session):
+        self._reset_session()
+        self._session = session
+
+    #结果缓存，需提供 get(key)/put(key, value)，如 common.cache.TieredCache；
+    #key 由音频内容与识别参数计算，只缓存成功(code=0)的结果，None 表示关闭
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def close(self):
+        self._reset_session()
+
+    def _reset_session(self):
+        if self._own_session and self._session is not None:
+            self._session.close()
+        self._session = None
+        self._own_session = False
+
+    def _create_session(self, pool_size=None):
+        session = requests.Session()
+        max_retries = 0
+        if self.retry > 0:
+            max_retries = _create_retry(self.retry, self.retry_backoff, self.retry_status)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or self.pool_size,
+                              max_retries=max_retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _get_session(self):
+        session = self._session
+        if session is None:
+            with self._session_lock:
+                session = self._session
+                if session is None:
+                    session = self._create_session()
+                    self._session = session
+                    self._own_session = True
+        return session
 
     def _format_sign_string(self, param):
         signstr = "POSTasr.cloud.tencent.com/asr/flash/v1/"
@@ -175,9 +409,190 @@ class FlashRecognizer:
             query_arr['replace_text_id'] = req.replace_text_id
         return query_arr
 
+    def _cache_key(self, req, body):
+        params = self._create_query_arr(req)
+        del params['timestamp']
+        del params['secretid']
+        return hash_key(json.dumps(params, sort_keys=True), body)
+
+    #data 可以是音频 bytes、本地文件路径、文件对象或字节块迭代器，后三者流式上传；
+    #文件对象与迭代器只能读取一次，set_retry 的重试与 set_cache 的缓存仅对 bytes 和文件路径有效
     def recognize(self, req, data):
-        header = self._build_header()
-        query_arr = self._create_query_arr(req)
-        req_url = self._build_req_with_signature(self.credential.secret_key, query_arr, header)
-        r = requests.post(req_url, headers=header, data=data)
-        return r.text
+        return self._recognize(req, data, None)
+
+    def _recognize(self, req, data, session):
+        with _open_audio(data) as body:
+            key = None
+            if self.cache is not None and isinstance(body, (bytes, bytearray, memoryview)):
+                key = self._cache_key(req, body)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return bytes(cached).decode('utf-8')
+            header = self._build_header()
+            query_arr = self._create_query_arr(req)
+            req_url = self._build_req_with_signature(self.credential.secret_key, query_arr, header)
+            session = session if session is not None else self._get_session()
+            r = session.post(req_url, headers=header, data=body,
+                             timeout=(self.connect_timeout, self.read_timeout))
+        text = r.text
+        if key is not None:
+            try:
+                succeeded = json_codec.loads(text).get('code') == 0
+            except ValueError:
+                succeeded = False
+            if succeeded:
+                self.cache.put(key, text.encode('utf-8'))
+        return text
+
+    def _batch_session(self, max_concurrency):
+        '''
+        批量识别使用的 (session, 是否需要批量结束后关闭)：连接池小于并发数时单独创建一个，
+        不改动 pool_size，也不影响其他线程正在使用的 session；set_session 提供的传输层原样使用
+        '''
+        if (self._session is not None and not self._own_session) or self.pool_size >= max_concurrency:
+            return self._get_session(), False
+        return self._create_session(max_concurrency), True
+
+    @staticmethod
+    def _release_batch(pool, session, owned, wait_on_exit):
+        pool.shutdown(wait=wait_on_exit)
+        if not owned:
+            return
+        if wait_on_exit:
+            session.close()
+            return
+        # 提前退出时仍有请求在途，等它们结束后再关闭单独创建的 session
+        thread = threading.Thread(target=_close_when_idle, args=(pool, session))
+        thread.daemon = True
+        thread.start()
+
+    @staticmethod
+    def _batch_result(key, future):
+        try:
+            return FlashBatchResult(key, result=future.result())
+        except Exception as e:
+            return FlashBatchResult(key, error=e)
+
+    def recognize_many(self, items, max_concurrency=4):
+        '''
+        并发识别多个音频，按完成先后产出 FlashBatchResult。
+        items 为 (key, req, data) 的可迭代对象，按需读取，同时在途的请求不超过 max_concurrency；
+        单条失败只记录在该条结果的 error 上，不会中断整批。
+        '''
+        return self._iter_batch(items, max_concurrency)
+
+    def _iter_batch(self, items, max_concurrency, wait_on_exit=False):
+        # wait_on_exit=True 时提前退出也等待在途请求结束，保证 data 不再被工作线程引用
+        items = iter(items)
+        session, owned = self._batch_session(max_concurrency)
+        pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        pending = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < max_concurrency:
+                    try:
+                        key, req, data = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[pool.submit(self._recognize, req, data, session)] = key
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self._batch_result(pending.pop(future), future)
+        finally:
+            for future in pending:
+                future.cancel()
+            self._release_batch(pool, session, owned, wait_on_exit)
+
+    async def recognize_many_async(self, items, max_concurrency=4):
+        '''
+        recognize_many 的 asyncio 版本：items 可以是普通或异步可迭代对象，
+        HTTP 请求在独立线程池中执行，不阻塞事件循环。
+        '''
+        loop = asyncio.get_event_loop()
+        is_async = hasattr(items, '__aiter__')
+        items = items.__aiter__() if is_async else iter(items)
+        session, owned = self._batch_session(max_concurrency)
+        pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        pending = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < max_concurrency:
+                    try:
+                        if is_async:
+                            key, req, data = await items.__anext__()
+                        else:
+                            key, req, data = next(items)
+                    except (StopIteration, StopAsyncIteration):
+                        exhausted = True
+                        break
+                    future = loop.run_in_executor(pool, self._recognize, req, data, session)
+                    pending[future] = key
+                if not pending:
+                    return
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield self._batch_result(pending.pop(future), future)
+        finally:
+            for future in pending:
+                future.cancel()
+            self._release_batch(pool, session, owned, False)
+
+    def recognize_long(self, req, data, segment_ms=600000, max_concurrency=4,
+                       search_ms=5000, sample_rate=16000, channels=1):
+        '''
+        长音频分段识别：在低能量处把 16bit PCM/WAV 切成约 segment_ms 的分段并发识别，
+        再按 channel_id 拼接 flash_result，句子/词的 start_time、end_time 换算为整段音频上的时间。
+        data 为音频 bytes 或本地文件路径（mmap 读取，不整体载入内存）；
+        req.voice_format 为 pcm 时由 sample_rate/channels 描述音频，wav 时从文件头读取。
+        任一分段失败即停止，返回该分段的原始 json 文本（与 recognize 一致）或抛出其异常。
+        说话人分离（speaker_id）在各分段内独立编号，跨分段不保证一致。
+        '''
+        if req.voice_format not in ("pcm", "wav"):
+            raise ValueError("recognize_long only supports pcm or wav, got %r" % req.voice_format)
+        is_path = isinstance(data, str) or hasattr(data, '__fspath__')
+        if not is_path and not isinstance(data, (bytes, bytearray, memoryview)):
+            raise ValueError("recognize_long requires audio bytes or a local file path")
+        with _open_audio(data) as audio:
+            if req.voice_format == "wav":
+                info = parse_wav_header(audio)
+                if info.bits_per_sample != 16:
+                    raise ValueError("recognize_long only supports 16bit wav")
+                sample_rate, channels = info.sample_rate, info.channels
+                pcm = memoryview(audio)[info.data_offset:info.data_offset + info.data_size]
+            else:
+                if req.input_sample_rate:
+                    sample_rate = req.input_sample_rate
+                pcm = memoryview(audio)
+            with pcm:
+                block_align = channels * 2
+                bounds = _split_pcm(pcm, sample_rate, block_align, segment_ms, search_ms)
+                if len(bounds) == 1:
+                    return self.recognize(req, audio)
+
+                def segments():
+                    for i, (start, end) in enumerate(bounds):
+                        if req.voice_format == "wav":
+                            body = wav_header(sample_rate, channels, 16, end - start) + pcm[start:end]
+                        else:
+                            body = pcm[start:end]
+                        yield i, req, body
+
+                responses = [None] * len(bounds)
+                # 分段是 mmap 的切片：提前返回或抛出前须关闭生成器并等待在途请求结束，
+                # 否则映射仍被引用，关闭时抛出 BufferError 掩盖分段的真实错误
+                with contextlib.closing(segments()) as items, \
+                        contextlib.closing(self._iter_batch(items, max_concurrency, wait_on_exit=True)) as batch:
+                    for item in batch:
+                        if item.error is not None:
+                            raise item.error
+                        resp = json_codec.loads(item.result)
+                        if resp.get('code', 0) != 0:
+                            return item.result
+                        responses[item.key] = resp
+        offsets = [start // block_align * 1000 // sample_rate for start, _ in bounds]
+        return json.dumps(_stitch_results(responses, offsets), ensure_ascii=False)
@@ -4,7 +4,6 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 import uuid
 import urllib
@@ -12,6 +11,14 @@ import urllib
 import websocket
 
 from common.log import logger
+from common import json_codec
+from common import results
+from common.state import SessionStatus, session_state
+from common.preroll import PrerollBuffer
+from common.vad import EnergyVad
+from common.audio import engine_sample_rate
+from asr.transcript import Transcript, sentence_changes
+from common.dispatch import COALESCE, ListenerDispatcher
 
 
 def _is_python3():
@@ -46,6 +53,10 @@ class RealtimeRecognitionListenerV2:
     def on_recognition_sentences(self, response):
         pass
 
+    def on_sentence_changes(self, response):
+        """set_sentence_diff(True) 时代替 on_recognition_sentences，sentence_list 只含有变化的句子"""
+        pass
+
     def on_sentence_end(self, response):
         pass
 
@@ -70,11 +81,14 @@ _CLOSED = 5
 # ---------------------------------------------------------------------------
 class RealtimeRecognizerV2:
 
+    _status = SessionStatus()
+
     def __init__(self, appid, credential, engine_model_type, listener):
         self.appid = appid
         self.credential = credential
         self.engine_model_type = engine_model_type
         self.listener = listener
+        self.typed_results = False
 
         # request params (defaults aligned with Go V2 SDK)
         self.voice_format = 1
@@ -107,6 +121,11 @@ class RealtimeRecognizerV2:
         self._status = _NOTOPEN
         self._ws = None
         self._wst = None
+        self._preroll = None
+        self.client_vad = None
+        self._write_lock = threading.Lock()
+        self._sentence_diff = False
+        self._sentence_tracker = None
 
     # ---- setters (keep style consistent with existing Python SDK) ---------
 
@@ -158,6 +177,56 @@ class RealtimeRecognizerV2:
     def set_emotion_recognition(self, v):
         self.emotion_recognition = v
 
+    def set_coalesce_partials(self, enable, max_queue=256, pool=None):
+        """
+        消费者处理不过来时，同一 sentence_id 尚未回调的中间句子列表只保留最新一条，消费者空闲时再回调；
+        含最终句的列表与 final=1 消息从不丢弃。开启后回调在 common.dispatch 的工作线程上执行，
+        stop() 返回前会等待已排队的回调执行完。
+        """
+        if isinstance(self.listener, ListenerDispatcher):
+            self.listener = self.listener.listener
+        if enable:
+            self.listener = ListenerDispatcher(self.listener, max_queue, COALESCE, pool)
+
+    def set_sentence_diff(self, enable):
+        """
+        开启后不再回调 on_recognition_sentences，改为回调 on_sentence_changes，
+        其 sentences.sentence_list 只包含与之前相比文本、sentence_type 或时间有变化的句子（按 sentence_id 跟踪），
+        没有任何变化的消息不回调，下游开销与变化量成正比而不是与转写长度成正比。
+        """
+        self._sentence_diff = enable
+
+    def _deliver_sentences(self, msg):
+        if self._sentence_tracker is None:
+            self.listener.on_recognition_sentences(msg)
+            return
+        changed = self._sentence_tracker.update(msg)
+        if changed:
+            self.listener.on_sentence_changes(sentence_changes(msg, changed))
+
+    def set_typed_results(self, enable):
+        """开启后 listener 收到的消息中的句子与词解码为 common.results 中带 __slots__ 的对象，
+        仍支持 dict 式下标访问，需要 dict 时调用 as_dict()"""
+        self.typed_results = enable
+
+    def _loads(self, data):
+        return results.loads(data, results.ASR) if self.typed_results else json_codec.loads(data)
+
+    def set_preroll(self, max_bytes, burst=True):
+        """start() 建连期间 write() 的音频先缓存（最多 max_bytes），握手完成后按序补发"""
+        if max_bytes > 0:
+            self._preroll = PrerollBuffer(max_bytes, burst)
+        else:
+            self._preroll = None
+
+    def set_client_vad(self, vad):
+        """write() 的音频先经 common.vad.EnergyVad 去掉长静音再上传，只支持 voice_format=1(pcm)；
+        vad 为 True 时按引擎采样率使用默认参数，None/False 关闭。
+        开启后服务端时间戳相对已上传音频，需用 client_vad.stream_time() 换算"""
+        if vad is True:
+            vad = EnergyVad(engine_sample_rate(self.engine_model_type))
+        self.client_vad = vad or None
+
     def set_extra_param(self, key, value):
         """设置单个扩展参数，同名 key 会覆盖 SDK 默认填充的字段。"""
         if not key:
@@ -267,7 +336,7 @@ class RealtimeRecognizerV2:
 
     # ---- lifecycle --------------------------------------------------------
 
-    def start(self):
+    def _create_request_url(self):
         if self.voice_id == "":
             self.voice_id = str(uuid.uuid1())
 
@@ -282,14 +351,12 @@ class RealtimeRecognizerV2:
         else:
             signature = urllib.quote(signature)
         requrl += "&signature=%s" % signature
+        return requrl
 
-        # ---------- synchronous connect + read first message ---------------
-        ws_conn = websocket.create_connection(requrl)
-        first_msg = ws_conn.recv()
-        first_resp = json.loads(first_msg)
-
+    def _handle_first_message(self, first_msg):
+        """校验首包并回写 speaker_context_id，返回 on_recognition_start 的 response"""
+        first_resp = self._loads(first_msg)
         if first_resp.get('code', -1) != 0:
-            ws_conn.close()
             raise RuntimeError(
                 "voice_id: %s, code: %d, message: %s"
                 % (self.voice_id, first_resp.get('code', -1),
@@ -301,16 +368,39 @@ class RealtimeRecognizerV2:
         if ctx_id:
             self.speaker_context_id = ctx_id
 
-        self._ws_conn = ws_conn
-        self._status = _OPENED
-
-        # fire on_recognition_start
-        start_resp = {
+        return {
             'code': 0,
             'message': 'success',
             'voice_id': self.voice_id,
             'speaker_context_id': self.speaker_context_id,
         }
+
+    def start(self):
+        if self.client_vad is not None:
+            if self.voice_format != 1:
+                raise ValueError("client vad requires pcm audio (voice_format=1)")
+            self.client_vad.reset()
+        requrl = self._create_request_url()
+        self._status = _STARTED
+        self._sentence_tracker = Transcript() if self._sentence_diff else None
+
+        # ---------- synchronous connect + read first message ---------------
+        try:
+            ws_conn = websocket.create_connection(requrl)
+        except Exception:
+            self._start_failed()
+            raise
+        try:
+            start_resp = self._handle_first_message(ws_conn.recv())
+        except Exception:
+            ws_conn.close()
+            self._start_failed()
+            raise
+
+        self._ws_conn = ws_conn
+        self._open_and_flush()
+
+        # fire on_recognition_start
         self.listener.on_recognition_start(start_resp)
         logger.info("%s realtime v2 recognition start" % self.voice_id)
 
@@ -320,14 +410,41 @@ class RealtimeRecognizerV2:
         self._recv_thread.start()
 
     def write(self, data):
+        if self.client_vad is not None:
+            data = self.client_vad.process(data)
+            if not data:
+                return
         if self._status != _OPENED:
-            return
+            with self._write_lock:
+                if self._preroll is not None and self._status in (_NOTOPEN, _STARTED):
+                    self._preroll.push(data)
+                    return
+                if self._status != _OPENED:
+                    return
         self._ws_conn.send_binary(data)
 
+    def _open_and_flush(self):
+        # 先补发预缓冲音频再置为 OPENED，保证与后续 write() 的顺序
+        with self._write_lock:
+            if self._preroll is not None:
+                for frame in self._preroll.drain():
+                    self._ws_conn.send_binary(frame)
+            self._status = _OPENED
+
+    def _start_failed(self):
+        with self._write_lock:
+            if self._preroll is not None:
+                self._preroll.clear()
+            self._status = _ERROR
+
     def stop(self):
         if self._status == _OPENED:
             try:
-                self._ws_conn.send(json.dumps({"type": "end"}))
+                if self.client_vad is not None:
+                    tail = self.client_vad.flush()
+                    if tail:
+                        self._ws_conn.send_binary(tail)
+                self._ws_conn.send(json_codec.dumps({"type": "end"}))
             except Exception:
                 pass
         if hasattr(self, '_recv_thread') and self._recv_thread.is_alive():
@@ -337,6 +454,8 @@ class RealtimeRecognizerV2:
         except Exception:
             pass
         self._status = _CLOSED
+        if isinstance(self.listener, ListenerDispatcher):
+            self.listener.join()
 
     # ---- internal receive loop --------------------------------------------
 
@@ -346,37 +465,49 @@ class RealtimeRecognizerV2:
                 data = self._ws_conn.recv()
                 if not data:
                     break
-                msg = json.loads(data)
-                msg['voice_id'] = self.voice_id
-
-                if msg.get('code', 0) != 0:
-                    self._status = _ERROR
-                    self.listener.on_fail(msg)
-                    logger.error(
-                        "%s server fail code=%d message=%s"
-                        % (self.voice_id, msg['code'], msg.get('message', ''))
-                    )
+                _, done = self._dispatch_message(data)
+                if done:
                     break
 
-                if msg.get('final', 0) == 1:
-                    self._status = _FINAL
-                    self.listener.on_sentence_end(msg)
-                    logger.info("%s realtime v2 recognition complete" % self.voice_id)
-                    break
+        except Exception as e:
+            self._dispatch_error(e)
 
-                # 句子模式：每条消息都是句子列表
-                self.listener.on_recognition_sentences(msg)
+    def _dispatch_message(self, data):
+        """解析一条服务端消息并回调 listener，返回 (msg, 是否结束)"""
+        msg = self._loads(data)
+        msg['voice_id'] = self.voice_id
 
-        except Exception as e:
-            if self._status in (_FINAL, _CLOSED):
-                return
+        if msg.get('code', 0) != 0:
             self._status = _ERROR
-            fail_resp = {
-                'code': -1,
-                'message': str(e),
-                'voice_id': self.voice_id,
-            }
-            self.listener.on_fail(fail_resp)
+            self.listener.on_fail(msg)
             logger.error(
-                "%s receive error: %s" % (self.voice_id, e)
+                "%s server fail code=%d message=%s"
+                % (self.voice_id, msg['code'], msg.get('message', ''))
             )
+            return msg, True
+
+        if msg.get('final', 0) == 1:
+            self._status = _FINAL
+            self.listener.on_sentence_end(msg)
+            logger.info("%s realtime v2 recognition complete" % self.voice_id)
+            return msg, True
+
+        # 句子模式：每条消息都是句子列表
+        self._deliver_sentences(msg)
+        return msg, False
+
+    def _dispatch_error(self, e):
+        """接收异常转换为 on_fail，已结束的会话忽略；返回 fail response 或 None"""
+        if self._status in (_FINAL, _CLOSED):
+            return None
+        session_state(self).set(_ERROR, e)
+        fail_resp = {
+            'code': -1,
+            'message': str(e),
+            'voice_id': self.voice_id,
+        }
+        self.listener.on_fail(fail_resp)
+        logger.error(
+            "%s receive error: %s" % (self.voice_id, e)
+        )
+        return fail_resp
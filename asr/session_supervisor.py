@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from common.log import logger
+from common.vad import EnergyVad
+
+# 第 n 个会话的句子编号加上 n * SENTENCE_ID_STRIDE，保证跨会话不重复
+SENTENCE_ID_STRIDE = 100000
+
+
+def _words_absolute(item, start_key):
+    '''词时间是否与句子使用同一时间轴（否则为相对句子起点，无需平移）'''
+    words = item.get('word_list') or []
+    if not words:
+        return False
+    return item.get(start_key, 0) <= 0 or words[0].get('start_time', 0) >= item.get(start_key, 0)
+
+
+class _Session(object):
+
+    def __init__(self, supervisor, number, base_sent_ms):
+        self.supervisor = supervisor
+        self.number = number
+        self.base_sent_ms = base_sent_ms
+        self.recognizer = None
+        self.thread = None
+
+
+class _SessionListener(object):
+    '''把单个会话的回调转发给用户 listener，时间戳换算为整条音频流上的绝对时间，句子编号跨会话不重复'''
+
+    def __init__(self, session, listener):
+        self._session = session
+        self._listener = listener
+
+    def __getattr__(self, name):
+        attr = getattr(self._listener, name)
+        if not name.startswith("on_") or not callable(attr):
+            return attr
+
+        def forward(response):
+            if hasattr(response, 'get'):
+                self._rewrite(response)
+                response['session_index'] = self._session.number
+            return attr(response)
+        return forward
+
+    def _rewrite(self, response):
+        result = response.get('result')
+        if result is not None and hasattr(result, 'get') and 'index' in result:
+            self._shift(result, 'index')
+        sentences = response.get('sentences')
+        if sentences is not None and hasattr(sentences, 'get'):
+            for sentence in sentences.get('sentence_list') or []:
+                self._shift(sentence, 'sentence_id')
+
+    def _shift(self, item, id_key):
+        session = self._session
+        item[id_key] = item.get(id_key, 0) + session.number * SENTENCE_ID_STRIDE
+        words_absolute = _words_absolute(item, 'start_time')
+        to_stream = session.supervisor._to_stream_time
+        for key in ('start_time', 'end_time'):
+            if key in item:
+                item[key] = to_stream(session, item[key])
+        if words_absolute:
+            for word in item.get('word_list') or []:
+                for key in ('start_time', 'end_time'):
+                    if key in word:
+                        word[key] = to_stream(session, word[key])
+
+
+class VadSessionSupervisor(object):
+    '''
+    按语音活动管理识别会话：静音时不占用连接，检测到语音才创建并启动识别器，
+    连续静音超过 close_silence_ms 后结束该会话，下次说话再新建。
+
+        def factory(listener):
+            recognizer = speech_recognizer.SpeechRecognizer(APPID, credential, "16k_zh", listener)
+            recognizer.set_voice_format(1)
+            return recognizer
+        supervisor = VadSessionSupervisor(factory, MyListener(), sample_rate=16000)
+        supervisor.write(pcm)      # 持续写入 16bit 单声道 PCM，与直接调用 recognizer.write 相同
+        ...
+        supervisor.close()
+
+    factory(listener) 返回尚未 start 的 SpeechRecognizer/RealtimeRecognizerV2（音频格式须为 pcm），
+    建连期间的音频由识别器的预缓冲（set_preroll）暂存，write() 不会阻塞。
+    listener 收到的消息中 start_time/end_time（以及使用同一时间轴的词时间）为整条音频流上的毫秒数，
+    result.index / sentence_id 加上 会话序号 * SENTENCE_ID_STRIDE 保证跨会话不重复，session_index 为会话序号；
+    on_recognition_start/on_recognition_complete 等按会话各回调一次。
+    vad 为 common.vad.EnergyVad，其 hangover_ms 应不小于识别参数 vad_silence_time。
+    '''
+
+    def __init__(self, factory, listener, sample_rate=16000, close_silence_ms=10000,
+                 vad=None, preroll_bytes=None):
+        self.factory = factory
+        self.listener = listener
+        self.sample_rate = sample_rate
+        self.close_silence_ms = close_silence_ms
+        self.vad = vad if vad is not None else EnergyVad(sample_rate)
+        self.preroll_bytes = preroll_bytes if preroll_bytes is not None else sample_rate * 2 * 10
+        # 统计：已创建会话数、启动失败数、当前连接数
+        self.sessions = 0
+        self.failed = 0
+        self.live = 0
+        self._lock = threading.Lock()
+        self._current = None
+        self._silence_ms = 0
+        self._closing = []
+
+    def write(self, data):
+        base = self.vad.sent_ms
+        out = self.vad.process(data)
+        duration = len(data) * 1000 // (self.sample_rate * 2)
+        if self.vad.speaking:
+            self._silence_ms = 0
+        else:
+            self._silence_ms += duration
+        if self._current is None:
+            if not self.vad.speaking:
+                # 会话外的保活帧与静音直接丢弃
+                return
+            self._open(base)
+        if out:
+            self._current.recognizer.write(out)
+        if self._silence_ms >= self.close_silence_ms:
+            self._close_current()
+
+    def close(self):
+        '''结束音频流：关闭当前会话并等待所有会话收到最终结果'''
+        if self._current is not None:
+            tail = self.vad.flush()
+            if tail:
+                self._current.recognizer.write(tail)
+            self._close_current()
+        with self._lock:
+            threads = list(self._closing)
+        for thread in threads:
+            thread.join()
+
+    def _to_stream_time(self, session, ms):
+        return self.vad.stream_time(session.base_sent_ms + ms)
+
+    def _open(self, base_sent_ms):
+        session = _Session(self, self.sessions, base_sent_ms)
+        recognizer = self.factory(_SessionListener(session, self.listener))
+        recognizer.set_preroll(self.preroll_bytes)
+        session.recognizer = recognizer
+        self.sessions += 1
+        with self._lock:
+            self.live += 1
+        self._current = session
+        logger.info("vad session {} open at {} ms".format(session.number, self.vad.stream_time(base_sent_ms)))
+        # 建连在后台进行，期间 write() 的音频进入识别器预缓冲
+        session.thread = threading.Thread(target=self._run, args=(session,))
+        session.thread.daemon = True
+        session.thread.start()
+
+    def _run(self, session):
+        try:
+            session.recognizer.start()
+        except Exception as e:
+            logger.error("vad session {} start failed: {}".format(session.number, e))
+            self.failed += 1
+
+    def _close_current(self):
+        session = self._current
+        self._current = None
+        thread = threading.Thread(target=self._stop, args=(session,))
+        thread.daemon = True
+        with self._lock:
+            self._closing.append(thread)
+        thread.start()
+
+    def _stop(self, session):
+        session.thread.join()
+        try:
+            session.recognizer.stop()
+        except Exception as e:
+            logger.warning("vad session {} stop failed: {}".format(session.number, e))
+        with self._lock:
+            self.live -= 1
+            self._closing.remove(threading.current_thread())
+        logger.info("vad session {} closed".format(session.number))
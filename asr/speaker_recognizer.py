@@ -4,7 +4,6 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 import uuid
 import urllib
@@ -12,6 +11,11 @@ import urllib
 import websocket
 
 from common.log import logger
+from common import json_codec
+from common import results
+from common.state import SessionStatus, session_state
+from common.preroll import PrerollBuffer
+from asr.transcript import Transcript, sentence_changes
 
 
 def _is_python3():
@@ -46,6 +50,10 @@ class SpeakerRecognitionListener:
     def on_recognition_sentences(self, response):
         pass
 
+    def on_sentence_changes(self, response):
+        """set_sentence_diff(True) 时代替 on_recognition_sentences，sentence_list 只含有变化的句子"""
+        pass
+
     def on_sentence_end(self, response):
         pass
 
@@ -69,11 +77,14 @@ _CLOSED = 5
 # ---------------------------------------------------------------------------
 class SpeakerRecognizer:
 
+    _status = SessionStatus()
+
     def __init__(self, appid, credential, engine_model_type, listener):
         self.appid = appid
         self.credential = credential
         self.engine_model_type = engine_model_type
         self.listener = listener
+        self.typed_results = False
 
         # request params (defaults aligned with Go SDK)
         self.voice_format = 1
@@ -100,6 +111,10 @@ class SpeakerRecognizer:
         self._status = _NOTOPEN
         self._ws = None
         self._wst = None
+        self._preroll = None
+        self._write_lock = threading.Lock()
+        self._sentence_diff = False
+        self._sentence_tracker = None
 
     # ---- setters (keep style consistent with existing Python SDK) ---------
 
@@ -151,6 +166,37 @@ class SpeakerRecognizer:
     def set_emotion_recognition(self, v):
         self.emotion_recognition = v
 
+    def set_sentence_diff(self, enable):
+        """
+        开启后不再回调 on_recognition_sentences，改为回调 on_sentence_changes，
+        其 sentences.sentence_list 只包含与之前相比文本、sentence_type 或时间有变化的句子（按 sentence_id 跟踪），
+        没有任何变化的消息不回调，下游开销与变化量成正比而不是与转写长度成正比。
+        """
+        self._sentence_diff = enable
+
+    def _deliver_sentences(self, msg):
+        if self._sentence_tracker is None:
+            self.listener.on_recognition_sentences(msg)
+            return
+        changed = self._sentence_tracker.update(msg)
+        if changed:
+            self.listener.on_sentence_changes(sentence_changes(msg, changed))
+
+    def set_typed_results(self, enable):
+        """开启后 listener 收到的消息中的句子与词解码为 common.results 中带 __slots__ 的对象，
+        仍支持 dict 式下标访问，需要 dict 时调用 as_dict()"""
+        self.typed_results = enable
+
+    def _loads(self, data):
+        return results.loads(data, results.ASR) if self.typed_results else json_codec.loads(data)
+
+    def set_preroll(self, max_bytes, burst=True):
+        """start() 建连期间 write() 的音频先缓存（最多 max_bytes），握手完成后按序补发"""
+        if max_bytes > 0:
+            self._preroll = PrerollBuffer(max_bytes, burst)
+        else:
+            self._preroll = None
+
     # ---- URL / signature --------------------------------------------------
 
     def _create_query_arr(self):
@@ -241,6 +287,7 @@ class SpeakerRecognizer:
     def start(self):
         if self.voice_id == "":
             self.voice_id = str(uuid.uuid1())
+        self._sentence_tracker = Transcript() if self._sentence_diff else None
 
         query_arr = self._create_query_arr()
         sorted_params = sorted(query_arr.items(), key=lambda d: d[0])
@@ -254,18 +301,26 @@ class SpeakerRecognizer:
             signature = urllib.quote(signature)
         requrl += "&signature=%s" % signature
 
-        # ---------- synchronous connect + read first message ---------------
-        ws_conn = websocket.create_connection(requrl)
-        first_msg = ws_conn.recv()
-        first_resp = json.loads(first_msg)
+        self._status = _STARTED
 
-        if first_resp.get('code', -1) != 0:
+        # ---------- synchronous connect + read first message ---------------
+        try:
+            ws_conn = websocket.create_connection(requrl)
+        except Exception:
+            self._start_failed()
+            raise
+        try:
+            first_resp = self._loads(ws_conn.recv())
+            if first_resp.get('code', -1) != 0:
+                raise RuntimeError(
+                    "voice_id: %s, code: %d, message: %s"
+                    % (self.voice_id, first_resp.get('code', -1),
+                       first_resp.get('message', ''))
+                )
+        except Exception:
             ws_conn.close()
-            raise RuntimeError(
-                "voice_id: %s, code: %d, message: %s"
-                % (self.voice_id, first_resp.get('code', -1),
-                   first_resp.get('message', ''))
-            )
+            self._start_failed()
+            raise
 
         # 回写服务端返回的 speaker_context_id
         ctx_id = first_resp.get('speaker_context_id', '')
@@ -273,7 +328,7 @@ class SpeakerRecognizer:
             self.speaker_context_id = ctx_id
 
         self._ws_conn = ws_conn
-        self._status = _OPENED
+        self._open_and_flush()
 
         # fire on_recognition_start
         start_resp = {
@@ -292,13 +347,32 @@ class SpeakerRecognizer:
 
     def write(self, data):
         if self._status != _OPENED:
-            return
+            with self._write_lock:
+                if self._preroll is not None and self._status in (_NOTOPEN, _STARTED):
+                    self._preroll.push(data)
+                    return
+                if self._status != _OPENED:
+                    return
         self._ws_conn.send_binary(data)
 
+    def _open_and_flush(self):
+        # 先补发预缓冲音频再置为 OPENED，保证与后续 write() 的顺序
+        with self._write_lock:
+            if self._preroll is not None:
+                for frame in self._preroll.drain():
+                    self._ws_conn.send_binary(frame)
+            self._status = _OPENED
+
+    def _start_failed(self):
+        with self._write_lock:
+            if self._preroll is not None:
+                self._preroll.clear()
+            self._status = _ERROR
+
     def stop(self):
         if self._status == _OPENED:
             try:
-                self._ws_conn.send(json.dumps({"type": "end"}))
+                self._ws_conn.send(json_codec.dumps({"type": "end"}))
             except Exception:
                 pass
         if hasattr(self, '_recv_thread') and self._recv_thread.is_alive():
@@ -317,7 +391,7 @@ class SpeakerRecognizer:
                 data = self._ws_conn.recv()
                 if not data:
                     break
-                msg = json.loads(data)
+                msg = self._loads(data)
                 msg['voice_id'] = self.voice_id
 
                 if msg.get('code', 0) != 0:
@@ -336,12 +410,12 @@ class SpeakerRecognizer:
                     break
 
                 # 句子模式：每条消息都是句子列表
-                self.listener.on_recognition_sentences(msg)
+                self._deliver_sentences(msg)
 
         except Exception as e:
             if self._status in (_FINAL, _CLOSED):
                 return
-            self._status = _ERROR
+            session_state(self).set(_ERROR, e)
             fail_resp = {
                 'code': -1,
                 'message': str(e),
@@ -4,12 +4,18 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 import websocket
 import uuid
 import urllib
 from common.log import logger
+from common import json_codec
+from common import results
+from common.state import CLOSE_TIMEOUT, OPEN_TIMEOUT, SessionStatus, session_state
+from common.preroll import PrerollBuffer
+from common.vad import EnergyVad
+from common.audio import engine_sample_rate
+from common.dispatch import COALESCE, ListenerDispatcher
 
 
 def is_python3():
@@ -79,6 +85,8 @@ CLOSED = 5
 #实时识别语音使用
 class SpeechRecognizer:
 
+    status = SessionStatus()
+
     def __init__(self, appid, credential, engine_model_type, listener):
         self.result = ""
         self.credential = credential
@@ -90,6 +98,7 @@ class SpeechRecognizer:
         self.voice_id = ""
         self.new_start = 0
         self.listener = listener
+        self.typed_results = False
         self.filter_dirty = 0
         self.filter_modal = 0
         self.filter_punc = 0
@@ -106,6 +115,11 @@ class SpeechRecognizer:
         self.replace_text_id = ""
         self.language_judgment = 0
         self.speaker_diarization = 0
+        self.reactor = None
+        self.preroll = None
+        self.client_vad = None
+        self.open_timeout = OPEN_TIMEOUT
+        self._write_lock = threading.Lock()
 
     #适用于中英粤的语种识别参考参数
     def set_language_judgment(self, language_judgment):
@@ -156,6 +170,43 @@ class SpeechRecognizer:
     def set_replace_text_id(self, replace_text_id):
         self.replace_text_id = replace_text_id
 
+    #消费者处理不过来时，同一句(index)尚未回调的中间结果只保留最新一条，消费者空闲时再回调；
+    #slice_type=2 的句末结果与 final=1 消息从不丢弃。开启后回调在 common.dispatch 的工作线程上执行，
+    #stop() 返回前会等待已排队的回调执行完
+    def set_coalesce_partials(self, enable, max_queue=256, pool=None):
+        if isinstance(self.listener, ListenerDispatcher):
+            self.listener = self.listener.listener
+        if enable:
+            self.listener = ListenerDispatcher(self.listener, max_queue, COALESCE, pool)
+
+    #开启后 listener 收到的消息中的 result 与 word_list 中的词解码为 common.results 中带 __slots__ 的对象，
+    #仍支持 response['result']['voice_text_str'] 式访问，需要 dict 时调用 as_dict()
+    def set_typed_results(self, enable):
+        self.typed_results = enable
+
+    #客户端 VAD：write() 的音频先经 common.vad.EnergyVad 去掉长静音再上传，只支持 voice_format=1(pcm)，
+    #vad 可为 EnergyVad 实例或 True（按引擎采样率使用默认参数），None/False 关闭；
+    #开启后服务端返回的时间戳相对已上传音频，需用 client_vad.stream_time() 换算
+    def set_client_vad(self, vad):
+        if vad is True:
+            vad = EnergyVad(engine_sample_rate(self.engine_model_type))
+        self.client_vad = vad or None
+
+    #write() 等待建连的上限（秒），超时或连接出错时 write() 抛出 RuntimeError
+    def set_open_timeout(self, open_timeout):
+        self.open_timeout = open_timeout
+
+    #设置后由 common.ws_reactor.WebSocketReactor 驱动连接，不再为每个会话单独起线程
+    def set_reactor(self, reactor):
+        self.reactor = reactor
+
+    #建连期间 write() 的音频缓存在内存中（最多 max_bytes），连接建立后按序补发
+    def set_preroll(self, max_bytes, burst=True):
+        if max_bytes > 0:
+            self.preroll = PrerollBuffer(max_bytes, burst)
+        else:
+            self.preroll = None
+
     def format_sign_string(self, param):
         signstr = "asr.cloud.tencent.com/asr/v2/"
         for t in param:
@@ -238,86 +289,128 @@ class SpeechRecognizer:
         query_arr['speaker_diarization'] = self.speaker_diarization
         return query_arr
 
+    def create_request_url(self):
+        query_arr = self.create_query_arr()
+        if self.voice_id == "":
+            query_arr['voice_id'] = str(uuid.uuid1())
+            self.voice_id = query_arr['voice_id']
+        query = sorted(query_arr.items(), key=lambda d: d[0])
+        signstr = self.format_sign_string(query)
+
+        autho = self.sign(signstr, self.credential.secret_key)
+        requrl = self.create_query_string(query)
+        if is_python3():
+            autho = urllib.parse.quote(autho, safe='')
+        else:
+            autho = urllib.quote(autho, safe='')
+        requrl += "&signature=%s" % autho
+        return requrl
+
     def stop(self):
+        if self.preroll is not None:
+            session_state(self).wait_while((STARTED,), self.open_timeout)
         if self.status == OPENED: 
+            if self.client_vad is not None:
+                tail = self.client_vad.flush()
+                if tail:
+                    self.ws.send(tail, websocket.ABNF.OPCODE_BINARY)
             msg = {}
             msg['type'] = "end"
-            text_str = json.dumps(msg)
-            self.ws.sock.send(text_str)
+            text_str = json_codec.dumps(msg)
+            self.ws.send(text_str)
         if self.ws:
-            if self.wst and self.wst.is_alive():
+            if self.reactor is not None:
+                if not self.ws.join(CLOSE_TIMEOUT):
+                    logger.warning("%s wait for close timed out" % self.voice_id)
+            elif self.wst and self.wst.is_alive():
                 self.wst.join()
         self.ws.close()
-        
+        if isinstance(self.listener, ListenerDispatcher):
+            self.listener.join()
+
 
     def write(self, data):
-        while self.status == STARTED:
-            time.sleep(0.1)
+        if self.client_vad is not None:
+            data = self.client_vad.process(data)
+            if not data:
+                return
+        if self.preroll is not None:
+            with self._write_lock:
+                if self.status in (NOTOPEN, STARTED):
+                    self.preroll.push(data)
+                    return
+        else:
+            session_state(self).wait_ready((STARTED,), self.open_timeout)
         if self.status == OPENED: 
-            self.ws.sock.send_binary(data)
+            self.ws.send(data, websocket.ABNF.OPCODE_BINARY)
+        else:
+            session_state(self).raise_error()
+
+    def dispatch_message(self, message):
+        response = results.loads(message, results.ASR) if self.typed_results else json_codec.loads(message)
+        response['voice_id'] = self.voice_id
+        if response['code'] != 0:
+            logger.error("%s server recognition fail %s" %
+                         (response['voice_id'], response['message']))
+            self.listener.on_fail(response)
+            return response
+        if "final" in response and response["final"] == 1:
+            self.status = FINAL
+            self.result = message
+            self.listener.on_recognition_complete(response)
+            logger.info("%s recognition complete" % response['voice_id'])
+            return response
+        if "result" in response.keys():
+            if response["result"]['slice_type'] == 0:
+                self.listener.on_sentence_begin(response)
+                return response
+            elif response["result"]["slice_type"] == 2:
+                self.listener.on_sentence_end(response)
+                return response
+            elif response["result"]["slice_type"] == 1:
+                self.listener.on_recognition_result_change(response)
+                return response
+        return None
 
     def start(self):
         def on_message(ws, message):
-            response = json.loads(message)
-            response['voice_id'] = self.voice_id
-            if response['code'] != 0:
-                logger.error("%s server recognition fail %s" %
-                             (response['voice_id'], response['message']))
-                self.listener.on_fail(response)
-                return
-            if "final" in response and response["final"] == 1:
-                self.status = FINAL
-                self.result = message
-                self.listener.on_recognition_complete(response)
-                logger.info("%s recognition complete" % response['voice_id'])
-                return
-            if "result" in response.keys():
-                if response["result"]['slice_type'] == 0:
-                    self.listener.on_sentence_begin(response)
-                    return
-                elif response["result"]["slice_type"] == 2:
-                    self.listener.on_sentence_end(response)
-                    return
-                elif response["result"]["slice_type"] == 1:
-                    self.listener.on_recognition_result_change(response)
-                    return
+            self.dispatch_message(message)
 
         def on_error(ws, error):
             if self.status == FINAL :
                 return
             logger.error("websocket error %s  voice id %s" %
                          (format(error), self.voice_id))
-            self.status = ERROR
+            session_state(self).set(ERROR, error)
 
-        def on_close(ws):
+        def on_close(ws, *args):
             self.status = CLOSED
             logger.info("websocket closed  voice id %s" %
                           self.voice_id)
 
         def on_open(ws):
-            self.status = OPENED
-
-        query_arr = self.create_query_arr()
-        if self.voice_id == "":
-            query_arr['voice_id'] = str(uuid.uuid1())
-            self.voice_id = query_arr['voice_id']
-        query = sorted(query_arr.items(), key=lambda d: d[0])
-        signstr = self.format_sign_string(query)
-
-        autho = self.sign(signstr, self.credential.secret_key)
-        requrl = self.create_query_string(query)
-        if is_python3():
-            autho = urllib.parse.quote(autho, safe='')
+            with self._write_lock:
+                if self.preroll is not None:
+                    for frame in self.preroll.drain():
+                        ws.send(frame, websocket.ABNF.OPCODE_BINARY)
+                self.status = OPENED
+
+        if self.client_vad is not None:
+            if self.voice_format != 1:
+                raise ValueError("client vad requires pcm audio (voice_format=1)")
+            self.client_vad.reset()
+        requrl = self.create_request_url()
+        session_state(self).reset(STARTED)
+        if self.reactor is not None:
+            self.ws = self.reactor.connect(requrl, on_open=on_open,
+                    on_error=on_error, on_close=on_close, on_message=on_message)
         else:
-            autho = urllib.quote(autho, safe='')
-        requrl += "&signature=%s" % autho
-        self.ws = websocket.WebSocketApp(requrl,  None,
-                on_error=on_error, on_close=on_close, on_message=on_message)
-        self.ws.on_open = on_open
-        self.wst = threading.Thread(target=self.ws.run_forever)
-        self.wst.daemon = True
-        self.wst.start()
-        self.status = STARTED
+            self.ws = websocket.WebSocketApp(requrl,  None,
+                    on_error=on_error, on_close=on_close, on_message=on_message)
+            self.ws.on_open = on_open
+            self.wst = threading.Thread(target=self.ws.run_forever)
+            self.wst.daemon = True
+            self.wst.start()
         response = {}
         response['voice_id'] = self.voice_id
         self.listener.on_recognition_start(response)
@@ -4,12 +4,13 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 import websocket
 import uuid
 import urllib
 from common.log import logger
+from common import json_codec
+from common.state import OPEN_TIMEOUT, SessionStatus, session_state
 
 
 def is_python3():
@@ -74,6 +75,8 @@ CLOSED = 5
 # 实时语音翻译使用
 class SpeechTranslator:
 
+    status = SessionStatus()
+
     def __init__(self, appid, credential, source, target, trans_model, listener):
         self.result = ""
         self.credential = credential
@@ -88,6 +91,7 @@ class SpeechTranslator:
         self.listener = listener
         self.voice_format = 1  # PCM格式
         self.nonce = ""
+        self.open_timeout = OPEN_TIMEOUT
         self._last_sentence_id = ""
 
     def set_voice_format(self, voice_format):
@@ -96,6 +100,10 @@ class SpeechTranslator:
     def set_nonce(self, nonce):
         self.nonce = nonce
 
+    #write() 等待建连的上限（秒），超时或连接出错时 write() 抛出 RuntimeError
+    def set_open_timeout(self, open_timeout):
+        self.open_timeout = open_timeout
+
     def format_sign_string(self, param):
         signstr = "asr.cloud.tencent.com/asr/speech_translate/"
         for t in param:
@@ -163,7 +171,7 @@ class SpeechTranslator:
         if self.status == OPENED: 
             msg = {}
             msg['type'] = 'end'
-            text_str = json.dumps(msg)
+            text_str = json_codec.dumps(msg)
             self.ws.sock.send(text_str)
         if self.ws:
             if self.wst and self.wst.is_alive():
@@ -171,14 +179,15 @@ class SpeechTranslator:
         self.ws.close()
 
     def write(self, data):
-        while self.status == STARTED:
-            time.sleep(0.1)
+        session_state(self).wait_ready((STARTED,), self.open_timeout)
         if self.status == OPENED: 
             self.ws.sock.send_binary(data)
+        else:
+            session_state(self).raise_error()
 
     def start(self):
         def on_message(ws, message):
-            response = json.loads(message)
+            response = json_codec.loads(message)
             response['voice_id'] = self.voice_id
             if response['code'] != 0:
                 logger.error("%s server translate fail %s" %
@@ -210,7 +219,7 @@ class SpeechTranslator:
                 return
             logger.error("websocket error %s  voice id %s" %
                          (format(error), self.voice_id))
-            self.status = ERROR
+            session_state(self).set(ERROR, error)
 
         def on_close(ws):
             self.status = CLOSED
@@ -237,10 +246,10 @@ class SpeechTranslator:
         self.ws = websocket.WebSocketApp(requrl,  None,
                 on_error=on_error, on_close=on_close, on_message=on_message)
         self.ws.on_open = on_open
+        session_state(self).reset(STARTED)
         self.wst = threading.Thread(target=self.ws.run_forever)
         self.wst.daemon = True
         self.wst.start()
-        self.status = STARTED
         response = {}
         response['voice_id'] = self.voice_id
         self.listener.on_translate_start(response)
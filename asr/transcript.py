@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+class TranscriptSentence(object):
+    '''
+    sentence_id  int     v1 为 result.index，v2/说话人识别为 sentence_id
+    text         str
+    final        bool    v1 slice_type=2 或 v2 sentence_type=1
+    speaker_id   int
+    start_time   int     ms
+    end_time     int     ms
+    words        list    服务端原样返回的 word_list
+    raw          dict    最近一次收到的该句原始数据
+    '''
+
+    def __init__(self, sentence_id):
+        self.sentence_id = sentence_id
+        self.text = ""
+        self.final = False
+        self.speaker_id = 0
+        self.start_time = 0
+        self.end_time = 0
+        self.words = []
+        self.raw = None
+
+    def _assign(self, raw, text, final, speaker_id, start_time, end_time, words):
+        changed = (text != self.text or final != self.final or speaker_id != self.speaker_id
+                   or start_time != self.start_time or end_time != self.end_time)
+        self.text = text
+        self.final = final
+        self.speaker_id = speaker_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.words = words
+        self.raw = raw
+        return changed
+
+
+class TranscriptSnapshot(object):
+    '''某一时刻的转写快照；稳定文本按需拼接，创建快照本身是 O(1)。
+    Transcript 只在列表末尾追加稳定文本，修订时换用新列表，快照持有的前缀不会被改动'''
+
+    def __init__(self, stable_parts, stable_count, unstable_text, sep, stable_text=None):
+        self._stable_parts = stable_parts
+        self._stable_count = stable_count
+        self.unstable_text = unstable_text
+        self.sep = sep
+        self._stable_text = stable_text
+
+    @property
+    def stable_text(self):
+        if self._stable_text is None:
+            self._stable_text = self.sep.join(self._stable_parts[:self._stable_count])
+        return self._stable_text
+
+    @property
+    def text(self):
+        if not self.unstable_text:
+            return self.stable_text
+        if not self._stable_count:
+            return self.unstable_text
+        return self.sep.join([self.stable_text, self.unstable_text])
+
+
+def sentence_changes(msg, changed):
+    '''on_sentence_changes 收到的消息：msg 的浅拷贝，其 sentences.sentence_list 只包含 changed 中的句子。
+    只复制 sentences 的其他字段，不读取原来的 sentence_list（类型化结果下不会为整份列表创建对象）'''
+    sentences = msg.get('sentences') or {}
+    diff = dict((key, sentences[key]) for key in sentences.keys() if key != 'sentence_list')
+    diff['sentence_list'] = [s.raw for s in changed]
+    return dict(msg, sentences=diff)
+
+
+class Transcript(object):
+    '''
+    实时识别转写文本的增量拼装，在 listener 回调中调用 update 即可：
+
+        transcript = Transcript()
+        def on_recognition_result_change(self, response):   # v1 各回调 / v2 on_recognition_sentences
+            transcript.update(response)
+        ...
+        transcript.stable_text      # 已最终确定、且之前没有未确定句子的文本
+        transcript.unstable_text    # 其后仍可能变化的尾部
+        transcript.snapshot()       # 供其他线程读取的一致性快照
+
+    每条消息的处理代价只与本条消息中变化的句子数相关（v2 的累积句子列表从尾部扫描，
+    遇到稳定前缀内未变化的句子即停止），不随转写长度增长。
+    服务端修订已确定的句子（文本或说话人变化、不再是最终结果）时稳定文本随之更新，
+    此时重建一次缓存，代价与转写长度成正比。
+    '''
+
+    def __init__(self, sep=""):
+        self.sep = sep
+        self._lock = threading.Lock()
+        self._sentences = {}
+        self._order = []
+        # sentence_id -> 在 _order 中的位置
+        self._position = {}
+        # 稳定前缀：_order[:_stable_count] 均已确定，其文本依次追加在 _stable_parts 中
+        self._stable_count = 0
+        self._stable_parts = []
+        self._speaker_parts = {}
+        # 拼接结果缓存，内容变化时置空
+        self._stable_text = None
+        self._speaker_text = {}
+        # 本条消息中被修订的稳定句子的最小位置
+        self._revised = None
+
+    def update(self, response):
+        '''处理一条 v1 result 或 v2/说话人识别 sentences 消息，返回内容发生变化的 TranscriptSentence 列表'''
+        with self._lock:
+            result = response.get('result')
+            if result is not None and not isinstance(result, str) and 'index' in result:
+                changed = self._update_v1(result)
+            else:
+                sentences = response.get('sentences') or {}
+                changed = self._update_v2(sentences.get('sentence_list') or [])
+            if self._revised is not None:
+                self._revise(self._revised)
+                self._revised = None
+            self._advance()
+            return changed
+
+    def _sentence(self, sentence_id):
+        sentence = self._sentences.get(sentence_id)
+        if sentence is None:
+            sentence = TranscriptSentence(sentence_id)
+            self._sentences[sentence_id] = sentence
+            self._position[sentence_id] = len(self._order)
+            self._order.append(sentence_id)
+        return sentence
+
+    def _changed(self, sentence):
+        position = self._position[sentence.sentence_id]
+        if position < self._stable_count and (self._revised is None or position < self._revised):
+            self._revised = position
+
+    def _update_v1(self, result):
+        sentence = self._sentence(result['index'])
+        changed = sentence._assign(
+            result, result.get('voice_text_str', ""), result.get('slice_type', 0) == 2,
+            result.get('speaker_id', 0), result.get('start_time', 0), result.get('end_time', 0),
+            result.get('word_list') or [])
+        if not changed:
+            return []
+        self._changed(sentence)
+        return [sentence]
+
+    def _update_v2(self, sentence_list):
+        # 从尾部找到第一个位于稳定前缀内且未变化的句子，只按顺序处理其后的部分
+        start = len(sentence_list)
+        while start > 0:
+            s = sentence_list[start - 1]
+            sentence_id = s.get('sentence_id', 0)
+            known = self._sentences.get(sentence_id)
+            if known is not None and self._position[sentence_id] < self._stable_count \
+                    and s.get('sentence_type', 0) == 1 \
+                    and known.text == s.get('sentence', "") and known.speaker_id == s.get('speaker_id', 0) \
+                    and known.start_time == s.get('start_time', 0) and known.end_time == s.get('end_time', 0):
+                break
+            start -= 1
+        changed = []
+        for s in sentence_list[start:]:
+            sentence = self._sentence(s.get('sentence_id', 0))
+            if sentence._assign(s, s.get('sentence', ""), s.get('sentence_type', 0) == 1,
+                                s.get('speaker_id', 0), s.get('start_time', 0), s.get('end_time', 0),
+                                s.get('word_list') or s.get('words') or []):
+                self._changed(sentence)
+                changed.append(sentence)
+        return changed
+
+    def _revise(self, position):
+        # 修订的句子不再是最终结果时稳定前缀退回到它之前；换用新列表，已创建的快照不受影响
+        if not self._sentences[self._order[position]].final:
+            self._stable_count = position
+        stable = [self._sentences[i] for i in self._order[:self._stable_count]]
+        self._stable_parts = [sentence.text for sentence in stable]
+        self._speaker_parts = {}
+        for sentence in stable:
+            self._speaker_parts.setdefault(sentence.speaker_id, []).append(sentence.text)
+        self._stable_text = None
+        self._speaker_text = {}
+
+    def _advance(self):
+        while self._stable_count < len(self._order):
+            sentence = self._sentences[self._order[self._stable_count]]
+            if not sentence.final:
+                break
+            self._stable_parts.append(sentence.text)
+            self._speaker_parts.setdefault(sentence.speaker_id, []).append(sentence.text)
+            self._stable_text = None
+            self._speaker_text.pop(sentence.speaker_id, None)
+            self._stable_count += 1
+
+    @property
+    def stable_text(self):
+        with self._lock:
+            if self._stable_text is None:
+                self._stable_text = self.sep.join(self._stable_parts)
+            return self._stable_text
+
+    @property
+    def unstable_text(self):
+        with self._lock:
+            return self._unstable_text()
+
+    def _unstable_text(self):
+        return self.sep.join(self._sentences[i].text for i in self._order[self._stable_count:])
+
+    @property
+    def text(self):
+        return self.snapshot().text
+
+    def sentences(self):
+        with self._lock:
+            return [self._sentences[i] for i in self._order]
+
+    def speakers(self):
+        with self._lock:
+            return list(self._speaker_parts)
+
+    def speaker_text(self, speaker_id):
+        '''某个说话人已确定的文本'''
+        with self._lock:
+            text = self._speaker_text.get(speaker_id)
+            if text is None:
+                text = self.sep.join(self._speaker_parts.get(speaker_id, []))
+                self._speaker_text[speaker_id] = text
+            return text
+
+    def words(self, stable_only=True):
+        '''按顺序返回各句的 (sentence_id, word)，stable_only 时只包含稳定前缀'''
+        with self._lock:
+            order = self._order[:self._stable_count] if stable_only else list(self._order)
+            return [(i, w) for i in order for w in self._sentences[i].words]
+
+    def snapshot(self):
+        with self._lock:
+            return TranscriptSnapshot(self._stable_parts, self._stable_count,
+                                      self._unstable_text(), self.sep, self._stable_text)
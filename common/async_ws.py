@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+from urllib.parse import urlparse
+
+import websocket
+from websocket import ABNF
+
+from common.ws_frame import FrameDecoder
+
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_RECV_SIZE = 65536
+
+
+# ---------------------------------------------------------------------------
+# AsyncWebSocket  –  基于 asyncio streams 的最小 websocket 客户端
+# DNS/TCP/TLS/握手与收发均不阻塞事件循环；帧编码复用 websocket-client 的 ABNF。
+# ---------------------------------------------------------------------------
+class AsyncWebSocket(object):
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._decoder = FrameDecoder()
+        self._frames = []
+        self._closed = False
+        self._write_lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, url, header=None, timeout=None, ssl_context=None):
+        parsed = urlparse(url)
+        is_secure = parsed.scheme == "wss"
+        host = parsed.hostname
+        port = parsed.port or (443 if is_secure else 80)
+        resource = parsed.path or "/"
+        if parsed.query:
+            resource += "?" + parsed.query
+        if is_secure and ssl_context is None:
+            ssl_context = ssl.create_default_context()
+
+        open_conn = asyncio.open_connection(
+            host, port, ssl=ssl_context if is_secure else None,
+            server_hostname=host if is_secure else None)
+        reader, writer = await asyncio.wait_for(open_conn, timeout)
+
+        key = base64.b64encode(os.urandom(16)).decode('utf-8')
+        host_header = host if parsed.port is None else "%s:%d" % (host, port)
+        lines = [
+            "GET %s HTTP/1.1" % resource,
+            "Host: %s" % host_header,
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            "Sec-WebSocket-Key: %s" % key,
+            "Sec-WebSocket-Version: 13",
+        ]
+        for h in header or []:
+            lines.append(h)
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('utf-8'))
+        try:
+            await asyncio.wait_for(cls._handshake(reader, writer, key), timeout)
+        except Exception:
+            writer.close()
+            raise
+        return cls(reader, writer)
+
+    @staticmethod
+    async def _handshake(reader, writer, key):
+        await writer.drain()
+        status_line = (await reader.readline()).decode('utf-8', 'replace')
+        status = status_line.split(" ", 2)
+        if len(status) < 2 or status[1] != "101":
+            raise websocket.WebSocketException(
+                "Handshake status %s" % status_line.strip())
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode('utf-8', 'replace').partition(":")
+            headers[k.strip().lower()] = v.strip()
+        expected = base64.b64encode(
+            hashlib.sha1((key + _GUID).encode('utf-8')).digest()).decode('utf-8')
+        if headers.get("sec-websocket-accept") != expected:
+            raise websocket.WebSocketException("Invalid WebSocket Header")
+
+    async def send(self, data, opcode=ABNF.OPCODE_TEXT):
+        if self._closed:
+            raise websocket.WebSocketConnectionClosedException(
+                "socket is already closed.")
+        frame = ABNF.create_frame(data, opcode).format()
+        async with self._write_lock:
+            self._writer.write(frame)
+            await self._writer.drain()
+
+    async def send_binary(self, data):
+        await self.send(data, ABNF.OPCODE_BINARY)
+
+    async def recv(self):
+        """返回 (opcode, payload)；连接关闭时返回 (OPCODE_CLOSE, b"")"""
+        while True:
+            while self._frames:
+                opcode, payload, _ = self._frames.pop(0)
+                if opcode == ABNF.OPCODE_TEXT:
+                    return opcode, payload.decode('utf-8')
+                if opcode == ABNF.OPCODE_BINARY:
+                    return opcode, payload
+                if opcode == ABNF.OPCODE_PING:
+                    await self.send(payload, ABNF.OPCODE_PONG)
+                elif opcode == ABNF.OPCODE_CLOSE:
+                    await self.close(payload[:2])
+                    return ABNF.OPCODE_CLOSE, payload
+            if self._closed:
+                return ABNF.OPCODE_CLOSE, b""
+            data = await self._reader.read(_RECV_SIZE)
+            if not data:
+                self._closed = True
+                raise websocket.WebSocketConnectionClosedException(
+                    "Connection to remote host was lost.")
+            self._frames.extend(self._decoder.feed(data))
+
+    async def close(self, status=struct.pack("!H", 1000)):
+        if self._closed:
+            return
+        try:
+            await self.send(status, ABNF.OPCODE_CLOSE)
+        except Exception:
+            pass
+        self._closed = True
+        self._writer.close()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ---------------------------------------------------------------------------
+# 识别前的音频预处理（需要 numpy）：多声道下混/拆分、int16 与 float32 互转、多相滤波重采样。
+# 可放在任意识别器 write() 之前，也可一次处理整段音频后再交给录音文件识别：
+#
+#   pre = AudioPreprocessor(48000, channels=2, dst_rate=engine_sample_rate("16k_zh"))
+#   recognizer.write(pre.process(chunk))    # 44.1k/48k 立体声 -> 16k 单声道 int16
+#   ...
+#   recognizer.write(pre.flush())           # 取出滤波器中剩余的尾部
+#
+# 输入输出均为交错排列的小端 PCM；int16 为 bytes-like，float32 取值范围 [-1, 1)。
+# ---------------------------------------------------------------------------
+INT16 = "int16"
+FLOAT32 = "float32"
+
+# 多声道处理方式：平均下混为单声道 / 只取第一个声道 / 各声道分别输出
+MIX_MEAN = "mean"
+MIX_FIRST = "first"
+MIX_SPLIT = "split"
+
+
+def engine_sample_rate(engine_model_type):
+    '''8k_ 开头的引擎为 8000，其余为 16000'''
+    return 8000 if engine_model_type.startswith("8k") else 16000
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("common.audio requires numpy")
+
+
+def to_float32(data, sample_format=INT16):
+    '''bytes-like 或数组转为 float32 数组'''
+    _require_numpy()
+    if sample_format == FLOAT32:
+        return np.frombuffer(data, dtype='<f4') if not isinstance(data, np.ndarray) else data.astype(np.float32)
+    samples = np.frombuffer(data, dtype='<i2') if not isinstance(data, np.ndarray) else data
+    return samples.astype(np.float32) * (1.0 / 32768)
+
+
+def to_int16(samples):
+    '''float32 数组转为 int16 小端 bytes，超出范围的采样截断'''
+    _require_numpy()
+    scaled = np.rint(np.asarray(samples, dtype=np.float32) * 32768)
+    return np.clip(scaled, -32768, 32767).astype('<i2').tobytes()
+
+
+def downmix(samples, channels):
+    '''交错排列的多声道采样平均为单声道'''
+    _require_numpy()
+    if channels == 1:
+        return samples
+    frames = samples[:len(samples) // channels * channels].reshape(-1, channels)
+    return frames.mean(axis=1, dtype=np.float32)
+
+
+def split_channels(samples, channels):
+    '''交错排列的多声道采样拆分为各声道数组（视图，不复制）'''
+    _require_numpy()
+    frames = samples[:len(samples) // channels * channels].reshape(-1, channels)
+    return [frames[:, c] for c in range(channels)]
+
+
+def _design_filter(up, down, taps_per_phase, delay, beta):
+    # 在 up 倍上采样率下设计 Kaiser 窗 sinc 低通，截止频率为输入/输出中较低的奈奎斯特频率；
+    # 以整数 delay 为中心，保证输出与输入严格对齐
+    cutoff = 0.5 / max(up, down) * 0.95
+    length = taps_per_phase * up
+    t = np.arange(length) - delay
+    h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(length, beta) * up
+    # bank[p, k] = h[p + k * up]：第 p 相位的 taps_per_phase 个系数，k 越大对应越早的输入
+    return h.reshape(taps_per_phase, up).T.astype(np.float32)
+
+
+class Resampler(object):
+    '''
+    有理数倍多相 FIR 重采样（src_rate * up / down），流式处理，跨块保留滤波器状态。
+    输入为 float32 数组，形状 (n,) 或 (n, channels)。taps 为低通滤波器按两者中较低采样率计的长度，
+    越大阻带衰减越高、开销越大；降采样时每个输出采样使用 taps * down / up 个输入采样。
+    流式输出有约半个滤波器长度的延迟，flush() 补齐尾部，全部输出长度为 ceil(输入长度 * dst_rate / src_rate)。
+    '''
+
+    def __init__(self, src_rate, dst_rate, taps=32, beta=8.0):
+        _require_numpy()
+        g = math.gcd(src_rate, dst_rate)
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        # 每个相位的系数个数
+        self.taps = int(math.ceil(taps * max(1.0, float(self.down) / self.up)))
+        self.delay = (self.taps * self.up) // 2
+        self.bank = None
+        if self.up != self.down:
+            self.bank = _design_filter(self.up, self.down, self.taps, self.delay, beta)
+        self.reset()
+
+    def reset(self):
+        self._history = None
+        self._consumed = 0
+        self._produced = 0
+
+    def process(self, samples):
+        if self.bank is None:
+            return samples
+        samples = np.asarray(samples, dtype=np.float32)
+        if self._history is None:
+            # 首块前补零，使输出与输入对齐（抵消滤波器群延迟）
+            pad = (self.taps - 1,) + samples.shape[1:]
+            self._history = np.zeros(pad, dtype=np.float32)
+        buf = np.concatenate([self._history, samples])
+        total = self._consumed + len(samples)
+        out = self._run(buf, total)
+        self._history = buf[len(buf) - (self.taps - 1):]
+        self._consumed = total
+        return out
+
+    def flush(self):
+        '''输入结束：补零推出滤波器中的剩余输出'''
+        if self.bank is None or self._history is None:
+            return np.zeros(0, dtype=np.float32)
+        expected = -(-self._consumed * self.up // self.down)
+        zeros = np.zeros((self.taps,) + self._history.shape[1:], dtype=np.float32)
+        out = self.process(zeros)
+        out = out[:max(0, expected - (self._produced - len(out)))]
+        self.reset()
+        return out
+
+    def _run(self, buf, total):
+        # 输出 n 对应上采样时间轴位置 n*down + delay，需要的最新输入为 (n*down + delay) // up
+        up, down = self.up, self.down
+        last = (total * up - 1 - self.delay) // down if total * up > self.delay else -1
+        n = np.arange(self._produced, last + 1, dtype=np.int64)
+        if len(n) == 0:
+            return np.zeros((0,) + buf.shape[1:], dtype=np.float32)
+        pos = n * down + self.delay
+        newest = pos // up
+        phase = pos % up
+        # buf[0] 对应绝对输入下标 total - len(buf)
+        start = newest - (total - len(buf)) - (self.taps - 1)
+        index = start[:, None] + np.arange(self.taps - 1, -1, -1)
+        windows = buf[index]
+        coeffs = self.bank[phase]
+        self._produced = last + 1
+        if buf.ndim == 1:
+            return np.einsum('nk,nk->n', windows, coeffs)
+        return np.einsum('nkc,nk->nc', windows, coeffs)
+
+
+class AudioPreprocessor(object):
+    '''
+    下混/拆分 + 重采样 + 转 int16 的流水线，输出可直接传给识别器 write()。
+    mix=MIX_SPLIT 时 process/flush 返回各声道 bytes 组成的列表，其余返回单声道 bytes。
+    '''
+
+    def __init__(self, src_rate, channels=1, dst_rate=16000, sample_format=INT16,
+                 mix=MIX_MEAN, taps=32):
+        if mix not in (MIX_MEAN, MIX_FIRST, MIX_SPLIT):
+            raise ValueError("unknown mix mode %r" % mix)
+        self.src_rate = src_rate
+        self.channels = channels
+        self.dst_rate = dst_rate
+        self.sample_format = sample_format
+        self.mix = mix
+        self.resampler = Resampler(src_rate, dst_rate, taps)
+        self._block = channels * (2 if sample_format == INT16 else 4)
+        self._pending = b""
+
+    def process(self, data):
+        data = bytes(data) if not self._pending else self._pending + bytes(data)
+        usable = len(data) // self._block * self._block
+        self._pending = data[usable:]
+        samples = to_float32(data[:usable], self.sample_format)
+        if self.channels > 1:
+            frames = samples.reshape(-1, self.channels)
+            if self.mix == MIX_MEAN:
+                samples = frames.mean(axis=1, dtype=np.float32)
+            elif self.mix == MIX_FIRST:
+                samples = frames[:, 0]
+            else:
+                samples = frames
+        return self._output(self.resampler.process(samples))
+
+    def flush(self):
+        self._pending = b""
+        return self._output(self.resampler.flush())
+
+    def _output(self, samples):
+        if self.mix == MIX_SPLIT and self.channels > 1:
+            if samples.ndim == 1:
+                return [b"" for _ in range(self.channels)]
+            return [to_int16(samples[:, c]) for c in range(self.channels)]
+        return to_int16(samples)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import collections
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+
+from common.log import logger
+
+
+# ---------------------------------------------------------------------------
+# 结果缓存：key 为 str（一般是 sha256 hex），value 为 bytes（DiskCache 映射读取时为 memoryview）。
+#
+#   cache = TieredCache(MemoryCache(64 << 20), DiskCache("/var/cache/asr", 1 << 30))
+#   recognizer.set_cache(cache)
+#
+# 各层都按最近最少使用淘汰，线程安全；低层命中后回填到上层。
+# ---------------------------------------------------------------------------
+class MemoryCache(object):
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class DiskCache(object):
+    """
+    每个 key 一个文件，总大小超过 max_bytes 时按最近访问时间淘汰。
+    多个进程可以共享同一目录：写入先落临时文件再原子替换，文件被其他进程淘汰时视为未命中。
+    use_mmap=True 时 get 返回映射文件的只读 memoryview，大文件不必整体读入内存，
+    多个进程命中同一条目时共享页缓存。
+    """
+
+    def __init__(self, directory, max_bytes, use_mmap=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.use_mmap = use_mmap
+        self._lock = threading.Lock()
+        self._index = collections.OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            if name.startswith("."):
+                continue
+            try:
+                st = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = self._read(f)
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self._size -= size
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            else:
+                self._index[key] = len(value)
+                self._size += len(value)
+        return value
+
+    def _read(self, f):
+        if self.use_mmap:
+            try:
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            except ValueError:
+                # 空文件无法映射
+                pass
+        return f.read()
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning("disk cache write failed: {}".format(e))
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self._size -= old
+            self._index[key] = len(value)
+            self._size += len(value)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._index:
+            name, size = self._index.popitem(last=False)
+            self._size -= size
+            try:
+                os.unlink(self._path(name))
+            except OSError:
+                pass
+
+
+class TieredCache(object):
+    """按顺序查询各层缓存，命中后回填到更靠前的层；put 写入所有层"""
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                if self.tiers[:i]:
+                    # 回填时复制一份，避免上层长期持有映射文件
+                    copied = bytes(value)
+                    for upper in self.tiers[:i]:
+                        upper.put(key, copied)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        for tier in self.tiers:
+            tier.put(key, value)
+
+
+def hash_key(*parts):
+    """把若干 bytes-like/str 拼成缓存 key，各段带长度前缀避免拼接歧义"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common.log import logger
+
+
+# ---------------------------------------------------------------------------
+# listener 回调异步派发：回调不再在 websocket 接收线程上执行，
+# 慢消费者（写库、调用下游 HTTP）不会阻塞收帧导致服务端超时断开。
+#
+#   listener = ListenerDispatcher(MyListener(), max_queue=256, policy=COALESCE)
+#   recognizer = SpeechRecognizer(APPID, credential, ENGINE_MODEL_TYPE, listener)
+#   ...
+#   recognizer.stop()
+#   listener.join()           # 等待已排队的回调执行完
+#
+# 适用于 asr/tts/tts_podcast/vc/soe 所有客户端：它们只通过 listener.on_xxx() 回调。
+# 同一个 ListenerDispatcher 的回调按顺序串行执行，不同会话共享 DispatchPool 的工作线程。
+# ---------------------------------------------------------------------------
+
+# 队列满时：阻塞接收线程等待
+BLOCK = "block"
+# 队列满时：丢弃最早的一条中间结果，没有中间结果可丢时阻塞
+DROP_OLDEST = "drop_oldest"
+# 新的中间结果到达时替换队列中尚未执行、已被它完全覆盖的同一句中间结果，队列满时同 DROP_OLDEST
+COALESCE = "coalesce"
+
+# 会被后续回调覆盖的中间结果回调；句末、结束、失败与音频回调从不丢弃
+INTERMEDIATE_CALLBACKS = frozenset([
+    "on_recognition_result_change",
+    "on_recognition_sentences",
+    "on_intermediate_result",
+    "on_translate_result_change",
+])
+
+
+def is_intermediate(name, args):
+    '''默认的可丢弃判断：实时识别 v2/说话人识别的句子列表中含最终句(sentence_type=1)时不可丢弃'''
+    if name not in INTERMEDIATE_CALLBACKS:
+        return False
+    if name == "on_recognition_sentences" and args and isinstance(args[0], dict):
+        sentences = args[0].get("sentences") or {}
+        for sentence in sentences.get("sentence_list") or []:
+            if sentence.get("sentence_type", 0) == 1:
+                return False
+    return True
+
+
+def result_key(name, args):
+    '''
+    中间结果的替换依据 (句子集合, 最终句集合)：实时识别 v1 为 result.index，
+    v2/说话人识别为 sentence_list 中的 sentence_id（sentence_type=1 的计入最终句），其余回调为空集合。
+    不可替换的回调返回 None。
+    '''
+    if name not in INTERMEDIATE_CALLBACKS:
+        return None
+    response = args[0] if args and isinstance(args[0], dict) else {}
+    result = response.get("result")
+    if result is not None and not isinstance(result, str) and "index" in result:
+        return frozenset([result["index"]]), frozenset()
+    sentences = response.get("sentences")
+    if sentences is not None and hasattr(sentences, "get"):
+        sentence_list = sentences.get("sentence_list") or []
+        return (frozenset(s.get("sentence_id", 0) for s in sentence_list),
+                frozenset(s.get("sentence_id", 0) for s in sentence_list if s.get("sentence_type", 0) == 1))
+    return frozenset(), frozenset()
+
+
+def supersedes(new_key, old_key):
+    '''新结果覆盖了旧结果的全部句子与最终句时，旧结果不再有用'''
+    return old_key[0] <= new_key[0] and old_key[1] <= new_key[1]
+
+
+class DispatchPool(object):
+    '''执行回调的工作线程池，可被多个 ListenerDispatcher 共享'''
+
+    def __init__(self, workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, fn):
+        self._executor.submit(fn)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = DispatchPool()
+        return _default_pool
+
+
+class ListenerDispatcher(object):
+    '''
+    包装任意 listener，on_xxx 调用只入队即返回，由 DispatchPool 的工作线程按顺序执行。
+    统计：depth 当前队列长度，max_depth 历史最大长度，dispatched 已执行数，
+    dropped 因队列满丢弃的中间结果数，coalesced 被新结果替换的中间结果数。
+    每次占用工作线程最多执行 batch 个回调，之后重新排队，避免繁忙会话长期占满共享线程池。
+    '''
+
+    def __init__(self, listener, max_queue=256, policy=BLOCK, pool=None,
+                 droppable=is_intermediate, coalesce_key=result_key, batch=16):
+        if policy not in (BLOCK, DROP_OLDEST, COALESCE):
+            raise ValueError("unknown dispatch policy %r" % policy)
+        self.listener = listener
+        self.max_queue = max_queue
+        self.policy = policy
+        self.pool = pool if pool is not None else default_pool()
+        self.droppable = droppable
+        self.coalesce_key = coalesce_key
+        self.batch = batch
+        self.max_depth = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._scheduled = False
+        self._running = False
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def __getattr__(self, name):
+        attr = getattr(self.listener, name)
+        if not name.startswith("on_") or not callable(attr):
+            return attr
+
+        def enqueue(*args):
+            self._put(name, args)
+        return enqueue
+
+    def join(self, timeout=None):
+        '''等待已入队的回调全部执行完，超时返回 False'''
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._running, timeout)
+
+    def _put(self, name, args):
+        droppable = self.policy != BLOCK and self.droppable(name, args)
+        key = self.coalesce_key(name, args) if self.policy == COALESCE else None
+        with self._cond:
+            if key is not None:
+                before = len(self._queue)
+                self._queue = collections.deque(
+                    item for item in self._queue
+                    if not (item[0] == name and item[3] is not None and supersedes(key, item[3])))
+                self.coalesced += before - len(self._queue)
+            while len(self._queue) >= self.max_queue:
+                if self.policy != BLOCK and self._drop_oldest():
+                    continue
+                self._cond.wait()
+            self._queue.append((name, args, droppable, key))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            if not self._scheduled:
+                self._scheduled = True
+                self.pool.submit(self._drain)
+
+    def _drop_oldest(self):
+        for i, item in enumerate(self._queue):
+            if item[2]:
+                del self._queue[i]
+                if self.dropped == 0:
+                    logger.warning("listener dispatch queue full, dropping intermediate results")
+                self.dropped += 1
+                return True
+        return False
+
+    def _drain(self):
+        for _ in range(self.batch):
+            with self._cond:
+                if not self._queue:
+                    self._scheduled = False
+                    self._running = False
+                    self._cond.notify_all()
+                    return
+                name, args = self._queue.popleft()[:2]
+                self._running = True
+                self._cond.notify_all()
+            try:
+                getattr(self.listener, name)(*args)
+            except Exception:
+                logger.exception("listener {} raised".format(name))
+            self.dispatched += 1
+        # 本轮配额用完：让出工作线程，排到其他会话之后继续
+        with self._cond:
+            self._running = False
+            if not self._queue:
+                self._scheduled = False
+                self._cond.notify_all()
+                return
+        self.pool.submit(self._drain)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import array
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ---------------------------------------------------------------------------
+# G.711 μ-law / A-law 与 16bit 小端 PCM 互转，查表实现，有 numpy 时整块向量化。
+# 采样率不变（电话音频为 8kHz），解码结果可直接写入 8k_ 引擎的识别器，
+# 编码器可把 sample_rate=8000、codec=pcm 的合成音频转回中继所需的 G.711：
+#
+#   decoder = G711Decoder(MULAW)
+#   recognizer.write(decoder.process(rtp_payload))
+#
+#   encoder = G711Encoder(ALAW)
+#   def on_audio_result(self, audio_bytes):
+#       trunk.send(encoder.process(audio_bytes))
+# ---------------------------------------------------------------------------
+MULAW = "mulaw"
+ALAW = "alaw"
+
+_MULAW_BIAS = 0x84
+# 14bit 幅度上限
+_MULAW_CLIP = 8159
+_MULAW_SEG_END = (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF)
+_ALAW_SEG_END = (0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF)
+
+
+def _mulaw_to_linear(u):
+    u = ~u & 0xFF
+    exponent = (u >> 4) & 0x07
+    sample = ((((u & 0x0F) << 3) + _MULAW_BIAS) << exponent) - _MULAW_BIAS
+    return -sample if u & 0x80 else sample
+
+
+def _alaw_to_linear(a):
+    a ^= 0x55
+    t = (a & 0x0F) << 4
+    seg = (a & 0x70) >> 4
+    if seg == 0:
+        t += 8
+    elif seg == 1:
+        t += 0x108
+    else:
+        t = (t + 0x108) << (seg - 1)
+    return t if a & 0x80 else -t
+
+
+def _linear_to_mulaw(sample):
+    sample >>= 2
+    if sample < 0:
+        sample = -sample
+        mask = 0x7F
+    else:
+        mask = 0xFF
+    sample = min(sample, _MULAW_CLIP) + (_MULAW_BIAS >> 2)
+    seg = 0
+    while seg < 8 and sample > _MULAW_SEG_END[seg]:
+        seg += 1
+    if seg >= 8:
+        return 0x7F ^ mask
+    return ((seg << 4) | ((sample >> (seg + 1)) & 0x0F)) ^ mask
+
+
+def _linear_to_alaw(sample):
+    sample >>= 3
+    if sample >= 0:
+        mask = 0xD5
+    else:
+        mask = 0x55
+        sample = -sample - 1
+    seg = 0
+    while seg < 8 and sample > _ALAW_SEG_END[seg]:
+        seg += 1
+    if seg >= 8:
+        return 0x7F ^ mask
+    aval = seg << 4
+    aval |= (sample >> 1) & 0x0F if seg < 2 else (sample >> seg) & 0x0F
+    return aval ^ mask
+
+
+_DECODE = {MULAW: _mulaw_to_linear, ALAW: _alaw_to_linear}
+_ENCODE = {MULAW: _linear_to_mulaw, ALAW: _linear_to_alaw}
+_tables = {}
+
+
+def _tables_for(law):
+    '''(256 项解码表, 65536 项编码表，以 int16 的无符号表示为下标)，首次使用时生成'''
+    tables = _tables.get(law)
+    if tables is None:
+        if law not in _DECODE:
+            raise ValueError("unknown G.711 law %r" % law)
+        decode = array.array('h', [_DECODE[law](i) for i in range(256)])
+        encode = bytearray(_ENCODE[law](i - 65536 if i >= 32768 else i) for i in range(65536))
+        if np is not None:
+            tables = (np.frombuffer(decode.tobytes(), dtype=np.int16).astype('<i2'),
+                      np.frombuffer(bytes(encode), dtype=np.uint8))
+        else:
+            if sys.byteorder == 'big':
+                decode.byteswap()
+            raw = decode.tobytes()
+            tables = ([raw[i * 2:i * 2 + 2] for i in range(256)], bytes(encode))
+        _tables[law] = tables
+    return tables
+
+
+def decode(data, law=MULAW):
+    '''G.711 字节 -> 16bit 小端 PCM bytes（长度翻倍）'''
+    table = _tables_for(law)[0]
+    if np is not None:
+        return table[np.frombuffer(data, dtype=np.uint8)].tobytes()
+    return b"".join([table[b] for b in bytearray(data)])
+
+
+def encode(pcm, law=MULAW):
+    '''16bit 小端 PCM -> G.711 字节，pcm 长度须为偶数'''
+    table = _tables_for(law)[1]
+    if np is not None:
+        return table[np.frombuffer(pcm, dtype='<u2')].tobytes()
+    samples = array.array('H', bytes(pcm))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return bytes(bytearray(table[s] for s in samples))
+
+
+class G711Decoder(object):
+    '''流式解码：每个 G.711 字节对应一个采样，无需跨块状态'''
+
+    def __init__(self, law=MULAW):
+        _tables_for(law)
+        self.law = law
+
+    def process(self, data):
+        return decode(data, self.law)
+
+    def flush(self):
+        return b""
+
+
+class G711Encoder(object):
+    '''流式编码：不足一个采样的奇数字节留到下一块'''
+
+    def __init__(self, law=MULAW):
+        _tables_for(law)
+        self.law = law
+        self._pending = b""
+
+    def process(self, pcm):
+        if self._pending:
+            pcm = self._pending + bytes(pcm)
+        usable = len(pcm) & ~1
+        self._pending = bytes(pcm[usable:])
+        return encode(pcm[:usable], self.law) if usable else b""
+
+    def flush(self):
+        self._pending = b""
+        return b""
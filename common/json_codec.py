@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# ---------------------------------------------------------------------------
+# 各客户端收发消息统一使用的 JSON 编解码：默认优先 orjson，其次 ujson，都未安装时使用标准库 json。
+#
+#   from common import json_codec
+#   json_codec.set_json_codec("json")     # 强制使用标准库，"auto" 恢复自动选择
+#   json_codec.codec_name()               # 当前使用的实现
+#
+# loads 接受 str/bytes；dumps 返回 str，dumpb 返回 utf-8 bytes。
+# 标准库之外的实现输出不转义非 ASCII 字符、不含多余空格，语义与标准库一致。
+# 带 as_dict() 的对象（common.results 的 TypedResult）按 as_dict() 的结果编码。
+# ---------------------------------------------------------------------------
+ORJSON = "orjson"
+UJSON = "ujson"
+STDLIB = "json"
+AUTO = "auto"
+
+
+def _default(obj):
+    as_dict = getattr(obj, "as_dict", None)
+    if as_dict is None:
+        raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+    return as_dict()
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, default=_default)
+
+
+def _stdlib_dumpb(obj):
+    return _stdlib_dumps(obj).encode("utf-8")
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=_default).decode("utf-8")
+
+
+def _orjson_dumpb(obj):
+    return orjson.dumps(obj, default=_default)
+
+
+def _ujson_dumps(obj):
+    try:
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+    except TypeError:
+        # 含 TypedResult 等 ujson 不支持的对象
+        return _stdlib_dumps(obj)
+
+
+def _ujson_dumpb(obj):
+    return _ujson_dumps(obj).encode("utf-8")
+
+
+def _available():
+    codecs = {STDLIB: (json.loads, _stdlib_dumps, _stdlib_dumpb)}
+    if ujson is not None:
+        codecs[UJSON] = (ujson.loads, _ujson_dumps, _ujson_dumpb)
+    if orjson is not None:
+        codecs[ORJSON] = (orjson.loads, _orjson_dumps, _orjson_dumpb)
+    return codecs
+
+
+_CODECS = _available()
+_name = None
+_loads = None
+_dumps = None
+_dumpb = None
+
+
+def set_json_codec(name=AUTO):
+    '''选择 JSON 实现：orjson/ujson/json，auto 为已安装中最快的一个；未安装时抛出 ValueError'''
+    global _name, _loads, _dumps, _dumpb
+    if name == AUTO:
+        name = ORJSON if ORJSON in _CODECS else UJSON if UJSON in _CODECS else STDLIB
+    if name not in _CODECS:
+        raise ValueError("json codec %r not available, installed: %s" % (name, sorted(_CODECS)))
+    _loads, _dumps, _dumpb = _CODECS[name]
+    _name = name
+
+
+def codec_name():
+    return _name
+
+
+def loads(s):
+    return _loads(s)
+
+
+def dumps(obj):
+    return _dumps(obj)
+
+
+def dumpb(obj):
+    return _dumpb(obj)
+
+
+set_json_codec(AUTO)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import collections
+
+from common.log import logger
+
+
+# ---------------------------------------------------------------------------
+# 预缓冲：连接建立期间 write() 的音频先暂存，握手完成后按写入顺序补发，
+# 使建连耗时与采集重叠，而不是丢弃或阻塞采集线程。
+# 超过 max_bytes 时丢弃最早的数据并计入 dropped_bytes。
+# ---------------------------------------------------------------------------
+class PrerollBuffer(object):
+
+    def __init__(self, max_bytes, burst=True, burst_frame_bytes=32000):
+        self.max_bytes = max_bytes
+        # burst=True 时补发前把小块合并成不超过 burst_frame_bytes 的大帧，减少帧数
+        self.burst = burst
+        self.burst_frame_bytes = burst_frame_bytes
+        self.dropped_bytes = 0
+        self._chunks = collections.deque()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._size += len(data)
+        dropped = 0
+        while self._size > self.max_bytes and self._chunks:
+            old = self._chunks.popleft()
+            self._size -= len(old)
+            dropped += len(old)
+        if dropped:
+            if self.dropped_bytes == 0:
+                logger.warning("preroll buffer full, max_bytes={}".format(self.max_bytes))
+            self.dropped_bytes += dropped
+
+    def drain(self):
+        """按写入顺序取出全部缓冲音频"""
+        chunks = list(self._chunks)
+        self.clear()
+        if not self.burst:
+            return chunks
+        frames = []
+        cur = bytearray()
+        for chunk in chunks:
+            if cur and len(cur) + len(chunk) > self.burst_frame_bytes:
+                frames.append(bytes(cur))
+                cur = bytearray()
+            cur += chunk
+        if cur:
+            frames.append(bytes(cur))
+        return frames
+
+    def clear(self):
+        self._chunks.clear()
+        self._size = 0
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+from common import json_codec
+
+
+# ---------------------------------------------------------------------------
+# 紧凑的类型化结果对象：数量最多的嵌套结构（识别结果、句子、词、字幕、口语评测词得分）
+# 使用带 __slots__ 的类，按需生成，word_info 等场景只在真正读取词列表时才创建词对象。
+#
+#   response = results.loads(message, results.ASR)
+#   response['result'].voice_text_str           # 属性访问
+#   response['result']['voice_text_str']        # 仍兼容原来的 dict 下标访问
+#   response['result'].as_dict()                # 需要 dict（如再次 json.dumps）时按需生成
+#
+# 消息由 common.json_codec 解码，最外层仍是 dict；schema 按字段名指定其中哪些对象包装为哪个类
+# （各客户端的结构不同，如识别与合成的 result），包装只拷贝该对象的几个字段。
+# word_list / sentence_list / subtitles / Words 等列表字段先保留原始 list，首次读取时才逐项转换并缓存。
+# 协议中出现的未知字段保存在 extra 中，不会丢失；消息中没有的字段属性值为 MISSING（布尔值为假），
+# 值为 null 的字段与 dict 一样是存在的 None。
+# ---------------------------------------------------------------------------
+class _Missing(object):
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class _LazyList(object):
+    '''列表字段的描述符：槽位保存原始 list，首次读取时把其中的 dict 转换为 cls 并写回槽位'''
+
+    def __init__(self, slot, cls):
+        self.slot = slot
+        self.cls = cls
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = self.slot.__get__(obj)
+        if type(value) is list and value and type(value[0]) is dict:
+            cls = self.cls
+            value = [cls(item) if type(item) is dict else item for item in value]
+            self.slot.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        self.slot.__set__(obj, value)
+
+
+def _slots(fields, children):
+    '''子类的 __slots__：列表字段存放在带下划线前缀的槽位中，同名属性由 _LazyList 提供'''
+    return tuple("_" + name if name in children else name for name in fields)
+
+
+class TypedResult(object):
+    __slots__ = ("extra",)
+    FIELDS = ()
+    # 列表字段 -> 元素类型
+    CHILDREN = {}
+    _FIELD_SET = frozenset()
+    # 字段 -> 槽位描述符，读取时不触发列表转换
+    _RAW = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super(TypedResult, cls).__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+        cls._RAW = {}
+        for name in cls.FIELDS:
+            if name in cls.CHILDREN:
+                slot = cls.__dict__["_" + name]
+                setattr(cls, name, _LazyList(slot, cls.CHILDREN[name]))
+            else:
+                slot = cls.__dict__[name]
+            cls._RAW[name] = slot
+
+    def __init__(self, data):
+        # 不修改 data：缓存回放等场景会用同一份 dict 多次构造
+        get = data.get
+        present = 0
+        for name in self.FIELDS:
+            value = get(name, MISSING)
+            if value is not MISSING:
+                present += 1
+            setattr(self, name, value)
+        self.extra = _extra(data, self._FIELD_SET, present)
+
+    def _peek(self, key):
+        return self._RAW[key].__get__(self)
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if value is not MISSING:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        elif self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return self._peek(key) is not MISSING
+        return self.extra is not None and key in self.extra
+
+    def keys(self):
+        keys = [name for name in self.FIELDS if self._peek(name) is not MISSING]
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def as_dict(self):
+        '''转换为与 json.loads 结果一致的 dict（尚未读取过的列表字段不会先转换为对象）'''
+        data = dict((name, _as_plain(self._peek(name))) for name in self.FIELDS
+                    if self._peek(name) is not MISSING)
+        if self.extra:
+            data.update((key, _as_plain(value)) for key, value in self.extra.items())
+        return data
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (name, value) for name, value in self.as_dict().items()))
+
+
+def _extra(data, field_set, present):
+    if len(data) == present:
+        return None
+    return dict((key, value) for key, value in data.items() if key not in field_set) or None
+
+
+def _as_plain(value):
+    if isinstance(value, TypedResult):
+        return value.as_dict()
+    if isinstance(value, list):
+        return [_as_plain(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _as_plain(v)) for k, v in value.items())
+    return value
+
+
+_WORD_FIELDS = frozenset(("word", "start_time", "end_time", "stable_flag"))
+
+
+class Word(TypedResult):
+    '''实时识别/录音识别的词'''
+    FIELDS = ("word", "start_time", "end_time", "stable_flag")
+    __slots__ = FIELDS
+
+    # 词的数量远多于其他结构，逐字段展开以减少构造开销
+    def __init__(self, data):
+        get = data.get
+        self.word = get("word", MISSING)
+        self.start_time = get("start_time", MISSING)
+        self.end_time = get("end_time", MISSING)
+        self.stable_flag = get("stable_flag", MISSING)
+        if len(data) == 4 and self.stable_flag is not MISSING and self.word is not MISSING \
+                and self.start_time is not MISSING and self.end_time is not MISSING:
+            self.extra = None
+        else:
+            self.extra = dict((key, value) for key, value in data.items() if key not in _WORD_FIELDS) or None
+
+
+class Result(TypedResult):
+    '''实时识别 v1 的 result'''
+    FIELDS = ("slice_type", "index", "start_time", "end_time", "voice_text_str", "word_size", "word_list")
+    CHILDREN = {"word_list": Word}
+    __slots__ = _slots(FIELDS, CHILDREN)
+
+
+class Sentence(TypedResult):
+    '''实时识别 v2/说话人识别 sentence_list 中的句子'''
+    FIELDS = ("sentence", "sentence_type", "sentence_id", "speaker_id", "start_time", "end_time", "word_list")
+    CHILDREN = {"word_list": Word}
+    __slots__ = _slots(FIELDS, CHILDREN)
+
+
+class Sentences(TypedResult):
+    '''实时识别 v2/说话人识别的 sentences'''
+    FIELDS = ("sentence_list",)
+    CHILDREN = {"sentence_list": Sentence}
+    __slots__ = _slots(FIELDS, CHILDREN)
+
+
+class Subtitle(TypedResult):
+    '''语音合成字幕'''
+    FIELDS = ("Text", "BeginTime", "EndTime", "BeginIndex", "EndIndex", "Phoneme")
+    __slots__ = FIELDS
+
+
+class SubtitleResult(TypedResult):
+    '''语音合成消息的 result'''
+    FIELDS = ("subtitles",)
+    CHILDREN = {"subtitles": Subtitle}
+    __slots__ = _slots(FIELDS, CHILDREN)
+
+
+class SoeWord(TypedResult):
+    '''口语评测的单词得分'''
+    FIELDS = ("MemBeginTime", "MemEndTime", "PronAccuracy", "PronFluency", "Word",
+              "ReferenceWord", "MatchTag", "KeywordTag", "PhoneInfos")
+    __slots__ = FIELDS
+
+
+class SoeSentence(TypedResult):
+    '''口语评测 SentenceInfoSet 中的句子得分'''
+    FIELDS = ("SentenceId", "Words", "PronAccuracy", "PronFluency", "PronCompletion", "SuggestedScore")
+    CHILDREN = {"Words": SoeWord}
+    __slots__ = _slots(FIELDS, CHILDREN)
+
+
+class SoeResult(TypedResult):
+    '''口语评测消息的 result'''
+    FIELDS = ("PronAccuracy", "PronFluency", "PronCompletion", "SuggestedScore", "Words", "SentenceInfoSet")
+    CHILDREN = {"Words": SoeWord, "SentenceInfoSet": SoeSentence}
+    __slots__ = _slots(FIELDS, CHILDREN)
+
+
+# 各客户端消息的 schema：最外层 dict 中的字段名 -> 包装类
+ASR = {"result": Result, "sentences": Sentences}
+TTS = {"result": SubtitleResult}
+SOE = {"result": SoeResult}
+
+
+def json_default(obj):
+    '''供 json.dumps(response, default=json_default) 序列化含 TypedResult 的消息'''
+    if isinstance(obj, TypedResult):
+        return obj.as_dict()
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+
+def _wrap(message, schema):
+    for key, cls in schema.items():
+        value = message.get(key)
+        if type(value) is dict:
+            message[key] = cls(value)
+    return message
+
+
+def loads(s, schema=ASR):
+    '''用 common.json_codec 解码消息，schema 指定的对象包装为 TypedResult，其中的列表首次读取时才转换'''
+    message = json_codec.loads(s)
+    if type(message) is not dict:
+        return message
+    return _wrap(message, schema)
+
+
+def to_typed(message, schema=ASR):
+    '''把已经解码的消息 dict 转换为与 loads 相同的结构，不修改传入的 dict'''
+    if type(message) is not dict:
+        return message
+    return _wrap(dict(message), schema)
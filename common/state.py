@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+# ---------------------------------------------------------------------------
+# 会话状态通知：状态每次变化都会唤醒等待者，替代 sleep 轮询。
+#
+#   class XxxClient:
+#       status = SessionStatus()      # self.status = OPENED 即可通知等待者
+#
+#   session_state(self).wait_while((STARTED,), timeout)
+#   session_state(self).set(ERROR, error)   # 记录错误并唤醒等待者
+#
+#   session_state(self).wait_ready((STARTED,), OPEN_TIMEOUT)   # write() 等待建连，超时或出错时抛出
+# ---------------------------------------------------------------------------
+
+# write() 等待建连的默认上限，单位秒
+OPEN_TIMEOUT = 15
+# stop() 发送结束标记后等待服务端返回最终结果并关闭连接的上限，单位秒
+CLOSE_TIMEOUT = 30
+
+class SessionState(object):
+
+    def __init__(self, status=0):
+        self._cond = threading.Condition()
+        self._status = status
+        self.error = None
+
+    @property
+    def status(self):
+        return self._status
+
+    def reset(self, status):
+        """开始新会话：清除上次记录的错误"""
+        with self._cond:
+            self._status = status
+            self.error = None
+            self._cond.notify_all()
+
+    def set(self, status, error=None):
+        with self._cond:
+            self._status = status
+            if error is not None:
+                self.error = error
+            self._cond.notify_all()
+
+    def notify(self):
+        """状态以外的条件（如 ready 标记）变化后调用"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, predicate, timeout=None):
+        """等待 predicate() 为真，超时返回 False；timeout 单位秒，None 表示一直等待"""
+        with self._cond:
+            return self._cond.wait_for(predicate, timeout)
+
+    def wait_until(self, statuses, timeout=None):
+        return self.wait(lambda: self._status in statuses, timeout)
+
+    def wait_while(self, statuses, timeout=None):
+        return self.wait(lambda: self._status not in statuses, timeout)
+
+    def wait_ready(self, pending, timeout=OPEN_TIMEOUT):
+        """等待状态离开 pending（建连中），超时抛出 RuntimeError，会话已出错时抛出 raise_error 的异常"""
+        if not self.wait_while(pending, timeout):
+            raise RuntimeError("session not opened within %s seconds" % timeout)
+        self.raise_error()
+
+    def raise_error(self):
+        """会话记录过错误（连接失败、异常断开）时抛出 RuntimeError，避免调用方的数据被静默丢弃"""
+        error = self.error
+        if error is not None:
+            raise RuntimeError("session failed: %r" % (error,))
+
+
+class SessionStatus(object):
+    """类属性描述符，读写 status 时透明地使用实例上的 SessionState"""
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return session_state(obj).status
+
+    def __set__(self, obj, value):
+        session_state(obj).set(value)
+
+
+def session_state(obj):
+    state = obj.__dict__.get('_session_state')
+    if state is None:
+        state = obj.__dict__.setdefault('_session_state', SessionState())
+    return state
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import array
+import bisect
+import collections
+import math
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ---------------------------------------------------------------------------
+# 客户端能量/过零率 VAD：实时识别 write() 之前去掉长静音，只上传语音及其前后少量静音。
+#
+#   vad = EnergyVad(sample_rate=16000, hangover_ms=1200, preroll_ms=300)
+#   recognizer.set_client_vad(vad)
+#   ...
+#   vad.bytes_saved                      # 未上传的字节数
+#   vad.stream_time(result_start_time)   # 服务端时间戳换算回原始音频时间
+#
+# 只处理 16bit 小端单声道 PCM。判定按帧进行，有 numpy 时整块向量化计算能量与过零率：
+#   语音帧  能量高于 max(energy_db, 噪声底 + snr_db)，或略低于该门限但过零率不低于 zcr_threshold（清辅音）
+#   hangover_ms  语音结束后继续上传的静音，应不小于识别参数 vad_silence_time，服务端才能正常断句
+#   preroll_ms   语音开始前补发的静音，避免丢掉弱起音
+#   keepalive_ms 静音期间每隔这么长时间上传一帧全零音频，防止服务端因长时间收不到音频断开（0 表示不发送）
+# 被省略的静音不占服务端时间轴，服务端返回的时间戳需用 stream_time() 换算。
+# ---------------------------------------------------------------------------
+class EnergyVad(object):
+
+    def __init__(self, sample_rate=16000, frame_ms=20, energy_db=-45.0, snr_db=10.0,
+                 zcr_threshold=0.25, hangover_ms=1200, preroll_ms=300, keepalive_ms=1000):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.energy_db = energy_db
+        self.snr_db = snr_db
+        self.zcr_threshold = zcr_threshold
+        self.hangover_ms = hangover_ms
+        self.preroll_ms = preroll_ms
+        self.keepalive_ms = keepalive_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.reset()
+
+    def reset(self):
+        '''清空状态与统计，开始新的会话'''
+        # 统计：输入/上传字节数、保活帧数、语音段数
+        self.bytes_in = 0
+        self.bytes_sent = 0
+        self.keepalive_frames = 0
+        self.speech_segments = 0
+        self.noise_db = self.energy_db - self.snr_db
+        self._pending = b""
+        self._speaking = False
+        self._hang = 0
+        self._preroll = collections.deque(maxlen=max(0, self.preroll_ms // self.frame_ms))
+        self._silent_frames = 0
+        self._sent_ms = 0
+        self._stream_ms = 0
+        # 服务端时间轴 -> 原始音频时间的分段偏移，元素为 (已上传毫秒数, 偏移)。
+        # stream_time() 在接收线程中无锁读取：每段作为一个元组整体追加，读到的起点与偏移总是一致
+        self._gaps = [(0, 0)]
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_in - self.bytes_sent
+
+    @property
+    def speaking(self):
+        return self._speaking
+
+    @property
+    def sent_ms(self):
+        '''已输出音频的总时长（毫秒），即服务端时间轴上的当前位置'''
+        return self._sent_ms
+
+    @property
+    def stream_ms(self):
+        '''已处理的原始音频时长（毫秒）'''
+        return self._stream_ms
+
+    def process(self, data):
+        '''输入任意长度的音频，返回此时应上传的数据（可能为空 bytes），不足一帧的尾部留到下次'''
+        self.bytes_in += len(data)
+        buf = self._pending + bytes(data) if self._pending else bytes(data)
+        count = len(buf) // self.frame_bytes
+        self._pending = buf[count * self.frame_bytes:]
+        if count == 0:
+            return b""
+        out = []
+        flags = self._classify(buf, count)
+        fb = self.frame_bytes
+        for i, speech in enumerate(flags):
+            self._step(buf[i * fb:(i + 1) * fb], speech, out)
+        data = b"".join(out)
+        self.bytes_sent += len(data)
+        return data
+
+    def flush(self):
+        '''会话结束：正在说话时把不足一帧的尾部一并返回'''
+        tail, self._pending = self._pending, b""
+        if not self._speaking or not tail:
+            return b""
+        self.bytes_sent += len(tail)
+        return tail
+
+    def stream_time(self, ms):
+        '''把服务端返回的时间（毫秒，相对已上传音频）换算为原始音频中的时间'''
+        gaps = self._gaps
+        i = bisect.bisect_right(gaps, (ms, float('inf'))) - 1
+        return ms + gaps[i][1]
+
+    def _classify(self, buf, count):
+        energies, zcrs = _frame_features(buf, count, self.frame_bytes)
+        flags = []
+        for energy, zcr in zip(energies, zcrs):
+            db = 10.0 * math.log10(energy / 1073741824.0 + 1e-12)
+            threshold = max(self.energy_db, self.noise_db + self.snr_db)
+            speech = db >= threshold or (db >= threshold - 6.0 and zcr >= self.zcr_threshold)
+            # 噪声底跟踪静音帧能量；语音帧以极慢速度跟踪，避免开头即为强噪声时一直判为语音
+            self.noise_db += (db - self.noise_db) * (0.001 if speech else 0.05)
+            flags.append(speech)
+        return flags
+
+    def _step(self, frame, speech, out):
+        if speech:
+            if not self._speaking:
+                self._resume(out)
+            self._speaking = True
+            self._hang = self.hangover_ms // self.frame_ms
+            self._emit(frame, out)
+        elif self._speaking and self._hang > 0:
+            self._hang -= 1
+            self._emit(frame, out)
+        else:
+            self._speaking = False
+            self._preroll.append(frame)
+            self._silent_frames += 1
+            if self.keepalive_ms > 0 and self._silent_frames * self.frame_ms >= self.keepalive_ms:
+                self.keepalive_frames += 1
+                self._emit(b"\x00" * self.frame_bytes, out)
+        self._stream_ms += self.frame_ms
+
+    def _resume(self, out):
+        # 补发 preroll 中的静音帧，记录此处服务端时间轴相对原始音频的偏移
+        preroll = list(self._preroll)
+        self._preroll.clear()
+        offset = self._stream_ms - len(preroll) * self.frame_ms - self._sent_ms
+        if offset != self._gaps[-1][1]:
+            self._gaps.append((self._sent_ms, offset))
+        for frame in preroll:
+            self._emit(frame, out)
+        self.speech_segments += 1
+
+    def _emit(self, frame, out):
+        out.append(frame)
+        self._sent_ms += self.frame_ms
+        self._silent_frames = 0
+
+
+def _frame_features(buf, count, frame_bytes):
+    '''每帧的平均能量（样本平方均值）与过零率，有 numpy 时向量化计算'''
+    if np is not None:
+        samples = np.frombuffer(buf, dtype='<i2', count=count * frame_bytes // 2)
+        frames = samples.reshape(count, -1).astype(np.float64)
+        energies = (frames * frames).mean(axis=1)
+        signs = np.signbit(frames)
+        zcrs = (signs[:, 1:] != signs[:, :-1]).mean(axis=1)
+        return energies.tolist(), zcrs.tolist()
+    samples = array.array('h', buf[:count * frame_bytes])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    step = frame_bytes // 2
+    energies = []
+    zcrs = []
+    for i in range(0, len(samples), step):
+        frame = samples[i:i + step]
+        energies.append(sum(x * x for x in frame) / float(step))
+        crossings = sum(1 for a, b in zip(frame, frame[1:]) if (a < 0) != (b < 0))
+        zcrs.append(crossings / float(max(1, step - 1)))
+    return energies, zcrs
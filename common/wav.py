@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import mmap
+import struct
+import time
+
+
+# ---------------------------------------------------------------------------
+# WAV 头解析与生成，仅处理 PCM(format=1) / WAVE_FORMAT_EXTENSIBLE 的 RIFF 文件；
+# AudioSource 把 WAV/裸 PCM 文件映射到内存后按时长切片
+# ---------------------------------------------------------------------------
+class WavInfo(object):
+
+    def __init__(self, sample_rate, channels, bits_per_sample, data_offset, data_size):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits_per_sample = bits_per_sample
+        self.data_offset = data_offset
+        self.data_size = data_size
+
+    @property
+    def block_align(self):
+        return self.channels * self.bits_per_sample // 8
+
+
+def parse_wav_header(buf):
+    """解析 RIFF/WAVE 头，buf 为 bytes-like（可为 mmap 的 memoryview），返回 WavInfo"""
+    if len(buf) < 12 or bytes(buf[0:4]) != b"RIFF" or bytes(buf[8:12]) != b"WAVE":
+        raise ValueError("not a RIFF/WAVE file")
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(buf):
+        chunk_id = bytes(buf[pos:pos + 4])
+        chunk_size = struct.unpack_from("<I", buf, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate = struct.unpack_from("<HHI", buf, body)
+            bits_per_sample = struct.unpack_from("<H", buf, body + 14)[0]
+            if audio_format not in (1, 0xFFFE):
+                raise ValueError("unsupported wav format %d" % audio_format)
+            fmt = (sample_rate, channels, bits_per_sample)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("wav data chunk before fmt chunk")
+            # 流式写出的 wav 常把 data 长度写成 0 或 0xFFFFFFFF
+            available = len(buf) - body
+            if chunk_size == 0 or chunk_size > available:
+                chunk_size = available
+            return WavInfo(fmt[0], fmt[1], fmt[2], body, chunk_size)
+        pos = body + chunk_size + (chunk_size & 1)
+    raise ValueError("wav data chunk not found")
+
+
+def wav_header(sample_rate, channels, bits_per_sample, data_size):
+    block_align = channels * bits_per_sample // 8
+    return struct.pack("<4sI4s4sIHHIIHH4sI",
+                       b"RIFF", 36 + data_size, b"WAVE",
+                       b"fmt ", 16, 1, channels, sample_rate,
+                       sample_rate * block_align, block_align, bits_per_sample,
+                       b"data", data_size)
+
+
+class AudioSource(object):
+    '''
+    WAV/PCM 文件按时长切片：mmap 映射文件，按 chunk_ms 产出数据块的 memoryview，不为每片分配新对象。
+    同一个 AudioSource 可被多个线程同时调用 chunks() 回放（压测中成千上万路共享一份映射）。
+
+        with AudioSource("test.wav") as source:          # 非 RIFF 文件按 sample_rate/channels/bits 视为裸 PCM
+            for chunk in source.chunks(200, realtime=True):
+                recognizer.write(chunk)
+
+    产出的 memoryview 在 close() 之前有效；需要长期保留的数据请自行 bytes() 复制。
+    '''
+
+    def __init__(self, path, sample_rate=16000, channels=1, bits_per_sample=16):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # 空文件或不支持 mmap 的文件系统，整体读入
+            self._mmap = None
+        self._view = memoryview(self._mmap if self._mmap is not None else self._file.read())
+        if bytes(self._view[0:4]) == b"RIFF":
+            self.info = parse_wav_header(self._view)
+        else:
+            self.info = WavInfo(sample_rate, channels, bits_per_sample, 0, len(self._view))
+        self.data = self._view[self.info.data_offset:self.info.data_offset + self.info.data_size]
+
+    @property
+    def sample_rate(self):
+        return self.info.sample_rate
+
+    @property
+    def duration_ms(self):
+        return len(self.data) * 1000 // (self.info.sample_rate * self.info.block_align)
+
+    def chunk_bytes(self, chunk_ms):
+        '''chunk_ms 对应的字节数，按采样帧对齐'''
+        return max(1, self.info.sample_rate * chunk_ms // 1000) * self.info.block_align
+
+    def chunks(self, chunk_ms=200, realtime=False, start_ms=0):
+        '''
+        依次产出 chunk_ms 时长的 memoryview，最后一块可能不足 chunk_ms。
+        realtime=True 时按音频时长节拍产出（以开始时刻为基准，不会因处理耗时累积漂移）。
+        '''
+        size = self.chunk_bytes(chunk_ms)
+        data = self.data
+        begin = time.time()
+        pos = self.info.sample_rate * start_ms // 1000 * self.info.block_align
+        sent_ms = 0
+        while pos < len(data):
+            if realtime:
+                delay = begin + sent_ms / 1000.0 - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            yield data[pos:pos + size]
+            pos += size
+            sent_ms += chunk_ms
+
+    def close(self):
+        self.data.release()
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 调用方仍持有切片，映射在最后一个切片释放后随对象回收
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
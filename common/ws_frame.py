@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import struct
+
+from websocket import ABNF
+
+
+class FrameDecoder(object):
+    """增量解析服务端帧，处理分片，返回 [(opcode, payload, fin)]"""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._frag_opcode = None
+        self._frags = []
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        frames = []
+        pos = 0
+        size = len(buf)
+        while size - pos >= 2:
+            b1 = buf[pos]
+            b2 = buf[pos + 1]
+            fin = b1 & 0x80
+            opcode = b1 & 0x0f
+            length = b2 & 0x7f
+            hlen = 2
+            if length == 126:
+                if size - pos < 4:
+                    break
+                length = struct.unpack_from("!H", buf, pos + 2)[0]
+                hlen = 4
+            elif length == 127:
+                if size - pos < 10:
+                    break
+                length = struct.unpack_from("!Q", buf, pos + 2)[0]
+                hlen = 10
+            mask_key = None
+            if b2 & 0x80:
+                if size - pos < hlen + 4:
+                    break
+                mask_key = bytes(buf[pos + hlen:pos + hlen + 4])
+                hlen += 4
+            if size - pos < hlen + length:
+                break
+            payload = bytes(buf[pos + hlen:pos + hlen + length])
+            if mask_key is not None:
+                payload = ABNF.mask(mask_key, payload)
+            pos += hlen + length
+
+            if opcode >= ABNF.OPCODE_CLOSE:
+                frames.append((opcode, payload, True))
+            elif opcode == ABNF.OPCODE_CONT:
+                self._frags.append(payload)
+                if fin:
+                    frames.append((self._frag_opcode, b"".join(self._frags), True))
+                    self._frag_opcode = None
+                    self._frags = []
+            elif fin:
+                frames.append((opcode, payload, True))
+            else:
+                self._frag_opcode = opcode
+                self._frags = [payload]
+        if pos:
+            del buf[:pos]
+        return frames
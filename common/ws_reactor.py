@@ -0,0 +1,624 @@
+# -*- coding: utf-8 -*-
+import base64
+import collections
+import errno
+import hashlib
+import itertools
+import os
+import selectors
+import socket
+import ssl
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import websocket
+from websocket import ABNF
+
+from common.log import logger
+from common.ws_frame import FrameDecoder
+
+
+# ---------------------------------------------------------------------------
+# WebSocketReactor  –  用少量 I/O 线程驱动大量 websocket 连接
+#
+# 只有 DNS 解析（getaddrinfo 没有非阻塞接口）在 connect_workers 线程池中完成，结果短时缓存；
+# TCP 连接、TLS 握手与 HTTP Upgrade 都以非阻塞方式在 I/O 线程的 selector(epoll/kqueue) 中推进，
+# 同时进行的握手数量不受线程数限制，成千上万个 wss 会话同时建连也不会因排队超过 connect_timeout。
+# send() 在调用线程直接写 socket，与 I/O 线程的读写由连接锁串行化（SSL socket 不能并发使用）。
+# 不支持 HTTP 代理。
+# 回调在 I/O 线程上执行，签名与 WebSocketApp 保持一致：
+#   on_open(ws) / on_message(ws, message) / on_data(ws, data, opcode, fin)
+#   on_error(ws, error) / on_close(ws, close_status_code, close_msg)
+# ---------------------------------------------------------------------------
+
+_RECV_SIZE = 65536
+_MAX_RECV_ROUNDS = 16
+
+_MAX_HEADER_SIZE = 65536
+_DNS_TTL = 30
+_DEADLINE_CHECK_INTERVAL = 0.1
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+_CONNECTING = 0
+_OPEN = 1
+_CLOSING = 2
+_CLOSED = 3
+
+# 握手阶段
+_TCP = 0
+_TLS = 1
+_UPGRADE = 2
+
+
+class ReactorConnection(object):
+    """由 WebSocketReactor 驱动的单条连接，发送接口与 WebSocketApp 兼容"""
+
+    def __init__(self, reactor, loop, url, header=None, on_open=None,
+                 on_message=None, on_data=None, on_error=None, on_close=None):
+        self.url = url
+        self.header = header
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_data = on_data
+        self.on_error = on_error
+        self.on_close = on_close
+        self.sock = None
+
+        self._reactor = reactor
+        self._loop = loop
+        self._state = _CONNECTING
+        self._close_requested = False
+        self._out = bytearray()
+        self._lock = threading.Lock()
+        self._events = 0
+        self._decoder = FrameDecoder()
+        self._closed = threading.Event()
+
+        # 握手状态，仅在 I/O 线程上访问
+        self._deadline = time.monotonic() + reactor.connect_timeout
+        self._step = _TCP
+        self._addrs = []
+        self._host = None
+        self._secure = False
+        self._key = None
+        self._hs_out = bytearray()
+        self._hs_in = bytearray()
+
+    # ---- public, thread-safe ---------------------------------------------
+
+    def send(self, data, opcode=ABNF.OPCODE_TEXT):
+        if self._state >= _CLOSING:
+            raise websocket.WebSocketConnectionClosedException(
+                "socket is already closed.")
+        frame = ABNF.create_frame(data, opcode).format()
+        # 与 WebSocketApp 一致，直接在调用线程发送；写不完的部分交给 I/O 线程。
+        # 对 socket 的读写都在 _lock 内进行，SSL socket 不能被两个线程同时使用
+        with self._lock:
+            if self._state == _OPEN and not self._out:
+                try:
+                    sent = self.sock.send(frame)
+                except (ssl.SSLWantWriteError, ssl.SSLWantReadError, BlockingIOError):
+                    sent = 0
+                except OSError as e:
+                    self._loop.call_soon(self._fail, e)
+                    return
+                if sent == len(frame):
+                    return
+                frame = frame[sent:]
+            self._out += frame
+        self._loop.call_soon(self._flush)
+
+    def send_binary(self, data):
+        self.send(data, ABNF.OPCODE_BINARY)
+
+    def close(self):
+        self._loop.call_soon(self._start_close, 1000)
+
+    def join(self, timeout=None):
+        """阻塞直到连接关闭"""
+        return self._closed.wait(timeout)
+
+    def is_closed(self):
+        return self._closed.is_set()
+
+    # ---- loop thread ------------------------------------------------------
+
+    def _callback(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(self, *args)
+        except Exception as e:
+            logger.error("error from callback {}: {}".format(callback, e))
+
+    def _begin(self, parsed, addrs):
+        """DNS 解析完成，开始非阻塞连接"""
+        if self._state != _CONNECTING:
+            return
+        self._host, port, resource, self._secure = parsed
+        self._addrs = list(addrs)
+        self._hs_out += self._upgrade_request(port, resource)
+        self._loop.connecting.add(self)
+        self._connect_next(None)
+
+    def _upgrade_request(self, port, resource):
+        self._key = base64.b64encode(os.urandom(16))
+        host = "[%s]" % self._host if ":" in self._host else self._host
+        if port != (443 if self._secure else 80):
+            host = "%s:%d" % (host, port)
+        lines = ["GET %s HTTP/1.1" % resource,
+                 "Upgrade: websocket",
+                 "Connection: Upgrade",
+                 "Host: %s" % host,
+                 "Origin: %s://%s" % ("https" if self._secure else "http", host),
+                 "Sec-WebSocket-Key: %s" % self._key.decode("ascii"),
+                 "Sec-WebSocket-Version: 13"]
+        if isinstance(self.header, dict):
+            lines.extend("%s: %s" % item for item in self.header.items())
+        elif self.header:
+            lines.extend(self.header)
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+    def _connect_next(self, error):
+        """依次尝试解析出的地址，全部失败时报告最后一个错误"""
+        if self.sock is not None:
+            self._loop.unregister(self)
+            self.sock.close()
+            self.sock = None
+        while self._addrs:
+            family, socktype, proto, _, addr = self._addrs.pop(0)
+            try:
+                sock = socket.socket(family, socktype, proto)
+            except OSError as e:
+                error = e
+                continue
+            sock.setblocking(False)
+            if family in (socket.AF_INET, socket.AF_INET6):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            err = sock.connect_ex(addr)
+            if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                self.sock = sock
+                self._step = _TCP
+                self._events = selectors.EVENT_WRITE
+                self._loop.register(self)
+                return
+            sock.close()
+            error = OSError(err, os.strerror(err))
+        self._connect_failed(error or OSError("no address to connect"))
+
+    def _handle_handshake(self):
+        try:
+            if self._step == _TCP:
+                err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    self._connect_next(OSError(err, os.strerror(err)))
+                    return
+                if self._secure:
+                    # wrap_socket 会接管原 socket 的 fd，先从 selector 中注销
+                    self._loop.unregister(self)
+                    self.sock = self._reactor._ssl_context().wrap_socket(
+                        self.sock, server_hostname=self._host,
+                        do_handshake_on_connect=False)
+                    self._loop.register(self)
+                    self._step = _TLS
+                else:
+                    self._step = _UPGRADE
+            if self._step == _TLS:
+                self.sock.do_handshake()
+                self._step = _UPGRADE
+            while self._hs_out:
+                try:
+                    sent = self.sock.send(self._hs_out)
+                except BlockingIOError:
+                    self._set_events(selectors.EVENT_WRITE)
+                    return
+                del self._hs_out[:sent]
+            while True:
+                try:
+                    data = self.sock.recv(_RECV_SIZE)
+                except BlockingIOError:
+                    self._set_events(selectors.EVENT_READ)
+                    return
+                if not data:
+                    raise websocket.WebSocketConnectionClosedException(
+                        "Connection to remote host was lost.")
+                self._hs_in += data
+                end = self._hs_in.find(b"\r\n\r\n")
+                if end >= 0:
+                    break
+                if len(self._hs_in) > _MAX_HEADER_SIZE:
+                    raise websocket.WebSocketException("handshake response header too large")
+            self._check_response(bytes(self._hs_in[:end]))
+            rest = bytes(self._hs_in[end + 4:])
+            self._hs_in = bytearray()
+        except ssl.SSLWantReadError:
+            self._set_events(selectors.EVENT_READ)
+            return
+        except ssl.SSLWantWriteError:
+            self._set_events(selectors.EVENT_WRITE)
+            return
+        except Exception as e:
+            self._connect_failed(e)
+            return
+        self._attach(rest)
+
+    def _check_response(self, head):
+        lines = head.decode("iso-8859-1").split("\r\n")
+        status_line = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            status = int(status_line[1])
+        except (IndexError, ValueError):
+            raise websocket.WebSocketException("Invalid handshake response: %r" % lines[0])
+        if status != 101:
+            raise websocket.WebSocketBadStatusException(
+                "Handshake status %d %s" % (status, status_line[2] if len(status_line) > 2 else ""),
+                status, status_line[2] if len(status_line) > 2 else None, headers)
+        accept = base64.b64encode(hashlib.sha1(self._key + _GUID).digest()).decode("ascii")
+        if headers.get("upgrade", "").lower() != "websocket" \
+                or "upgrade" not in headers.get("connection", "").lower() \
+                or headers.get("sec-websocket-accept") != accept:
+            raise websocket.WebSocketException("Invalid WebSocket Header")
+
+    def _attach(self, rest):
+        self._loop.connecting.discard(self)
+        self._state = _OPEN
+        self._set_events(selectors.EVENT_READ)
+        self._callback(self.on_open)
+        # 与握手响应一起到达的帧
+        if rest:
+            for opcode, payload, fin in self._decoder.feed(rest):
+                self._dispatch(opcode, payload, fin)
+                if self._state == _CLOSED:
+                    return
+        # 握手期间已排队的帧 / 握手期间请求的关闭
+        if self._close_requested:
+            self._start_close(1000)
+        elif self._out:
+            self._handle_write()
+
+    def _connect_failed(self, error):
+        if self._state == _CLOSED:
+            return
+        logger.error("ws reactor connect fail: {}".format(error))
+        self._callback(self.on_error, error)
+        self._teardown(None, None)
+
+    def _flush(self):
+        if self._state == _OPEN:
+            self._handle_write()
+
+    def _start_close(self, status):
+        if self._state == _CONNECTING:
+            self._close_requested = True
+            return
+        if self._state != _OPEN:
+            return
+        with self._lock:
+            self._state = _CLOSING
+            self._out += ABNF.create_frame(
+                struct.pack("!H", status), ABNF.OPCODE_CLOSE).format()
+        self._handle_write()
+
+    def _set_events(self, events):
+        if events != self._events and self._state != _CLOSED:
+            self._events = events
+            self._loop.modify(self, events)
+
+    def _handle_write(self):
+        error = None
+        with self._lock:
+            while self._out:
+                try:
+                    sent = self.sock.send(self._out)
+                except (ssl.SSLWantWriteError, ssl.SSLWantReadError, BlockingIOError):
+                    self._set_events(selectors.EVENT_READ | selectors.EVENT_WRITE)
+                    return
+                except OSError as e:
+                    error = e
+                    break
+                del self._out[:sent]
+        if error is not None:
+            self._fail(error)
+            return
+        if self._state == _CLOSING:
+            self._teardown(1000, "")
+            return
+        self._set_events(selectors.EVENT_READ)
+
+    def _recv(self):
+        with self._lock:
+            data = self.sock.recv(_RECV_SIZE)
+            more = len(data) == _RECV_SIZE or (
+                isinstance(self.sock, ssl.SSLSocket) and self.sock.pending())
+        return data, more
+
+    def _handle_read(self):
+        for _ in range(_MAX_RECV_ROUNDS):
+            try:
+                data, more = self._recv()
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+                return
+            except OSError as e:
+                self._fail(e)
+                return
+            if not data:
+                self._fail(websocket.WebSocketConnectionClosedException(
+                    "Connection to remote host was lost."))
+                return
+            for opcode, payload, fin in self._decoder.feed(data):
+                self._dispatch(opcode, payload, fin)
+                if self._state == _CLOSED:
+                    return
+            if not more:
+                return
+
+    def _dispatch(self, opcode, payload, fin):
+        if opcode == ABNF.OPCODE_TEXT or opcode == ABNF.OPCODE_BINARY:
+            if opcode == ABNF.OPCODE_TEXT:
+                payload = payload.decode('utf-8')
+            self._callback(self.on_data, payload, opcode, fin)
+            self._callback(self.on_message, payload)
+        elif opcode == ABNF.OPCODE_PING:
+            with self._lock:
+                self._out += ABNF.create_frame(payload, ABNF.OPCODE_PONG).format()
+            self._handle_write()
+        elif opcode == ABNF.OPCODE_CLOSE:
+            code = None
+            reason = ""
+            if len(payload) >= 2:
+                code = struct.unpack("!H", payload[:2])[0]
+                reason = payload[2:].decode('utf-8', 'replace')
+            if self._state == _OPEN:
+                with self._lock:
+                    self._state = _CLOSING
+                    self._out += ABNF.create_frame(
+                        payload[:2], ABNF.OPCODE_CLOSE).format()
+                    try:
+                        self.sock.send(self._out)
+                    except Exception:
+                        pass
+            self._teardown(code, reason)
+
+    def _fail(self, error):
+        if self._state == _CLOSED:
+            return
+        if self._state != _CLOSING:
+            self._callback(self.on_error, error)
+        self._teardown(None, None)
+
+    def _teardown(self, code, reason):
+        if self._state == _CLOSED:
+            return
+        self._loop.connecting.discard(self)
+        if self.sock is not None:
+            self._loop.unregister(self)
+        with self._lock:
+            self._state = _CLOSED
+            if self.sock is not None:
+                try:
+                    self.sock.close()
+                except Exception:
+                    pass
+            self._out = bytearray()
+        self._reactor._release(self)
+        self._closed.set()
+        self._callback(self.on_close, code, reason)
+
+
+class _IOLoop(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.connections = 0
+        # 正在握手的连接，I/O 线程定期检查其 connect_timeout
+        self.connecting = set()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._woken = False
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def call_soon(self, fn, *args):
+        with self._lock:
+            self._pending.append((fn, args))
+            if self._woken:
+                return
+            self._woken = True
+        self._wakeup()
+
+    def register(self, conn):
+        self._selector.register(conn.sock, conn._events, conn)
+
+    def modify(self, conn, events):
+        self._selector.modify(conn.sock, events, conn)
+
+    def unregister(self, conn):
+        try:
+            self._selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _wakeup(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_pending(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = collections.deque()
+            self._woken = False
+        for fn, args in pending:
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error("reactor task error: {}".format(e))
+
+    def _check_deadlines(self):
+        now = time.monotonic()
+        for conn in [c for c in self.connecting if c._deadline <= now]:
+            conn._connect_failed(websocket.WebSocketTimeoutException("handshake timed out"))
+
+    def _run(self):
+        next_check = 0
+        while self._running:
+            timeout = _DEADLINE_CHECK_INTERVAL if self.connecting else 1.0
+            for key, mask in self._selector.select(timeout):
+                conn = key.data
+                if conn is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                if conn._state == _CONNECTING:
+                    conn._handle_handshake()
+                    continue
+                if mask & selectors.EVENT_WRITE and conn._state != _CLOSED:
+                    conn._handle_write()
+                if mask & selectors.EVENT_READ and conn._state != _CLOSED:
+                    conn._handle_read()
+            self._run_pending()
+            if self.connecting and time.monotonic() >= next_check:
+                self._check_deadlines()
+                next_check = time.monotonic() + _DEADLINE_CHECK_INTERVAL
+        self._run_pending()
+
+
+class WebSocketReactor(object):
+    """
+    多路复用 websocket 连接：io_threads 个 I/O 线程负责所有连接的握手与收发，
+    connect_workers 个线程只负责 DNS 解析。一个 reactor 可同时服务成百上千个会话。
+    connect_timeout 是从 connect() 到握手完成的总时限（秒）；
+    ssl_context 为 None 时使用 ssl.create_default_context()（校验服务端证书）。
+    """
+
+    def __init__(self, io_threads=1, connect_workers=4, connect_timeout=10, ssl_context=None):
+        self.io_threads = io_threads
+        self.connect_workers = connect_workers
+        self.connect_timeout = connect_timeout
+        self.ssl_context = ssl_context
+        self._loops = []
+        self._executor = None
+        self._lock = threading.Lock()
+        self._dns = {}
+        self._conns = set()
+        self._started = False
+        self._seq = itertools.count()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.connect_workers)
+            for i in range(self.io_threads):
+                loop = _IOLoop("ws-reactor-%d" % i)
+                loop.start()
+                self._loops.append(loop)
+            self._started = True
+        logger.info("ws reactor start: io_threads={} connect_workers={}".format(
+            self.io_threads, self.connect_workers))
+
+    def stop(self):
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            conns = list(self._conns)
+        for conn in conns:
+            conn.close()
+        for conn in conns:
+            conn.join(self.connect_timeout)
+        self._executor.shutdown(wait=True)
+        for loop in self._loops:
+            loop.stop()
+        self._loops = []
+        logger.info("ws reactor stop")
+
+    def connection_count(self):
+        with self._lock:
+            return len(self._conns)
+
+    def connect(self, url, header=None, on_open=None, on_message=None,
+                on_data=None, on_error=None, on_close=None):
+        self.start()
+        with self._lock:
+            loop = min(self._loops, key=lambda l: (l.connections, next(self._seq)))
+            loop.connections += 1
+            conn = ReactorConnection(self, loop, url, header=header,
+                                     on_open=on_open, on_message=on_message,
+                                     on_data=on_data, on_error=on_error,
+                                     on_close=on_close)
+            self._conns.add(conn)
+        self._executor.submit(self._resolve, conn)
+        return conn
+
+    def _ssl_context(self):
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        return self.ssl_context
+
+    def _resolve(self, conn):
+        try:
+            parsed = _parse_url(conn.url)
+            host, port = parsed[0], parsed[1]
+            now = time.monotonic()
+            with self._lock:
+                cached = self._dns.get((host, port))
+            if cached is not None and cached[0] > now:
+                addrs = cached[1]
+            else:
+                addrs = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+                with self._lock:
+                    self._dns[(host, port)] = (now + _DNS_TTL, addrs)
+        except Exception as e:
+            conn._loop.call_soon(conn._connect_failed, e)
+            return
+        conn._loop.call_soon(conn._begin, parsed, addrs)
+
+    def _release(self, conn):
+        with self._lock:
+            if conn in self._conns:
+                self._conns.discard(conn)
+                conn._loop.connections -= 1
+
+
+def _parse_url(url):
+    """返回 (host, port, resource, is_secure)"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("ws", "wss"):
+        raise ValueError("scheme %s is invalid" % parts.scheme)
+    if not parts.hostname:
+        raise ValueError("hostname is invalid")
+    secure = parts.scheme == "wss"
+    port = parts.port or (443 if secure else 80)
+    resource = parts.path or "/"
+    if parts.query:
+        resource += "?" + parts.query
+    return parts.hostname, port, resource, secure
@@ -1,20 +1,22 @@
 # -*- coding: utf-8 -*-
 # 引用 SDK
 
-import time
 import sys
 import threading
 from datetime import datetime
 import json
 sys.path.append("../..")
 from common import credential
+from common.wav import AudioSource
 from asr import speech_recognizer
 
 APPID = ""
 SECRET_ID = ""
 SECRET_KEY = ""
 ENGINE_MODEL_TYPE = "16k_zh"
-SLICE_SIZE = 6400
+SLICE_MS = 200
+# 多线程压测时所有连接共享同一份文件映射
+AUDIO = AudioSource("test.wav")
 
 
 class MySpeechRecognitionListener(speech_recognizer.SpeechRecognitionListener):
@@ -51,7 +53,6 @@ class MySpeechRecognitionListener(speech_recognizer.SpeechRecognitionListener):
 
 
 def process(id):
-    audio = "test.wav"
     listener = MySpeechRecognitionListener(id)
     credential_var = credential.Credential(SECRET_ID, SECRET_KEY)
     recognizer = speech_recognizer.SpeechRecognizer(
@@ -67,13 +68,9 @@ def process(id):
     recognizer.set_convert_num_mode(1)
     try:
         recognizer.start()
-        with open(audio, 'rb') as f:
-            content = f.read(SLICE_SIZE)
-            while content:
-                recognizer.write(content)
-                content = f.read(SLICE_SIZE)
-                #sleep模拟实际实时语音发送间隔
-                time.sleep(0.02)
+        # realtime=True 按实际语音时长间隔发送
+        for chunk in AUDIO.chunks(SLICE_MS, realtime=True):
+            recognizer.write(chunk)
     except Exception as e:
         print(e)
     finally:
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# 多路并发回放同一音频文件：每路 open + f.read(SLICE_SIZE) 与共享 common.wav.AudioSource 切片对比。
+# 统计切片耗时与 Python 堆内存峰值（tracemalloc），不建立连接，write() 以空函数代替。
+#
+#   python audio_source_benchmark.py
+#   python audio_source_benchmark.py --streams 5000 --chunk-ms 40 --file test.wav
+
+import argparse
+import time
+import tracemalloc
+
+import sys
+sys.path.append("../..")
+from common.wav import AudioSource
+
+
+def write(chunk):
+    pass
+
+
+def read_loop(path, streams, slice_size):
+    files = [open(path, "rb") for _ in range(streams)]
+    # 各路交替读取，模拟并发回放时每路各持有一片数据
+    active = files
+    while active:
+        alive = []
+        for f in active:
+            content = f.read(slice_size)
+            if content:
+                write(content)
+                alive.append(f)
+            else:
+                f.close()
+        active = alive
+
+
+def source_loop(path, streams, chunk_ms):
+    with AudioSource(path) as source:
+        active = [source.chunks(chunk_ms) for _ in range(streams)]
+        while active:
+            alive = []
+            for it in active:
+                chunk = next(it, None)
+                if chunk is not None:
+                    write(chunk)
+                    alive.append(it)
+            active = alive
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(*args)
+    cost = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cost, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default="test.wav")
+    parser.add_argument("--streams", type=int, default=2000, help="并发回放路数")
+    parser.add_argument("--chunk-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    with AudioSource(args.file) as source:
+        slice_size = source.chunk_bytes(args.chunk_ms)
+        duration_ms = source.duration_ms
+    chunks = args.streams * -(-duration_ms // args.chunk_ms)
+    for name, fn, arg in (("f.read", read_loop, slice_size), ("AudioSource", source_loop, args.chunk_ms)):
+        cost, peak = measure(fn, args.file, args.streams, arg)
+        print("%-12s %d streams x %d ms  %8.0f chunks/s  %6.2f us/chunk  peak heap %8.1f KiB" % (
+            name, args.streams, duration_ms, chunks / cost, cost / chunks * 1e6, peak / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# 客户端 VAD（common.vad.EnergyVad）效果与开销：节省的上传字节、语音帧保留率、每小时音频的处理耗时。
+#
+#   python client_vad_benchmark.py                      # 合成 10 分钟“通话”：语音段之间约一半为带底噪的静音
+#   python client_vad_benchmark.py --input call.wav     # 16bit 单声道 wav
+#   python client_vad_benchmark.py --hangover-ms 800 --keepalive-ms 0
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import sys
+sys.path.append("../..")
+from common.vad import EnergyVad
+from common.wav import parse_wav_header
+
+
+def synthesize(sample_rate, seconds, silence_ratio, seed=1):
+    '''语音段用带包络的多谐波+噪声模拟，静音段为 -60dBFS 左右的底噪；返回 (pcm, 语音区间列表)'''
+    rng = np.random.RandomState(seed)
+    random.seed(seed)
+    parts = []
+    speech = []
+    pos = 0
+    total = sample_rate * seconds
+    while pos < total:
+        talk = int(sample_rate * random.uniform(1.0, 6.0))
+        pause = int(talk * silence_ratio / (1 - silence_ratio) * random.uniform(0.5, 1.5))
+        t = np.arange(talk) / float(sample_rate)
+        f0 = random.uniform(100, 250)
+        voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        envelope = np.abs(np.sin(2 * np.pi * t * random.uniform(2, 4))) * 0.8 + 0.2
+        voice = voice * envelope * 6000 + rng.normal(0, 300, talk)
+        parts.append(voice)
+        speech.append((pos, pos + talk))
+        parts.append(rng.normal(0, 30, pause))
+        pos += talk + pause
+    pcm = np.clip(np.concatenate(parts)[:total], -32768, 32767).astype('<i2')
+    return pcm.tobytes(), speech
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="16bit 单声道 wav")
+    parser.add_argument("--seconds", type=int, default=600)
+    parser.add_argument("--silence", type=float, default=0.5, help="合成音频中静音所占比例")
+    parser.add_argument("--chunk-ms", type=int, default=40, help="每次 write() 的音频时长")
+    parser.add_argument("--hangover-ms", type=int, default=1200)
+    parser.add_argument("--preroll-ms", type=int, default=300)
+    parser.add_argument("--keepalive-ms", type=int, default=1000)
+    args = parser.parse_args()
+
+    speech = None
+    if args.input:
+        with open(args.input, "rb") as f:
+            buf = f.read()
+        info = parse_wav_header(buf)
+        if info.channels != 1 or info.bits_per_sample != 16:
+            raise SystemExit("need 16bit mono wav")
+        sample_rate = info.sample_rate
+        pcm = buf[info.data_offset:info.data_offset + info.data_size]
+    else:
+        sample_rate = 16000
+        pcm, speech = synthesize(sample_rate, args.seconds, args.silence)
+
+    vad = EnergyVad(sample_rate, hangover_ms=args.hangover_ms, preroll_ms=args.preroll_ms,
+                    keepalive_ms=args.keepalive_ms)
+    chunk = sample_rate * args.chunk_ms // 1000 * 2
+    sent = 0
+    start = time.perf_counter()
+    for i in range(0, len(pcm), chunk):
+        sent += len(vad.process(pcm[i:i + chunk]))
+    sent += len(vad.flush())
+    cost = time.perf_counter() - start
+
+    audio_seconds = len(pcm) / 2.0 / sample_rate
+    print("audio %.0f s  chunks %d  sent %.1f%%  saved %.1f%% (%d bytes)  segments %d  keepalive %d" % (
+        audio_seconds, (len(pcm) + chunk - 1) // chunk, 100.0 * sent / len(pcm),
+        100.0 * vad.bytes_saved / len(pcm), vad.bytes_saved, vad.speech_segments, vad.keepalive_frames))
+    print("vad cost %.1f ms total, %.2f ms per audio minute, %.1f us per write()" % (
+        cost * 1000, cost * 1000 * 60 / audio_seconds, cost * 1e6 * chunk / len(pcm)))
+
+    if speech is not None:
+        # 用 stream_time 把已上传音频映射回原始时间轴，统计语音采样被保留的比例
+        frame = vad.frame_ms
+        kept = np.zeros(len(pcm) // 2, dtype=bool)
+        for sent_ms in range(0, vad._sent_ms, frame):
+            origin = vad.stream_time(sent_ms) * sample_rate // 1000
+            kept[origin:origin + frame * sample_rate // 1000] = True
+        total = sum(e - s for s, e in speech)
+        covered = sum(int(kept[s:e].sum()) for s, e in speech)
+        print("speech samples kept %.2f%%" % (100.0 * covered / total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# FlashRecognizer 连接池对比：每次 requests.post 新建连接 vs 复用 keep-alive 连接池。
+# 本地 HTTPS 替身服务（自签名证书，需要 openssl 命令），不访问腾讯云：
+#   python flash_pool_benchmark.py --requests 500 --concurrency 4
+
+import argparse
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+sys.path.append("../..")
+from common import credential
+from asr import flash_recognizer
+
+HOST = "127.0.0.1"
+AUDIO = b"\0" * 32000
+
+_RESULT = json.dumps({
+    "request_id": "bench", "code": 0, "message": "success", "audio_duration": 1000,
+    "flash_result": [{"text": "测试", "channel_id": 0, "sentence_list": []}],
+}).encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_RESULT)))
+        self.end_headers()
+        self.wfile.write(_RESULT)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(workdir):
+    cert = os.path.join(workdir, "cert.pem")
+    key = os.path.join(workdir, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                    "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=127.0.0.1"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server = ThreadingHTTPServer((HOST, 0), _Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+
+class BenchRecognizer(flash_recognizer.FlashRecognizer):
+
+    def __init__(self, appid, credential, port):
+        flash_recognizer.FlashRecognizer.__init__(self, appid, credential)
+        self.port = port
+
+    def _build_req_with_signature(self, secret_key, params, header):
+        url = flash_recognizer.FlashRecognizer._build_req_with_signature(
+            self, secret_key, params, header)
+        return url.replace("https://asr.cloud.tencent.com",
+                           "https://%s:%d" % (HOST, self.port), 1)
+
+
+class _UnpooledTransport(object):
+    """原有行为：每个请求单独 requests.post，重新 DNS/TCP/TLS"""
+
+    def post(self, url, **kwargs):
+        with requests.Session() as session:
+            session.trust_env = False
+            return session.post(url, verify=False, **kwargs)
+
+
+def run(recognizer, total, concurrency):
+    req = flash_recognizer.FlashRecognitionRequest("16k_zh")
+    req.set_voice_format("pcm")
+    begin = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in pool.map(lambda _: recognizer.recognize(req, AUDIO), range(total)):
+            pass
+    return total / (time.time() - begin)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    urllib3.disable_warnings()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        server = start_server(workdir)
+        port = server.server_address[1]
+        cred = credential.Credential("bench", "bench")
+
+        unpooled = BenchRecognizer("1", cred, port)
+        unpooled.set_session(_UnpooledTransport())
+
+        pooled = BenchRecognizer("1", cred, port)
+        pooled.set_pool_size(args.concurrency)
+        # 自签名证书：关闭校验，同时忽略环境变量中的 CA 配置
+        session = pooled._get_session()
+        session.verify = False
+        session.trust_env = False
+
+        print("%-10s %12s" % ("transport", "requests/s"))
+        print("%-10s %12.1f" % ("unpooled", run(unpooled, args.requests, args.concurrency)))
+        print("%-10s %12.1f" % ("pooled", run(pooled, args.requests, args.concurrency)))
+        pooled.close()
+        server.shutdown()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# recognize_long 切分的回归检查（不访问网络）：各 search_ms 下切分区间首尾相接、覆盖整段音频、
+# 按块对齐，且切点落在目标位置前后 search_ms 内；有 numpy 与纯 Python 两条路径都检查。
+#
+#   python flash_split_check.py
+
+import array
+import math
+
+import sys
+sys.path.append("../..")
+from asr import flash_recognizer
+
+
+def make_pcm(seconds, sample_rate=16000):
+    samples = array.array('h', (int(8000 * math.sin(i * 0.05)) for i in range(sample_rate * seconds)))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def check(pcm, sample_rate, block_align, segment_ms, search_ms):
+    bounds = flash_recognizer._split_pcm(pcm, sample_rate, block_align, segment_ms, search_ms)
+    total = len(pcm) - len(pcm) % block_align
+    assert bounds[0][0] == 0 and bounds[-1][1] == total, bounds
+    for (_, end), (start, _) in zip(bounds, bounds[1:]):
+        assert end == start and end % block_align == 0, bounds
+    segment_bytes = sample_rate * segment_ms // 1000 * block_align
+    search_bytes = sample_rate * max(search_ms, 20) // 1000 * block_align
+    for i, (start, end) in enumerate(bounds[:-1]):
+        assert start < end, bounds
+        assert abs(end - start - segment_bytes) <= search_bytes, (i, start, end)
+    return len(bounds)
+
+
+def main():
+    pcm = make_pcm(35)
+    for use_numpy in (True, False):
+        saved = flash_recognizer.np
+        if not use_numpy:
+            flash_recognizer.np = None
+        elif saved is None:
+            continue
+        try:
+            for search_ms in (0, 5, 20, 1000):
+                segments = check(pcm, 16000, 2, 10000, search_ms)
+                print("numpy=%-5s search_ms=%-5d segments=%d ok" % (use_numpy, search_ms, segments))
+        finally:
+            flash_recognizer.np = saved
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# common.g711 编解码吞吐，对照组为逐采样调用转换函数的纯 Python 循环。
+# 8kHz 电话音频：每路每秒 8000 个采样，“路数”为单核可实时处理的并发通话数。
+#
+#   python g711_benchmark.py
+#   python g711_benchmark.py --seconds 600 --chunk-ms 20
+
+import argparse
+import os
+import time
+
+import sys
+sys.path.append("../..")
+from common import g711
+
+
+def per_sample_decode(data, law):
+    convert = g711._DECODE[law]
+    return b"".join(convert(b).to_bytes(2, "little", signed=True) for b in bytearray(data))
+
+
+def measure(fn, chunks):
+    start = time.perf_counter()
+    for chunk in chunks:
+        fn(chunk)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=300, help="音频时长")
+    parser.add_argument("--chunk-ms", type=int, default=20, help="RTP 包时长")
+    args = parser.parse_args()
+
+    sample_rate = 8000
+    chunk = sample_rate * args.chunk_ms // 1000
+    payload = os.urandom(sample_rate * args.seconds)
+    g711_chunks = [payload[i:i + chunk] for i in range(0, len(payload), chunk)]
+
+    for law in (g711.MULAW, g711.ALAW):
+        decoder = g711.G711Decoder(law)
+        encoder = g711.G711Encoder(law)
+        pcm = g711.decode(payload, law)
+        pcm_chunks = [pcm[i:i + chunk * 2] for i in range(0, len(pcm), chunk * 2)]
+        dec = measure(decoder.process, g711_chunks)
+        enc = measure(encoder.process, pcm_chunks)
+        sample = g711_chunks[:max(1, len(g711_chunks) // 50)]
+        slow = measure(lambda c: per_sample_decode(c, law), sample) * len(g711_chunks) / len(sample)
+        print("%-5s decode %7.1f M samples/s (%6d channels)  encode %7.1f M samples/s (%6d channels)  "
+              "per-sample python decode %5.2f M samples/s (%4d channels)" % (
+                  law, len(payload) / dec / 1e6, args.seconds / dec,
+                  len(payload) / enc / 1e6, args.seconds / enc,
+                  len(payload) / slow / 1e6, args.seconds / slow))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# 对比 common.json_codec 各实现（orjson/ujson/标准库 json）的解码耗时（开启 word_info 的识别结果），
+# 以及流式合成每个文本片段发送一条的控制消息编码耗时。
+#
+#   python json_codec_benchmark.py                          # 合成 v1/v2 开启 word_info 的消息
+#   python json_codec_benchmark.py --input recorded.jsonl   # 每行一条录制的服务端消息
+#   python json_codec_benchmark.py --rounds 5
+
+import argparse
+import time
+import uuid
+
+import sys
+sys.path.append("../..")
+from common import json_codec
+from common import results
+from result_memory_benchmark import load_recorded, synthesize
+
+
+def best_of(rounds, fn, items):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="录制的服务端消息，jsonl 格式")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=12)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    messages = load_recorded(args.input) if args.input else synthesize(args.messages, args.words)
+    frames = [{"session_id": str(uuid.uuid4()), "message_id": str(uuid.uuid4()),
+               "action": "ACTION_SYNTHESIS", "data": u"大模型输出的第%d个文本片段，" % i}
+              for i in range(len(messages))]
+    print("messages=%d bytes=%d" % (len(messages), sum(len(m) for m in messages)))
+
+    baseline = None
+    for name in (json_codec.STDLIB, json_codec.UJSON, json_codec.ORJSON):
+        try:
+            json_codec.set_json_codec(name)
+        except ValueError:
+            print("%-7s not installed" % name)
+            continue
+        decode = best_of(args.rounds, json_codec.loads, messages)
+        encode = best_of(args.rounds, json_codec.dumps, frames)
+        baseline = baseline or decode
+        print("%-7s decode %7.1f ms (%5.2fx)  %5.2f us/msg   encode %6.1f ms  %5.2f us/msg" % (
+            name, decode * 1000, baseline / decode, decode * 1e6 / len(messages),
+            encode * 1000, encode * 1e6 / len(frames)))
+    json_codec.set_json_codec(json_codec.AUTO)
+
+    typed = best_of(args.rounds, results.loads, messages)
+    print("typed   decode %7.1f ms (%5.2fx)  %5.2f us/msg   (common.results，标准库 object_hook)" % (
+        typed * 1000, baseline / typed, typed * 1e6 / len(messages)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# 对比 SpeechRecognizer 每会话一线程 与 WebSocketReactor 多路复用 两种模式：
+# 线程数、RSS、建连耗时 p99（start() -> OPENED）以及回调延迟 p99（服务端发出结果 -> 客户端回调被调用）。
+#
+# 使用本地替身 websocket 服务（独立进程），不访问腾讯云：
+#   python reactor_benchmark.py                       # 100/1000/5000 会话，两种模式，ws:// 明文
+#   python reactor_benchmark.py --sessions 1000 --mode reactor --io-threads 2
+#   python reactor_benchmark.py --tls --handshake-delay-ms 200   # wss://，服务端延迟 200ms 才回 101，模拟公网握手耗时
+#
+# --tls 需要 openssl 命令行生成临时自签名证书。
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import ssl
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append("../..")
+from common import credential
+from common.ws_reactor import WebSocketReactor
+from asr import speech_recognizer
+
+HOST = "127.0.0.1"
+PORT = 18765
+SLICE_SIZE = 640
+SLICE_INTERVAL = 0.04
+SLICES = 50
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+# ---------------------------------------------------------------------------
+# 替身服务：收到每个音频帧回一个 slice_type=1 结果，收到 end 回 final 并关闭
+# ---------------------------------------------------------------------------
+async def _read_frame(reader):
+    b1, b2 = await reader.readexactly(2)
+    length = b2 & 0x7f
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if b2 & 0x80 else None
+    payload = bytearray(await reader.readexactly(length))
+    if mask:
+        for i in range(length):
+            payload[i] ^= mask[i % 4]
+    return b1 & 0x0f, bytes(payload)
+
+
+def _frame(opcode, payload):
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return head + payload
+
+
+async def _serve_conn(reader, writer, delay):
+    try:
+        key = b""
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            if line.lower().startswith(b"sec-websocket-key:"):
+                key = line.split(b":", 1)[1].strip()
+        if delay:
+            await asyncio.sleep(delay)
+        accept = base64.b64encode(hashlib.sha1(key + _GUID).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        index = 0
+        while True:
+            opcode, payload = await _read_frame(reader)
+            if opcode == 0x2:
+                index += 1
+                msg = {"code": 0, "message": "%.6f" % time.time(), "voice_id": "",
+                       "result": {"slice_type": 1, "index": 0, "start_time": 0,
+                                  "end_time": index * 40, "voice_text_str": "测试" * 4,
+                                  "word_size": 0, "word_list": []}}
+                writer.write(_frame(0x1, json.dumps(msg).encode("utf-8")))
+            elif opcode == 0x1:
+                msg = {"code": 0, "message": "%.6f" % time.time(), "voice_id": "", "final": 1}
+                writer.write(_frame(0x1, json.dumps(msg).encode("utf-8")))
+                writer.write(_frame(0x8, struct.pack("!H", 1000)))
+                await writer.drain()
+                break
+            elif opcode == 0x8:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    writer.close()
+
+
+def _make_cert(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.check_call(
+        ["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+         "-nodes", "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=" + HOST,
+         "-addext", "subjectAltName=IP:" + HOST],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def _run_server(ready, cert, key, delay):
+    _raise_nofile()
+    ssl_ctx = None
+    if cert:
+        ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_ctx.load_cert_chain(cert, key)
+
+    async def main():
+        server = await asyncio.start_server(
+            lambda r, w: _serve_conn(r, w, delay), HOST, PORT, backlog=8192, ssl=ssl_ctx)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+# ---------------------------------------------------------------------------
+# 客户端
+# ---------------------------------------------------------------------------
+class BenchRecognizer(speech_recognizer.SpeechRecognizer):
+    scheme = "ws"
+
+    def create_query_string(self, param):
+        return "%s://%s:%d/asr/v2/bench?voice_id=%s" % (self.scheme, HOST, PORT, self.voice_id)
+
+
+class BenchListener(speech_recognizer.SpeechRecognitionListener):
+
+    def __init__(self, latencies):
+        self.latencies = latencies
+        self.completed = False
+
+    def on_recognition_result_change(self, response):
+        self.latencies.append(time.time() - float(response['message']))
+
+    def on_recognition_complete(self, response):
+        self.completed = True
+        self.latencies.append(time.time() - float(response['message']))
+
+
+def _raise_nofile():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def run_client(mode, sessions, io_threads, cert, connect_timeout):
+    _raise_nofile()
+    logging_off()
+    reactor = None
+    if cert:
+        # 线程模式下 websocket-client 从该环境变量读取 CA
+        os.environ["WEBSOCKET_CLIENT_CA_BUNDLE"] = cert
+        BenchRecognizer.scheme = "wss"
+    if mode == "reactor":
+        ssl_ctx = ssl.create_default_context(cafile=cert) if cert else None
+        reactor = WebSocketReactor(io_threads=io_threads, connect_timeout=connect_timeout,
+                                   ssl_context=ssl_ctx)
+    latencies = []
+    cred = credential.Credential("bench", "bench")
+    recognizers = []
+    begin = time.time()
+    for i in range(sessions):
+        rec = BenchRecognizer("1", cred, "16k_zh", BenchListener(latencies))
+        if reactor is not None:
+            rec.set_reactor(reactor)
+        rec.start()
+        recognizers.append(rec)
+    opens = []
+    pending = recognizers
+    deadline = time.time() + 60
+    while pending and time.time() < deadline:
+        time.sleep(0.01)
+        now = time.time()
+        still = []
+        for r in pending:
+            if r.status == speech_recognizer.STARTED:
+                still.append(r)
+            elif r.status == speech_recognizer.OPENED:
+                opens.append(now - begin)
+        pending = still
+
+    audio = b"\0" * SLICE_SIZE
+    threads = rss = 0
+    for n in range(SLICES):
+        begin = time.time()
+        for rec in recognizers:
+            rec.write(audio)
+        if n == SLICES // 2:
+            threads = threading.active_count()
+            rss = _rss_mb()
+        time.sleep(max(0, SLICE_INTERVAL - (time.time() - begin)))
+    for rec in recognizers:
+        rec.stop()
+    if reactor is not None:
+        reactor.stop()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    opened = sum(1 for r in recognizers if r.listener.completed)
+    opens.sort()
+    open_p99 = opens[int(len(opens) * 0.99)] * 1000 if opens else 0
+    print(json.dumps({"mode": mode, "sessions": sessions, "ok": opened,
+                      "threads": threads, "rss_mb": round(rss, 1),
+                      "open_p99_ms": round(open_p99, 1),
+                      "callbacks": len(latencies), "p50_ms": round(p50, 2),
+                      "p99_ms": round(p99, 2)}))
+
+
+def logging_off():
+    from common.log import logger
+    logger.setLevel("ERROR")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["thread", "reactor"])
+    parser.add_argument("--sessions", type=int)
+    parser.add_argument("--io-threads", type=int, default=1)
+    parser.add_argument("--tls", action="store_true", help="使用 wss://")
+    parser.add_argument("--handshake-delay-ms", type=int, default=0,
+                        help="服务端延迟多久回复 101，模拟握手往返耗时")
+    parser.add_argument("--connect-timeout", type=int, default=10, help="reactor 建连时限，单位秒")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cert", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_client(args.mode, args.sessions, args.io_threads, args.cert, args.connect_timeout)
+        return
+
+    cert = key = None
+    if args.tls:
+        cert, key = _make_cert(tempfile.mkdtemp())
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=_run_server, args=(ready, cert, key, args.handshake_delay_ms / 1000.0))
+    server.daemon = True
+    server.start()
+    ready.wait()
+
+    sizes = [args.sessions] if args.sessions else [100, 1000, 5000]
+    modes = [args.mode] if args.mode else ["thread", "reactor"]
+    print("%-8s %8s %6s %8s %9s %12s %10s %9s %9s" % (
+        "mode", "sessions", "ok", "threads", "rss_mb", "open_p99_ms", "callbacks", "p50_ms", "p99_ms"))
+    for sessions in sizes:
+        for mode in modes:
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--mode", mode,
+                   "--sessions", str(sessions), "--io-threads", str(args.io_threads),
+                   "--connect-timeout", str(args.connect_timeout)]
+            if cert:
+                cmd += ["--cert", cert]
+            out = subprocess.run(cmd,
+                stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+            lines = out.stdout.decode("utf-8").strip().splitlines()
+            if not lines:
+                print("%-8s %8d failed" % (mode, sessions))
+                continue
+            r = json.loads(lines[-1])
+            print("%-8s %8d %6d %8d %9.1f %12.1f %10d %9.2f %9.2f" % (
+                r["mode"], r["sessions"], r["ok"], r["threads"], r["rss_mb"], r["open_p99_ms"],
+                r["callbacks"], r["p50_ms"], r["p99_ms"]))
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import sys
+from datetime import datetime
+
+sys.path.append("../..")
+from common import credential
+from asr.async_recognizer import AsyncRealtimeRecognizerV2
+
+APPID = ""
+SECRET_ID = ""
+SECRET_KEY = ""
+ENGINE_MODEL_TYPE = "16k_zh"
+SLICE_SIZE = 6400
+
+
+async def send_audio(recognizer, audio):
+    with open(audio, 'rb') as f:
+        content = f.read(SLICE_SIZE)
+        while content:
+            await recognizer.write(content)
+            content = f.read(SLICE_SIZE)
+            await asyncio.sleep(0.2)
+    # 发送 end 并等待 final
+    await recognizer.stop()
+
+
+async def process(id):
+    audio = "test.pcm"
+    credential_var = credential.Credential(SECRET_ID, SECRET_KEY)
+    recognizer = AsyncRealtimeRecognizerV2(APPID, credential_var, ENGINE_MODEL_TYPE)
+    recognizer.set_voice_format(1)  # PCM
+    recognizer.set_need_vad(1)
+
+    async with recognizer:
+        sender = asyncio.ensure_future(send_audio(recognizer, audio))
+        async for event in recognizer.events():
+            if event.get('code', 0) != 0:
+                print("%s|%s|OnFail code=%d message=%s" % (
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    event['voice_id'], event['code'], event.get('message', '')))
+                break
+            for s in event.get('sentences', {}).get('sentence_list', []):
+                print("%s|%s|sentence_id=%d type=%d text=%s" % (
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    event['voice_id'],
+                    s.get('sentence_id', 0),
+                    s.get('sentence_type', 0),
+                    s.get('sentence', '')))
+        await sender
+
+
+async def process_many(number):
+    # 多个会话共享同一个事件循环，不额外创建线程
+    await asyncio.gather(*[process(i) for i in range(number)])
+
+
+if __name__ == "__main__":
+    asyncio.run(process(0))
+    # asyncio.run(process_many(20))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# common.audio 预处理吞吐：下混 + 多相重采样 + int16 转换，单位为每秒处理的输入采样数（按声道合计）。
+# 对照组为逐采样线性插值的纯 Python 实现（只跑前几秒，按比例折算）。
+#
+#   python resample_benchmark.py
+#   python resample_benchmark.py --seconds 60 --chunk-ms 20 --taps 48
+
+import argparse
+import array
+import time
+
+import numpy as np
+
+import sys
+sys.path.append("../..")
+from common.audio import AudioPreprocessor
+
+
+def python_linear(pcm, src_rate, channels, dst_rate):
+    '''对照：逐采样下混并线性插值'''
+    samples = array.array('h', pcm)
+    mono = [sum(samples[i:i + channels]) / channels for i in range(0, len(samples), channels)]
+    out = array.array('h')
+    step = float(src_rate) / dst_rate
+    pos = 0.0
+    while pos < len(mono) - 1:
+        i = int(pos)
+        frac = pos - i
+        out.append(int(mono[i] * (1 - frac) + mono[i + 1] * frac))
+        pos += step
+    return out.tobytes()
+
+
+def make_input(src_rate, channels, seconds):
+    rng = np.random.RandomState(1)
+    t = np.arange(src_rate * seconds) / float(src_rate)
+    tone = np.sin(2 * np.pi * 440 * t)[:, None] * 8000 + rng.normal(0, 500, (len(t), channels))
+    return tone.astype('<i2').tobytes()
+
+
+def run(src_rate, channels, dst_rate, seconds, chunk_ms, taps):
+    pcm = make_input(src_rate, channels, seconds)
+    chunk = src_rate * chunk_ms // 1000 * channels * 2
+    pre = AudioPreprocessor(src_rate, channels, dst_rate, taps=taps)
+    start = time.perf_counter()
+    out = 0
+    for i in range(0, len(pcm), chunk):
+        out += len(pre.process(memoryview(pcm)[i:i + chunk]))
+    out += len(pre.flush())
+    cost = time.perf_counter() - start
+    samples = len(pcm) // 2
+
+    short = pcm[:src_rate * channels * 2 * min(seconds, 3)]
+    start = time.perf_counter()
+    python_linear(short, src_rate, channels, dst_rate)
+    py_cost = (time.perf_counter() - start) * len(pcm) / len(short)
+
+    print("%5d Hz x%d -> %5d Hz  numpy %6.1f M samples/s (%6.0fx realtime)   "
+          "pure python %5.2f M samples/s   out %d bytes" % (
+              src_rate, channels, dst_rate, samples / cost / 1e6, seconds / cost,
+              samples / py_cost / 1e6, out))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=30)
+    parser.add_argument("--chunk-ms", type=int, default=100, help="每次 process() 的音频时长")
+    parser.add_argument("--taps", type=int, default=32)
+    args = parser.parse_args()
+    for src_rate, channels, dst_rate in ((48000, 2, 16000), (44100, 2, 16000), (48000, 1, 8000),
+                                         (8000, 1, 16000), (16000, 2, 16000)):
+        run(src_rate, channels, dst_rate, args.seconds, args.chunk_ms, args.taps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# 对比 common.json_codec 解码得到的嵌套 dict 与 common.results 带 __slots__ 的类型化结果：
+# 解码耗时、遍历耗时，以及遍历后保留全部消息时的内存占用（tracemalloc）。
+# 类型化结果的词列表在首次读取时才转换，“/text” 一行只读句子文本、不读词。
+#
+#   python result_memory_benchmark.py                          # 合成 v1/v2 开启 word_info 的消息
+#   python result_memory_benchmark.py --input recorded.jsonl   # 每行一条录制的服务端消息
+#   python result_memory_benchmark.py --messages 50000 --words 20
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+sys.path.append("../..")
+from common import json_codec
+from common import results
+
+
+def _words(n, start):
+    return [{"word": u"词%d" % i, "start_time": start + i * 200, "end_time": start + i * 200 + 180,
+             "stable_flag": 1} for i in range(n)]
+
+
+def synthesize(count, words):
+    messages = []
+    for i in range(count):
+        start = i * 3000
+        if i % 2 == 0:
+            messages.append(json.dumps({
+                "code": 0, "message": "success", "voice_id": "benchmark", "message_id": "benchmark_%d" % i,
+                "result": {"slice_type": 1, "index": i, "start_time": start, "end_time": start + 2800,
+                           "voice_text_str": u"腾讯云实时语音识别第%d句" % i, "word_size": words,
+                           "word_list": _words(words, start)},
+                "final": 0}, ensure_ascii=False))
+        else:
+            messages.append(json.dumps({
+                "code": 0, "message": "success", "voice_id": "benchmark", "type": "sentences",
+                "sentences": {"sentence_list": [{
+                    "sentence": u"腾讯云实时语音识别第%d句" % i, "sentence_type": 1, "sentence_id": i,
+                    "speaker_id": i % 3, "start_time": start, "end_time": start + 2800,
+                    "word_list": _words(words, start)}]}}, ensure_ascii=False))
+    return messages
+
+
+def load_recorded(path):
+    with open(path, "rb") as f:
+        return [line.strip().decode("utf-8") for line in f if line.strip()]
+
+
+def walk(response):
+    '''按 listener 的典型用法读取文本与词，两种表示都使用下标访问'''
+    count = 0
+    result = response.get("result")
+    if result is not None:
+        count += len(result["voice_text_str"])
+        for word in result.get("word_list") or []:
+            count += word["end_time"] - word["start_time"]
+    sentences = response.get("sentences")
+    if sentences is not None:
+        for sentence in sentences.get("sentence_list") or []:
+            count += len(sentence["sentence"])
+            for word in sentence.get("word_list") or []:
+                count += word["end_time"] - word["start_time"]
+    return count
+
+
+def walk_attrs(response):
+    '''类型化结果直接使用属性访问'''
+    count = 0
+    result = response.get("result")
+    if result is not None:
+        count += len(result.voice_text_str)
+        for word in result.word_list or []:
+            count += word.end_time - word.start_time
+    sentences = response.get("sentences")
+    if sentences is not None:
+        for sentence in sentences.get("sentence_list") or []:
+            count += len(sentence.sentence)
+            for word in sentence.word_list or []:
+                count += word.end_time - word.start_time
+    return count
+
+
+def walk_text(response):
+    '''只读取文本的 listener，不访问词列表'''
+    count = 0
+    result = response.get("result")
+    if result is not None:
+        count += len(result["voice_text_str"])
+    sentences = response.get("sentences")
+    if sentences is not None:
+        for sentence in sentences.get("sentence_list") or []:
+            count += len(sentence["sentence"])
+    return count
+
+
+def measure(name, loads, messages, walk=walk):
+    gc.collect()
+    start = time.perf_counter()
+    decoded = [loads(m) for m in messages]
+    decode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    checksum = sum(walk(r) for r in decoded)
+    walk_time = time.perf_counter() - start
+    del decoded
+
+    gc.collect()
+    tracemalloc.start()
+    decoded = [loads(m) for m in messages]
+    for r in decoded:
+        walk(r)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+
+    print("%-11s decode %7.1f ms  walk %6.1f ms  retained %8.1f MiB  (%d B/msg)  checksum=%d" % (
+        name, decode_time * 1000, walk_time * 1000, retained / 1048576.0,
+        retained // max(1, len(messages)), checksum))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="录制的服务端消息，jsonl 格式")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=12)
+    args = parser.parse_args()
+
+    messages = load_recorded(args.input) if args.input else synthesize(args.messages, args.words)
+    print("messages=%d bytes=%d codec=%s" % (len(messages), sum(len(m) for m in messages),
+                                             json_codec.codec_name()))
+    measure("dict", json_codec.loads, messages)
+    measure("typed", results.loads, messages)
+    if not args.input:
+        measure("typed.a", results.loads, messages, walk_attrs)
+    measure("dict/text", json_codec.loads, messages, walk_text)
+    measure("typed/text", results.loads, messages, walk_text)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 import urllib
 
@@ -12,6 +11,9 @@ import websocket
 import uuid
 from urllib.parse import quote
 from common.log import logger
+from common import json_codec
+from common import results
+from common.state import OPEN_TIMEOUT, SessionStatus, session_state
 
 
 def is_python3():
@@ -84,6 +86,8 @@ def quote_autho(autho):
 # 实时识别使用
 class SpeakingAssessment:
 
+    status = SessionStatus()
+
     def __init__(self, appid, credential, engine_model_type, listener):
         self.result = ""
         self.credential = credential
@@ -95,6 +99,7 @@ class SpeakingAssessment:
         self.voice_id = ""
         self.new_start = 0
         self.listener = listener
+        self.typed_results = False
         self.text_mode = 0
         self.ref_text = ""
         self.keyword = ""
@@ -103,6 +108,7 @@ class SpeakingAssessment:
         self.sentence_info_enabled = 0
         self.voice_format = 0
         self.nonce = ""
+        self.open_timeout = OPEN_TIMEOUT
         self.rec_mode = 0
 
     def set_text_mode(self, text_mode):
@@ -129,6 +135,15 @@ class SpeakingAssessment:
     def set_nonce(self, nonce):
         self.nonce = nonce
 
+    #write() 等待建连的上限（秒），超时或连接出错时 write() 抛出 RuntimeError
+    def set_open_timeout(self, open_timeout):
+        self.open_timeout = open_timeout
+
+    #开启后 listener 收到的消息中的单词得分解码为 common.results 中带 __slots__ 的对象，
+    #仍支持原来的下标访问，需要 dict 时调用 as_dict()
+    def set_typed_results(self, enable):
+        self.typed_results = enable
+
     def format_sign_string(self, param):
         signstr = "soe.cloud.tencent.com/soe/api/"
         for t in param:
@@ -198,7 +213,7 @@ class SpeakingAssessment:
     def stop(self):
         if self.status == OPENED:
             msg = {'type': "end"}
-            text_str = json.dumps(msg)
+            text_str = json_codec.dumps(msg)
             self.ws.sock.send(text_str)
         if self.ws:
             if self.wst and self.wst.is_alive():
@@ -206,15 +221,16 @@ class SpeakingAssessment:
         self.ws.close()
 
     def write(self, data):
-        while self.status == STARTED:
-            time.sleep(0.1)
+        session_state(self).wait_ready((STARTED,), self.open_timeout)
         if self.status == OPENED:
             self.ws.sock.send_binary(data)
+        else:
+            session_state(self).raise_error()
 
     def start(self):
         def on_message(ws, message):
             # print(message)
-            response = json.loads(message)
+            response = results.loads(message, results.SOE) if self.typed_results else json_codec.loads(message)
             response['voice_id'] = self.voice_id
             if response['code'] != 0:
                 logger.error("%s server recognition fail %s" %
@@ -239,7 +255,7 @@ class SpeakingAssessment:
                 return
             logger.error("websocket error %s  voice id %s" %
                          (format(error), self.voice_id))
-            self.status = ERROR
+            session_state(self).set(ERROR, error)
 
         def on_close(ws):
             self.status = CLOSED
@@ -267,10 +283,10 @@ class SpeakingAssessment:
         self.ws = websocket.WebSocketApp(requrl, None,
                                          on_error=on_error, on_close=on_close, on_message=on_message)
         self.ws.on_open = on_open
+        session_state(self).reset(STARTED)
         self.wst = threading.Thread(target=self.ws.run_forever)
         self.wst.daemon = True
         self.wst.start()
-        self.status = STARTED
         response = {'voice_id': self.voice_id}
         self.listener.on_recognition_start(response)
         logger.info("%s recognition start" % response['voice_id'])
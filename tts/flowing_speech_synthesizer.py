@@ -4,12 +4,14 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 import websocket
 import uuid
 import urllib
 from common.log import logger
+from common import json_codec
+from common import results
+from common.state import SessionStatus, session_state
 from common.utils import is_python3
 
 
@@ -62,6 +64,8 @@ FlowingSpeechSynthesizer_ACTION_RESET = "ACTION_RESET"
 
 class FlowingSpeechSynthesizer:
 
+    status = SessionStatus()
+
     def __init__(self, appid, credential, listener):
         self.appid = appid
         self.credential = credential
@@ -69,8 +73,12 @@ class FlowingSpeechSynthesizer:
         self.ws = None
         self.wst = None
         self.listener = listener
+        self.typed_results = False
 
         self.ready = False
+        # 最近一次收到服务端帧的时间与收到 RESET 确认的次数，供连接池判断连接是否存活
+        self.last_recv_time = 0
+        self.reset_count = 0
 
         self.voice_type = 0
         self.codec = "pcm"
@@ -106,6 +114,11 @@ class FlowingSpeechSynthesizer:
     def set_enable_subtitle(self, enable_subtitle):
         self.enable_subtitle = enable_subtitle
 
+    #开启后 listener 收到的消息中的字幕解码为 common.results 中带 __slots__ 的对象，
+    #仍支持原来的下标访问，需要 dict 时调用 as_dict()
+    def set_typed_results(self, enable):
+        self.typed_results = enable
+
     def __gen_signature(self, params):
         sort_dict = sorted(params.keys())
         sign_str = "GET" + _HOST + _PATH + "?"
@@ -174,7 +187,7 @@ class FlowingSpeechSynthesizer:
     
     def __do_send(self, action, text):
         WSRequestMessage = self.__new_ws_request_message(action, text)
-        data = json.dumps(WSRequestMessage)
+        data = json_codec.dumps(WSRequestMessage)
         opcode = websocket.ABNF.OPCODE_TEXT
         logger.info("ws send opcode={} data={}".format(opcode, data))
         self.ws.send(data, opcode)
@@ -192,14 +205,11 @@ class FlowingSpeechSynthesizer:
         self.__do_send(action, "")
 
     def wait_ready(self, timeout_ms):
-        timeout_start = int(time.time() * 1000)
-        while True:
-            if self.ready:
-                return True
-            if int(time.time() * 1000) - timeout_start > timeout_ms:
-                break
-            time.sleep(0.01)
-        return False
+        # 收到 READY 立即返回；连接出错或关闭时不再等到超时
+        session_state(self).wait(
+            lambda: self.ready or self.status in (FINAL, ERROR, CLOSED),
+            timeout_ms / 1000.0)
+        return self.ready
 
     def start(self):
         logger.info("synthesizer start: begin")
@@ -212,11 +222,12 @@ class FlowingSpeechSynthesizer:
 
         def _on_data(ws, data, opcode, flag):
             logger.debug("data={} opcode={} flag={}".format(data, opcode, flag))
+            self.last_recv_time = time.time()
             if opcode == websocket.ABNF.OPCODE_BINARY:
                 self.listener.on_audio_result(data) # <class 'bytes'>
                 pass
             elif opcode == websocket.ABNF.OPCODE_TEXT:
-                resp = json.loads(data) # WSResponseMessage
+                resp = results.loads(data, results.TTS) if self.typed_results else json_codec.loads(data) # WSResponseMessage
                 if resp['code'] != 0:
                     logger.error("server synthesis fail request_id={} code={} msg={}".format(
                         resp['request_id'], resp['code'], resp['message']
@@ -232,9 +243,12 @@ class FlowingSpeechSynthesizer:
                 if "ready" in resp and resp['ready'] == 1:
                     logger.info("recv READY frame")
                     self.ready = True
+                    session_state(self).notify()
                     return
                 if "reset" in resp and resp['reset'] == 1:
                     logger.info("recv RESET frame")
+                    self.reset_count += 1
+                    session_state(self).notify()
                     return
                 if "heartbeat" in resp and resp['heartbeat'] == 1:
                     logger.info("recv HEARTBEAT frame")
@@ -249,7 +263,7 @@ class FlowingSpeechSynthesizer:
         def _on_error(ws, error):
             if self.status == FINAL or self.status == CLOSED:
                 return
-            self.status = ERROR
+            session_state(self).set(ERROR, error)
             logger.error("error={}, session_id={}".format(error, self.session_id))
             _close_conn("after recv error")
 
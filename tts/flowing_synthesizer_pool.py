@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+import time
+
+from common.log import logger
+from common.state import session_state
+from tts.flowing_speech_synthesizer import (
+    FlowingSpeechSynthesizer, FlowingSpeechSynthesisListener, OPENED, FINAL, ERROR, CLOSED)
+
+
+class _IdleListener(FlowingSpeechSynthesisListener):
+    '''池中空闲连接的 listener，丢弃 RESET 之后迟到的音频与字幕'''
+
+    def on_synthesis_start(self, session_id):
+        pass
+
+    def on_synthesis_end(self):
+        pass
+
+    def on_audio_result(self, audio_bytes):
+        pass
+
+    def on_text_result(self, response):
+        pass
+
+
+class _Entry(object):
+
+    def __init__(self, synthesizer):
+        self.synthesizer = synthesizer
+        self.created_time = time.time()
+
+
+class FlowingSynthesizerPool(object):
+    '''
+    FlowingSpeechSynthesizer 预热连接池，按 (voice_type, codec, sample_rate) 分组，
+    每组保持 size 个已收到 READY 的连接，acquire 时直接取出，省去握手与等待 READY 的耗时。
+
+        pool = FlowingSynthesizerPool(APPID, credential, size=2)
+        synthesizer = pool.acquire(1001, listener=listener)
+        synthesizer.process(text)
+        ...
+        pool.release(synthesizer)   # 未 complete 的会话发送 ACTION_RESET 后放回池中
+
+    调用过 complete() 的连接在收到 FINAL 后由客户端关闭，归还时直接丢弃；
+    后台线程补足各组空闲连接，并淘汰出错、被关闭或超过 heartbeat_timeout 秒没有任何服务端帧的连接。
+    setup(synthesizer) 可在建连前设置语速、音量、情感等其余参数。
+    建连与关闭连接都在锁外进行，慢的握手或关闭不会阻塞 acquire()/release()。
+    '''
+
+    def __init__(self, appid, credential, size=2, setup=None,
+                 ready_timeout_ms=5000, reset_timeout_ms=3000, heartbeat_timeout=60):
+        self.appid = appid
+        self.credential = credential
+        self.size = size
+        self.setup = setup
+        self.ready_timeout_ms = ready_timeout_ms
+        self.reset_timeout_ms = reset_timeout_ms
+        self.heartbeat_timeout = heartbeat_timeout
+        # 统计：新建连接数、直接命中预热连接数、RESET 后复用数、淘汰数
+        self.created = 0
+        self.hits = 0
+        self.reused = 0
+        self.evicted = 0
+        self._cond = threading.Condition()
+        self._idle = collections.defaultdict(collections.deque)
+        self._warming = collections.defaultdict(list)
+        self._closed = False
+        self._thread = None
+
+    def prewarm(self, voice_type, codec="pcm", sample_rate=16000):
+        with self._cond:
+            self._idle[(voice_type, codec, sample_rate)]
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def acquire(self, voice_type, codec="pcm", sample_rate=16000, listener=None):
+        '''取出一个已 READY 的合成器；没有空闲连接时当场新建并等待 READY，超时抛出 RuntimeError'''
+        key = (voice_type, codec, sample_rate)
+        synthesizer = None
+        stale = []
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("pool closed")
+            idle = self._idle[key]
+            while idle:
+                entry = idle.popleft()
+                if self._alive(entry):
+                    synthesizer = entry.synthesizer
+                    self.hits += 1
+                    break
+                stale.append(entry)
+            self._ensure_thread()
+            self._cond.notify_all()
+        for entry in stale:
+            self._evict(entry, "stale")
+        if synthesizer is None:
+            synthesizer = self._create(key)
+            if not synthesizer.wait_ready(self.ready_timeout_ms):
+                self._close_synthesizer(synthesizer)
+                raise RuntimeError("synthesizer not ready, error={}".format(session_state(synthesizer).error))
+        synthesizer.listener = listener if listener is not None else FlowingSpeechSynthesisListener()
+        synthesizer.listener.on_synthesis_start(synthesizer.session_id)
+        return synthesizer
+
+    def release(self, synthesizer):
+        '''归还合成器：会话仍在进行时发送 ACTION_RESET，收到确认后放回池中，否则关闭丢弃'''
+        synthesizer.listener = _IdleListener()
+        key = (synthesizer.voice_type, synthesizer.codec, synthesizer.sample_rate)
+        if synthesizer.status != OPENED or self._closed:
+            self._close_synthesizer(synthesizer)
+            return
+        before = synthesizer.reset_count
+        try:
+            synthesizer.reset()
+        except Exception as e:
+            logger.warning("pool reset failed: {}".format(e))
+            self._close_synthesizer(synthesizer)
+            return
+        acked = session_state(synthesizer).wait(
+            lambda: synthesizer.reset_count > before or synthesizer.status in (FINAL, ERROR, CLOSED),
+            self.reset_timeout_ms / 1000.0)
+        if not acked or synthesizer.status != OPENED:
+            self._close_synthesizer(synthesizer)
+            return
+        with self._cond:
+            full = self._closed or len(self._idle[key]) >= self.size
+            if not full:
+                self._idle[key].append(_Entry(synthesizer))
+                self.reused += 1
+                self._cond.notify_all()
+        if full:
+            self._close_synthesizer(synthesizer)
+
+    def idle_count(self, voice_type, codec="pcm", sample_rate=16000):
+        with self._cond:
+            return len(self._idle[(voice_type, codec, sample_rate)])
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            entries = [e for idle in self._idle.values() for e in idle]
+            entries += [e for warming in self._warming.values() for e in warming]
+            self._idle.clear()
+            self._warming.clear()
+            self._cond.notify_all()
+        for entry in entries:
+            self._close_synthesizer(entry.synthesizer)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _create(self, key):
+        synthesizer = FlowingSpeechSynthesizer(self.appid, self.credential, _IdleListener())
+        synthesizer.set_voice_type(key[0])
+        synthesizer.set_codec(key[1])
+        synthesizer.set_sample_rate(key[2])
+        if self.setup is not None:
+            self.setup(synthesizer)
+        synthesizer.start()
+        with self._cond:
+            self.created += 1
+        return synthesizer
+
+    def _alive(self, entry):
+        s = entry.synthesizer
+        last = max(s.last_recv_time, entry.created_time)
+        return s.ready and s.status == OPENED and time.time() - last < self.heartbeat_timeout
+
+    def _evict(self, entry, reason):
+        # 在锁外调用
+        logger.info("pool evict session_id={} reason={}".format(entry.synthesizer.session_id, reason))
+        with self._cond:
+            self.evicted += 1
+        self._close_synthesizer(entry.synthesizer)
+
+    @staticmethod
+    def _close_synthesizer(synthesizer):
+        if synthesizer.ws is not None and synthesizer.status not in (FINAL, CLOSED):
+            try:
+                synthesizer.ws.close()
+            except Exception as e:
+                logger.warning("pool close failed: {}".format(e))
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _maintain(self):
+        interval = min(1.0, self.heartbeat_timeout / 2.0)
+        while True:
+            # 持锁只决定淘汰与新建哪些连接；没有需要处理的连接时在同一次持锁中等待，不会错过通知
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    evict = []
+                    create = []
+                    for key in list(self._idle):
+                        count = self._check(key, evict)
+                        if count > 0:
+                            create.append((key, count))
+                    if evict or create:
+                        break
+                    self._cond.wait(interval)
+            for entry, reason in evict:
+                self._evict(entry, reason)
+            for key, count in create:
+                for _ in range(count):
+                    try:
+                        entry = _Entry(self._create(key))
+                    except Exception as e:
+                        logger.warning("pool create failed: {}".format(e))
+                        with self._cond:
+                            self._cond.wait(interval)
+                        break
+                    with self._cond:
+                        if not self._closed:
+                            self._warming[key].append(entry)
+                            continue
+                    self._close_synthesizer(entry.synthesizer)
+
+    def _check(self, key, evict):
+        # 在 self._cond 内调用：只更新 idle/warming，待淘汰的连接放入 evict，返回该组需要新建的连接数
+        idle = self._idle[key]
+        for entry in list(idle):
+            if not self._alive(entry):
+                idle.remove(entry)
+                evict.append((entry, "heartbeat lost" if entry.synthesizer.status == OPENED else "closed"))
+        warming = self._warming[key]
+        for entry in list(warming):
+            s = entry.synthesizer
+            if s.ready and s.status == OPENED:
+                warming.remove(entry)
+                if len(idle) < self.size:
+                    idle.append(entry)
+                else:
+                    # 归还复用的连接已补满该组
+                    evict.append((entry, "surplus"))
+            elif s.status in (FINAL, ERROR, CLOSED) or \
+                    time.time() - entry.created_time > self.ready_timeout_ms / 1000.0:
+                warming.remove(entry)
+                evict.append((entry, "not ready"))
+        return self.size - len(idle) - len(warming)
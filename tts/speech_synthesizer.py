@@ -4,9 +4,10 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import uuid
 import requests
+from common import json_codec
+from tts.synthesis_cache import SynthesisRecord, synthesis_cache_key
 
 
 def is_python3():
@@ -21,16 +22,37 @@ _PATH = "/stream"
 _ACTION = "TextToStreamAudio"
 
 
+class _SynthesisError(RuntimeError):
+
+    def __init__(self, session_id, code, message):
+        RuntimeError.__init__(self, "synthesis failed, session_id={} code={} message={}".format(
+            session_id, code, message))
+        self.code = code
+        self.message = message
+
+
+def _parse_error(chunk):
+    '''首个分块为 json 时表示服务端返回了错误，返回 (Code, Message)，否则返回 None'''
+    try:
+        rsp = json_codec.loads(chunk)
+        return rsp["Response"]["Error"]["Code"], rsp["Response"]["Error"]["Message"]
+    except Exception:
+        return None
+
+
 class SpeechSynthesisListener:
     '''
     reponse:  
     所有回调均包含session_id字段
     on_message与on_message包含data字段
     on_fail包含Code、Message字段。
+    增量模式(set_incremental)下 on_message 的 data 只包含新到达的音频，并带 offset 字段；
+    on_complete 的 data 为完整音频（accumulate=True）或 None，offset 为音频总字节数。
 
     字段名	     类型    说明
     session_id  String  本次请求id
     data        String  语音数据
+    offset      Integer 增量模式下 data 在完整音频中的起始字节位置
     Code	    String  错误码
     Message	    String  错误信息
     '''
@@ -56,6 +78,9 @@ class SpeechSynthesizer:
         self.volume = 0
         self.speed = 0
         self.listener = listener
+        self.incremental = False
+        self.accumulate = True
+        self.cache = None
 
     def set_voice_type(self, voice_type):
         self.voice_type = voice_type
@@ -72,8 +97,87 @@ class SpeechSynthesizer:
     def set_volume(self, volume):
         self.volume = volume
 
+    #incremental=True 时 on_message 只回调新到达的音频块，accumulate 控制
+    #on_complete 是否带完整音频；默认行为与旧版本一致，每次回调累计的全部音频
+    def set_incremental(self, incremental, accumulate=False):
+        self.incremental = incremental
+        self.accumulate = accumulate
+
+    #合成结果缓存，需提供 get(key)/put(key, value)，如 common.cache.TieredCache；
+    #命中时直接回放缓存的音频，不请求服务端，None 表示关闭
+    def set_cache(self, cache):
+        self.cache = cache
+
     def synthesis(self, text):
         session_id = str(uuid.uuid1())
+        accumulate = not self.incremental or self.accumulate
+        data = bytearray() if accumulate else None
+        offset = 0
+        try:
+            for chunk in self._iter_audio(session_id, text):
+                if accumulate:
+                    data += chunk
+                # 每次回调使用新的 dict，listener 异步派发（ListenerDispatcher）时排队的回调互不影响
+                response = {"session_id": session_id}
+                if self.incremental:
+                    response["data"] = chunk
+                    response["offset"] = offset
+                else:
+                    response["data"] = bytes(data)
+                offset += len(chunk)
+                self.listener.on_message(response)
+        except _SynthesisError as e:
+            self.listener.on_fail({"session_id": session_id, "Code": e.code, "Message": e.message})
+            return
+        response = {"session_id": session_id}
+        response["data"] = bytes(data) if accumulate and offset > 0 else None
+        if self.incremental:
+            response["offset"] = offset
+        self.listener.on_complete(response)
+
+    def stream(self, text):
+        '''
+        以生成器方式逐块产出音频，不做任何累计，适合直接写入文件/播放器等下游：
+            for chunk in synthesizer.stream(text):
+                sink.write(chunk)
+        不经过 listener；服务端返回错误时抛出 RuntimeError。
+        '''
+        session_id = str(uuid.uuid1())
+        for chunk in self._iter_audio(session_id, text):
+            yield chunk
+
+    def _iter_audio(self, session_id, text):
+        key = None
+        record = None
+        if self.cache is not None:
+            key = synthesis_cache_key(text, self.voice_type, "", self.codec,
+                                      self.sample_rate, self.speed, self.volume)
+            blob = self.cache.get(key)
+            cached = SynthesisRecord.loads(blob) if blob is not None else None
+            if cached is not None:
+                for chunk in cached.audio_chunks():
+                    yield chunk
+                return
+            record = SynthesisRecord()
+        r = self.__post(session_id, text)
+        with r:
+            first = True
+            for chunk in r.iter_content(None):
+                if not chunk:
+                    continue
+                if first:
+                    first = False
+                    error = _parse_error(chunk)
+                    if error is not None:
+                        raise _SynthesisError(session_id, error[0], error[1])
+                if record is not None:
+                    record.add_audio(chunk)
+                yield chunk
+        # 只缓存完整读完的结果，调用方中途停止 stream 时不会走到这里
+        if record is not None and record.events:
+            self.cache.put(key, record.dumps())
+
+    def __post(self, session_id, text):
         params = self.__gen_params(session_id, text)
         signature = self.__gen_signature(params)
         headers = {
@@ -81,29 +185,8 @@ class SpeechSynthesizer:
             "Authorization": str(signature)
         }
         url = _PROTOCOL + _HOST + _PATH
-        r = requests.post(url, headers=headers,
-                          data=json.dumps(params), stream=True)
-        data = None
-        response = dict()
-        response["session_id"] = session_id
-        for chunk in r.iter_content(None):
-            if data is None:
-                try:
-                    rsp = json.loads(chunk)
-                    response["Code"] = rsp["Response"]["Error"]["Code"]
-                    response["Message"] = rsp["Response"]["Error"]["Message"]
-                    self.listener.on_fail(response)
-                    return
-                except:
-                    data = chunk
-                    response["data"] = data
-                    self.listener.on_message(response)
-                    continue
-            data = data + chunk
-            response["data"] = data
-            self.listener.on_message(response)
-        response["data"] = data
-        self.listener.on_complete(response)
+        return requests.post(url, headers=headers,
+                             data=json_codec.dumpb(params), stream=True)
 
     def __gen_signature(self, params):
         sort_dict = sorted(params.keys())
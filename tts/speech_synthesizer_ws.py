@@ -4,18 +4,25 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
+import collections
 from websocket import ABNF, WebSocketApp
 import uuid
 import urllib
 from common.log import logger
+from common import json_codec
+from common import results
+from common.state import SessionStatus, session_state
+from tts.synthesis_cache import EVENT_AUDIO, EVENT_TEXT, SynthesisRecord, synthesis_cache_key
+from tts.text_splitter import split_text
 
 
 _PROTOCOL = "wss://"
 _HOST = "tts.cloud.tencent.com"
 _PATH = "/stream_ws"
 _ACTION = "TextToStreamAudioWS"
+# 长文本模式下能得到准确音频时长、从而正确平移字幕时间的 codec
+_LONG_TEXT_SUBTITLE_CODECS = ("pcm", "mp3")
 
 
 class SpeechSynthesisListener(object):
@@ -47,6 +54,236 @@ class SpeechSynthesisListener(object):
         ))
 
 
+class _SegmentListener(SpeechSynthesisListener):
+    '''长文本模式下单个分段的 listener，把事件交给 _LongTextSession 排序后再转发'''
+
+    def __init__(self, session, index):
+        self.session = session
+        self.index = index
+        self.completed = False
+
+    def on_synthesis_start(self, session_id):
+        pass
+
+    def on_synthesis_end(self):
+        self.completed = True
+
+    def on_audio_result(self, audio_bytes):
+        self.session.on_event(self.index, EVENT_AUDIO, audio_bytes)
+
+    def on_text_result(self, response):
+        self.session.on_event(self.index, EVENT_TEXT, response)
+
+    def on_synthesis_fail(self, response):
+        self.session.on_fail(response)
+
+
+# MPEG 音频 Layer III 帧头表：版本位 -> 采样率 / 码率(kbps)
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_MP3_BITRATES_V1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_MP3_BITRATES_V2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+
+def _mp3_frame(buf, pos):
+    '''解析 pos 处的 Layer III 帧头，返回 (帧长, 采样数, 采样率)，不是合法帧头时返回 None'''
+    b1, b2 = buf[pos + 1], buf[pos + 2]
+    if buf[pos] != 0xFF or b1 & 0xE0 != 0xE0 or (b1 >> 1) & 3 != 1:
+        return None
+    version = (b1 >> 3) & 3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if version == 3:
+        return 144000 * _MP3_BITRATES_V1[bitrate_index] // sample_rate + padding, 1152, sample_rate
+    return 72000 * _MP3_BITRATES_V2[bitrate_index] // sample_rate + padding, 576, sample_rate
+
+
+class _Mp3Duration(object):
+    '''按帧头累计 mp3 音频的采样数，帧可以跨越多次 feed；跳过 ID3v2 标签与 Xing/Info 头帧'''
+
+    def __init__(self):
+        self.samples = 0
+        self.sample_rate = 0
+        self._buf = bytearray()
+        self._first = True
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        pos = 0
+        while len(buf) - pos >= 4:
+            if buf[pos:pos + 3] == b"ID3":
+                if len(buf) - pos < 10:
+                    break
+                size = 10 + ((buf[pos + 6] & 0x7F) << 21 | (buf[pos + 7] & 0x7F) << 14
+                             | (buf[pos + 8] & 0x7F) << 7 | (buf[pos + 9] & 0x7F))
+                if len(buf) - pos < size:
+                    break
+                pos += size
+                continue
+            frame = _mp3_frame(buf, pos)
+            if frame is None:
+                # 失步：逐字节寻找下一个帧头
+                pos += 1
+                continue
+            length, samples, sample_rate = frame
+            if len(buf) - pos < length:
+                break
+            body = bytes(buf[pos:pos + length])
+            if not (self._first and (b"Xing" in body or b"Info" in body)):
+                self.samples += samples
+                self.sample_rate = sample_rate
+            self._first = False
+            pos += length
+        del buf[:pos]
+
+
+class _LongTextSession(object):
+    '''
+    长文本模式：各分段用独立会话并发合成，事件严格按分段顺序转发给 listener。
+    队首分段的事件到达即转发，其余分段先缓存，轮到它时再补发；
+    同时在途的分段不超过 max_concurrency，缓存量因此有上限。
+    字幕的 BeginTime/EndTime 加上此前分段的音频时长，BeginIndex/EndIndex 加上分段在原文中的下标。
+    音频时长按实际采样数累计（pcm 由字节数、mp3 由帧头得出），全部分段累加后才换算为毫秒，不会逐段取整漂移。
+    listener 回调在锁外执行：持锁时只把待转发事件按序放入 _outbox，再由一个线程依次投递，
+    慢 listener 只拖住正在投递的那个接收线程，其他分段照常收帧。
+    '''
+
+    def __init__(self, synthesizer, segments, session_id, max_concurrency):
+        self.synthesizer = synthesizer
+        self.listener = synthesizer.listener
+        self.segments = segments
+        self.session_id = session_id
+        self.max_concurrency = max_concurrency
+        self.failed = False
+        self._cond = threading.Condition()
+        self._head = 0
+        self._time_offset = 0
+        self._offset_samples = 0
+        self._pending = [[] for _ in segments]
+        self._done = [False] * len(segments)
+        self._audio_bytes = [0] * len(segments)
+        self._mp3 = [_Mp3Duration() for _ in segments] if synthesizer.codec == "mp3" else None
+        self._outbox = collections.deque()
+        self._delivering = False
+
+    def run(self):
+        workers = []
+        for i in range(len(self.segments)):
+            with self._cond:
+                self._cond.wait_for(lambda: self.failed or i < self._head + self.max_concurrency)
+                if self.failed:
+                    break
+            t = threading.Thread(target=self._synthesize, args=(i,))
+            t.daemon = True
+            t.start()
+            workers.append(t)
+        for t in workers:
+            t.join()
+        # 分段接收线程可能仍在投递最后的事件
+        with self._cond:
+            self._cond.wait_for(lambda: not self._outbox and not self._delivering)
+        return not self.failed
+
+    def _synthesize(self, index):
+        listener = _SegmentListener(self, index)
+        child = self.synthesizer._segment_synthesizer(self.segments[index][1], listener)
+        child.start()
+        child.wait()
+        if listener.completed:
+            self._finish(index)
+        elif not self.failed:
+            self.on_fail({"session_id": self.session_id, "request_id": "", "code": -1,
+                          "message": "segment {} failed: {}".format(index, session_state(child).error)})
+
+    def _samples(self, index):
+        # 分段音频的采样数，采样率为 synthesizer.sample_rate
+        if self._mp3 is None:
+            return self._audio_bytes[index] // 2
+        mp3 = self._mp3[index]
+        if mp3.sample_rate and mp3.sample_rate != self.synthesizer.sample_rate:
+            return mp3.samples * self.synthesizer.sample_rate // mp3.sample_rate
+        return mp3.samples
+
+    def on_event(self, index, kind, value):
+        with self._cond:
+            if self.failed:
+                return
+            if kind == EVENT_AUDIO:
+                self._audio_bytes[index] += len(value)
+                if self._mp3 is not None:
+                    self._mp3[index].feed(value)
+            if index == self._head:
+                self._emit(index, kind, value)
+            else:
+                self._pending[index].append((kind, value))
+        self._deliver()
+
+    def on_fail(self, response):
+        with self._cond:
+            if self.failed:
+                return
+            self.failed = True
+            self._outbox.append((self.listener.on_synthesis_fail, response))
+            self._cond.notify_all()
+        self._deliver()
+
+    def _finish(self, index):
+        with self._cond:
+            self._done[index] = True
+            while not self.failed and self._head < len(self.segments) and self._done[self._head]:
+                self._offset_samples += self._samples(self._head)
+                self._time_offset = self._offset_samples * 1000 // self.synthesizer.sample_rate
+                self._head += 1
+                if self._head < len(self.segments):
+                    for kind, value in self._pending[self._head]:
+                        self._emit(self._head, kind, value)
+                    self._pending[self._head] = []
+            self._cond.notify_all()
+        self._deliver()
+
+    def _deliver(self):
+        # 同一时刻只有一个线程投递，保证顺序；其余线程入队后直接返回
+        with self._cond:
+            if self._delivering:
+                return
+            self._delivering = True
+        while True:
+            with self._cond:
+                if not self._outbox:
+                    self._delivering = False
+                    self._cond.notify_all()
+                    return
+                callback, arg = self._outbox.popleft()
+            try:
+                callback(arg)
+            except Exception:
+                logger.exception("listener {} raised".format(callback.__name__))
+
+    def _emit(self, index, kind, value):
+        # 持锁调用：按当前 _time_offset 生成事件并入队，由 _deliver 在锁外回调
+        if kind == EVENT_AUDIO:
+            self._outbox.append((self.listener.on_audio_result, value))
+            return
+        offset = self.segments[index][0]
+        subtitles = []
+        for subtitle in value["result"]["subtitles"]:
+            subtitle = dict(subtitle)
+            for name in ("BeginTime", "EndTime"):
+                subtitle[name] = subtitle.get(name, 0) + self._time_offset
+            for name in ("BeginIndex", "EndIndex"):
+                subtitle[name] = subtitle.get(name, 0) + offset
+            subtitles.append(subtitle)
+        result = dict(value["result"], subtitles=subtitles)
+        response = dict(value, result=result, session_id=self.session_id)
+        if self.synthesizer.typed_results:
+            response = results.to_typed(response, results.TTS)
+        self._outbox.append((self.listener.on_text_result, response))
+
+
 NOTOPEN = 0
 STARTED = 1
 OPENED = 2
@@ -57,6 +294,8 @@ CLOSED = 5
 
 class SpeechSynthesizer:
 
+    status = SessionStatus()
+
     def __init__(self, appid, credential, listener):
         self.appid = appid
         self.credential = credential
@@ -64,6 +303,7 @@ class SpeechSynthesizer:
         self.ws = None
         self.wst = None
         self.listener = listener
+        self.typed_results = False
 
         self.text = "欢迎使用腾讯云实时语音合成"
         self.voice_type = 0
@@ -74,6 +314,9 @@ class SpeechSynthesizer:
         self.session_id = ""
         self.enable_subtitle = True
         self.fast_voice_type = ""
+        self.cache = None
+        self.long_text_max_chars = 0
+        self.long_text_concurrency = 3
 
     def set_voice_type(self, voice_type):
         self.voice_type = voice_type
@@ -99,6 +342,73 @@ class SpeechSynthesizer:
     def set_fast_voice_type(self, fast_voice_type):
         self.fast_voice_type = fast_voice_type
 
+    #开启后 listener 收到的消息中的字幕解码为 common.results 中带 __slots__ 的对象，
+    #仍支持原来的下标访问，需要 dict 时调用 as_dict()
+    def set_typed_results(self, enable):
+        self.typed_results = enable
+
+    #合成结果缓存，需提供 get(key)/put(key, value)，如 common.cache.TieredCache；
+    #命中时按原顺序回放缓存的音频与字幕，不建立连接，None 表示关闭
+    def set_cache(self, cache):
+        self.cache = cache
+
+    #长文本模式：文本超过 max_chars 时在句末标点处切分，最多 max_concurrency 个会话并发合成，
+    #音频与字幕仍按原文顺序回调；max_chars 为 0 表示关闭。
+    #各分段独立编码；字幕时间需按音频实际时长平移，开启字幕时 codec 只支持 pcm 与 mp3
+    def set_long_text_mode(self, max_chars=100, max_concurrency=3):
+        self.long_text_max_chars = max_chars
+        self.long_text_concurrency = max_concurrency
+
+    def _segment_synthesizer(self, text, listener):
+        child = SpeechSynthesizer(self.appid, self.credential, listener)
+        child.voice_type = self.voice_type
+        child.codec = self.codec
+        child.sample_rate = self.sample_rate
+        child.volume = self.volume
+        child.speed = self.speed
+        child.enable_subtitle = self.enable_subtitle
+        child.fast_voice_type = self.fast_voice_type
+        child.cache = self.cache
+        child.text = text
+        return child
+
+    def _run_long_text(self, session):
+        self.status = OPENED
+        if session.run():
+            self.status = FINAL
+            self.listener.on_synthesis_end()
+            self.status = CLOSED
+        else:
+            session_state(self).set(ERROR, "long text synthesis failed")
+
+    def _cache_key(self):
+        return synthesis_cache_key(self.text, self.voice_type, self.fast_voice_type, self.codec,
+                                   self.sample_rate, self.speed, self.volume)
+
+    def _load_cached(self, key):
+        blob = self.cache.get(key)
+        if blob is None:
+            return None
+        record = SynthesisRecord.loads(blob)
+        # 无字幕的缓存条目不能满足需要字幕的请求
+        if record is None or (self.enable_subtitle and not record.subtitles):
+            return None
+        return record
+
+    def _replay(self, record, session_id):
+        self.status = OPENED
+        for kind, value in record.replay():
+            if kind == EVENT_AUDIO:
+                self.listener.on_audio_result(value)
+            else:
+                value = dict(value, session_id=session_id)
+                if self.typed_results:
+                    value = results.to_typed(value, results.TTS)
+                self.listener.on_text_result(value)
+        self.status = FINAL
+        self.listener.on_synthesis_end()
+        self.status = CLOSED
+
     def __gen_signature(self, params):
         sort_dict = sorted(params.keys())
         sign_str = "GET" + _HOST + _PATH + "?"
@@ -157,6 +467,40 @@ class SpeechSynthesizer:
     def start(self):
         logger.info("synthesizer start: begin")
 
+        if 0 < self.long_text_max_chars < len(self.text):
+            if self.enable_subtitle and self.codec not in _LONG_TEXT_SUBTITLE_CODECS:
+                raise ValueError("long text mode with subtitles requires codec pcm or mp3, got %s" % self.codec)
+            session_id = str(uuid.uuid1())
+            self.session_id = session_id
+            segments = split_text(self.text, self.long_text_max_chars)
+            logger.info("long text mode, session_id={} segments={}".format(session_id, len(segments)))
+            self.status = STARTED
+            self.listener.on_synthesis_start(session_id)
+            session = _LongTextSession(self, segments, session_id, self.long_text_concurrency)
+            self.wst = threading.Thread(target=self._run_long_text, args=(session,))
+            self.wst.daemon = True
+            self.wst.start()
+            logger.info("synthesizer start: end")
+            return
+
+        cache_key = None
+        record = None
+        if self.cache is not None:
+            cache_key = self._cache_key()
+            cached = self._load_cached(cache_key)
+            if cached is not None:
+                session_id = str(uuid.uuid1())
+                self.session_id = session_id
+                logger.info("synthesis cache hit, session_id={}".format(session_id))
+                self.status = STARTED
+                self.listener.on_synthesis_start(session_id)
+                self.wst = threading.Thread(target=self._replay, args=(cached, session_id))
+                self.wst.daemon = True
+                self.wst.start()
+                logger.info("synthesizer start: end")
+                return
+            record = SynthesisRecord(self.enable_subtitle)
+
         def _close_conn(reason):
             ta = time.time()
             self.ws.close()
@@ -167,10 +511,12 @@ class SpeechSynthesizer:
             # NOTE print all message that client received
             # logger.info("data={} opcode={} flag={}".format(data, opcode, flag))
             if opcode == ABNF.OPCODE_BINARY:
+                if record is not None:
+                    record.add_audio(data)
                 self.listener.on_audio_result(data) # <class 'bytes'>
                 pass
             elif opcode == ABNF.OPCODE_TEXT:
-                resp = json.loads(data) # WSResponseMessage
+                resp = results.loads(data, results.TTS) if self.typed_results else json_codec.loads(data) # WSResponseMessage
                 if resp['code'] != 0:
                     logger.error("server synthesis fail request_id={} code={} msg={}".format(
                         resp['request_id'], resp['code'], resp['message']
@@ -179,12 +525,16 @@ class SpeechSynthesizer:
                     return
                 if "final" in resp and resp['final'] == 1:
                     logger.info("recv FINAL frame")
+                    if record is not None:
+                        self.cache.put(cache_key, record.dumps())
                     self.status = FINAL
                     _close_conn("after recv final")
                     self.listener.on_synthesis_end()
                     return
                 if "result" in resp:
                     if "subtitles" in resp["result"] and resp["result"]["subtitles"] is not None:
+                        if record is not None:
+                            record.add_text(resp)
                         self.listener.on_text_result(resp)
                     return
             else:
@@ -193,7 +543,7 @@ class SpeechSynthesizer:
         def _on_error(ws, error):
             if self.status == FINAL or self.status == CLOSED:
                 return
-            self.status = ERROR
+            session_state(self).set(ERROR, error)
             logger.error("error={}, session_id={}".format(error, self.session_id))
             _close_conn("after recv error")
 
@@ -218,17 +568,16 @@ class SpeechSynthesizer:
             on_data=_on_data)
         self.ws.on_open = _on_open
         
+        self.status = STARTED
         self.wst = threading.Thread(target=self.ws.run_forever)
         self.wst.daemon = True
         self.wst.start()
-        self.status = STARTED
         self.listener.on_synthesis_start(session_id)
         
         logger.info("synthesizer start: end")
 
     def wait(self):
         logger.info("synthesizer wait: begin")
-        if self.ws:
-            if self.wst and self.wst.is_alive():
-                self.wst.join()
+        if self.wst and self.wst.is_alive():
+            self.wst.join()
         logger.info("synthesizer wait: end")
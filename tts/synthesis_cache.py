@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import json
+import struct
+
+from common.cache import hash_key
+from common.results import json_default
+
+
+# ---------------------------------------------------------------------------
+# 语音合成结果缓存：同一文本与音色参数的合成结果（音频 + 字幕）只合成一次，
+# 之后从缓存按原顺序回放给 listener，不再请求服务端、不再计费字符。
+#
+#   cache = TieredCache(MemoryCache(64 << 20), DiskCache("/var/cache/tts", 1 << 30, use_mmap=True))
+#   synthesizer.set_cache(cache)
+#
+# 缓存条目格式：b"TTSC" | meta 长度(uint32 LE) | meta json | 音频
+# meta.events 依次记录 [0, 音频块长度] 或 [1, 字幕消息]，回放时保持原有的交错顺序。
+# ---------------------------------------------------------------------------
+_MAGIC = b"TTSC"
+EVENT_AUDIO = 0
+EVENT_TEXT = 1
+
+
+def synthesis_cache_key(text, voice_type, fast_voice_type, codec, sample_rate, speed, volume):
+    params = json.dumps([voice_type, fast_voice_type or "", codec, sample_rate, speed, volume])
+    return hash_key(params, text)
+
+
+class SynthesisRecord(object):
+
+    def __init__(self, subtitles=False):
+        self.subtitles = subtitles
+        self.events = []
+        self._audio = []
+        self._view = None
+
+    def add_audio(self, chunk):
+        self.events.append([EVENT_AUDIO, len(chunk)])
+        self._audio.append(bytes(chunk))
+
+    def add_text(self, response):
+        self.events.append([EVENT_TEXT, response])
+
+    def dumps(self):
+        meta = json.dumps({"subtitles": self.subtitles, "events": self.events},
+                          ensure_ascii=False, default=json_default).encode("utf-8")
+        return b"".join([_MAGIC, struct.pack("<I", len(meta)), meta] + self._audio)
+
+    @classmethod
+    def loads(cls, blob):
+        """blob 为 dumps 的结果或其 memoryview（如 DiskCache 映射读取），格式不符时返回 None"""
+        view = memoryview(blob)
+        if len(view) < 8 or bytes(view[:4]) != _MAGIC:
+            return None
+        size = struct.unpack_from("<I", view, 4)[0]
+        meta = json.loads(bytes(view[8:8 + size]).decode("utf-8"))
+        record = cls(meta["subtitles"])
+        record.events = meta["events"]
+        record._view = view[8 + size:]
+        return record
+
+    def replay(self):
+        """按原顺序产出 (0, 音频 bytes) 或 (1, 字幕消息)"""
+        pos = 0
+        for kind, value in self.events:
+            if kind == EVENT_AUDIO:
+                yield kind, bytes(self._view[pos:pos + value])
+                pos += value
+            else:
+                yield kind, value
+
+    def audio_chunks(self):
+        for kind, value in self.replay():
+            if kind == EVENT_AUDIO:
+                yield value
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import threading
+import time
+
+from common.log import logger
+from tts.text_splitter import CLAUSE_END, SENTENCE_END
+
+FLUSH_PUNCTUATION = "punctuation"
+FLUSH_LENGTH = "length"
+FLUSH_FIRST = "first"
+FLUSH_IDLE = "idle"
+FLUSH_END = "end"
+
+
+class TextCoalescer(object):
+    '''
+    把大模型逐 token 输出的文本片段合并后再调用 synthesizer.process()，
+    在首包延迟与消息条数之间折中。满足以下任一条件即发送缓冲区中的文本：
+      punctuation  新片段中出现标点且标点前已累计不少于 min_chars 个字符，发送到最后一个标点为止
+      length       累计超过 max_chars，尽量在标点处截断
+      first        尚未发送过任何文本且累计达到 first_chars（0 表示不启用），用于压低首包延迟
+      idle         idle_timeout_ms 内没有新片段
+      end          输入结束或调用 close()
+    stats 按原因统计发送次数。只有空白的缓冲区不单独发送，留到下一段文本前面。
+    synthesizer.process() 在锁外按输入顺序调用，慢的发送不会阻塞 push()；flush()/close() 返回时已全部发送。
+
+        coalescer = TextCoalescer(synthesizer)
+        coalescer.feed(llm_tokens)              # 或 await coalescer.feed_async(llm_async_tokens)
+        synthesizer.complete()
+    '''
+
+    def __init__(self, synthesizer, min_chars=6, max_chars=80, first_chars=0,
+                 idle_timeout_ms=500, punctuation=SENTENCE_END + CLAUSE_END):
+        self.synthesizer = synthesizer
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.first_chars = first_chars
+        self.idle_timeout_ms = idle_timeout_ms
+        self.punctuation = punctuation
+        self.stats = collections.Counter()
+        self.fragments = 0
+        self.messages = 0
+        self._buf = ""
+        # 未单独发送的空白，拼在下一段文本前面
+        self._space = ""
+        # 待发送文本，持锁入队，由 _send 在锁外按序发送
+        self._outbox = collections.deque()
+        self._sending = False
+        self._cond = threading.Condition()
+        self._deadline = None
+        self._timer = None
+        self._closed = False
+
+    def push(self, fragment):
+        '''追加一个文本片段，可能触发发送；idle_timeout_ms > 0 时由后台线程负责空闲超时发送'''
+        with self._cond:
+            self._append(fragment)
+            if self.idle_timeout_ms > 0:
+                self._deadline = time.time() + self.idle_timeout_ms / 1000.0 if self._buf else None
+                if self._timer is None:
+                    self._closed = False
+                    self._timer = threading.Thread(target=self._idle_loop)
+                    self._timer.daemon = True
+                    self._timer.start()
+                self._cond.notify_all()
+        self._send()
+
+    def flush(self, reason=FLUSH_END):
+        with self._cond:
+            self._emit(len(self._buf), reason)
+            self._deadline = None
+        self._send_all()
+
+    def close(self):
+        '''发送剩余文本并停止空闲检测线程，不会调用 synthesizer.complete()'''
+        with self._cond:
+            self._emit(len(self._buf), FLUSH_END)
+            self._space = ""
+            self._deadline = None
+            self._closed = True
+            timer = self._timer
+            self._timer = None
+            self._cond.notify_all()
+        if timer is not None:
+            timer.join()
+        self._send_all()
+
+    def feed(self, fragments):
+        '''逐个读取 fragments 并发送，阻塞到迭代结束'''
+        try:
+            for fragment in fragments:
+                self.push(fragment)
+        finally:
+            self.close()
+
+    async def feed_async(self, fragments):
+        '''feed 的 asyncio 版本，fragments 为异步可迭代对象，空闲超时由事件循环实现，不额外创建线程'''
+        # synthesizer.process() 会阻塞（等待建连、发送），放到线程池中执行，不占用事件循环
+        loop = asyncio.get_event_loop()
+        it = fragments.__aiter__()
+        timeout = self.idle_timeout_ms / 1000.0 if self.idle_timeout_ms > 0 else None
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(it.__anext__())
+                wait_timeout = timeout if self._buf else None
+                done, _ = await asyncio.wait([pending], timeout=wait_timeout)
+                if not done:
+                    with self._cond:
+                        self._emit(len(self._buf), FLUSH_IDLE)
+                    await loop.run_in_executor(None, self._send)
+                    continue
+                try:
+                    fragment = pending.result()
+                except StopAsyncIteration:
+                    pending = None
+                    break
+                pending = None
+                with self._cond:
+                    self._append(fragment)
+                    queued = bool(self._outbox)
+                if queued:
+                    await loop.run_in_executor(None, self._send)
+        finally:
+            if pending is not None:
+                pending.cancel()
+            await loop.run_in_executor(None, self.flush, FLUSH_END)
+
+    def _append(self, fragment):
+        # 在 self._cond 内调用
+        if not fragment:
+            return
+        self.fragments += 1
+        start = len(self._buf)
+        self._buf += fragment
+        last = -1
+        for i in range(len(fragment) - 1, -1, -1):
+            if fragment[i] in self.punctuation:
+                last = start + i
+                break
+        if last >= 0 and last + 1 >= self.min_chars:
+            self._emit(last + 1, FLUSH_PUNCTUATION)
+        while len(self._buf) > self.max_chars:
+            cut = self.max_chars
+            for i in range(self.max_chars - 1, self.min_chars - 2, -1):
+                if i >= 0 and self._buf[i] in self.punctuation:
+                    cut = i + 1
+                    break
+            self._emit(cut, FLUSH_LENGTH)
+        if self.messages == 0 and 0 < self.first_chars <= len(self._buf):
+            self._emit(len(self._buf), FLUSH_FIRST)
+
+    def _emit(self, size, reason):
+        # 在 self._cond 内调用：只按输入顺序入队，由 _send 在锁外发送
+        text = self._space + self._buf[:size]
+        self._buf = self._buf[size:]
+        if not text.strip():
+            # 如 "Hello," " " "world" 中空闲超时时只剩空格，留给下一段，避免拼成 "Hello,world"
+            self._space = text
+            return
+        self._space = ""
+        self.stats[reason] += 1
+        self.messages += 1
+        logger.debug("coalescer flush reason={} len={}".format(reason, len(text)))
+        self._outbox.append(text)
+
+    def _send(self):
+        # 同一时刻只有一个线程调用 synthesizer.process()，保证顺序；其余线程入队后直接返回
+        with self._cond:
+            if self._sending:
+                return
+            self._sending = True
+        while True:
+            with self._cond:
+                if not self._outbox:
+                    self._sending = False
+                    self._cond.notify_all()
+                    return
+                text = self._outbox.popleft()
+            try:
+                self.synthesizer.process(text)
+            except Exception:
+                with self._cond:
+                    self._sending = False
+                    self._cond.notify_all()
+                raise
+
+    def _send_all(self):
+        # 等待其他线程正在进行的发送结束，返回时已入队的文本都已发送
+        self._send()
+        with self._cond:
+            self._cond.wait_for(lambda: not self._sending)
+            remaining = bool(self._outbox)
+        if remaining:
+            self._send()
+
+    def _idle_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if self._deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._deadline - time.time()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                self._deadline = None
+                self._emit(len(self._buf), FLUSH_IDLE)
+            try:
+                self._send()
+            except Exception as e:
+                logger.error("coalescer idle flush error: {}".format(e))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+# 句末标点：优先在这里切分
+SENTENCE_END = u"。！？!?；;…\n"
+# 句中停顿：单句超长时退而在这里切分
+CLAUSE_END = u"，,、：:"
+# 紧跟在标点后的右引号/括号归入前一段
+_CLOSING = u"”’」』）)】》\"'"
+
+
+def _cut(text, start, end, marks):
+    bounds = []
+    s = start
+    i = start
+    while i < end:
+        if text[i] in marks:
+            i += 1
+            while i < end and (text[i] in _CLOSING or text[i] in marks):
+                i += 1
+            bounds.append((s, i))
+            s = i
+        else:
+            i += 1
+    if s < end:
+        bounds.append((s, end))
+    return bounds
+
+
+def split_text(text, max_chars):
+    '''
+    把长文本切成不超过 max_chars 个字符的片段，尽量在句末标点处切分，
+    单句超长时在句中停顿处切分，仍超长则按长度硬切。
+    返回 [(片段在原文中的起始下标, 片段文本)]，不含全空白的片段。
+    '''
+    units = []
+    for s, e in _cut(text, 0, len(text), SENTENCE_END):
+        if e - s <= max_chars:
+            units.append((s, e))
+            continue
+        for cs, ce in _cut(text, s, e, CLAUSE_END):
+            while ce - cs > max_chars:
+                units.append((cs, cs + max_chars))
+                cs += max_chars
+            if cs < ce:
+                units.append((cs, ce))
+    segments = []
+    for s, e in units:
+        if segments and e - segments[-1][0] <= max_chars:
+            segments[-1] = (segments[-1][0], e)
+        else:
+            segments.append((s, e))
+    return [(s, text[s:e]) for s, e in segments if text[s:e].strip()]
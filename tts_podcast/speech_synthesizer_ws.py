@@ -4,12 +4,14 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 import websocket
 import uuid
 import urllib
 from common.log import logger
+from common import json_codec
+from common import results
+from common.state import SessionStatus, session_state
 from common.utils import is_python3
 
 
@@ -112,6 +114,8 @@ SpeechSynthesizer_ACTION_CANCEL = "ACTION_CANCEL"
 
 class SpeechSynthesizer:
 
+    status = SessionStatus()
+
     def __init__(self, appid, credential, listener):
         self.appid = appid
         self.credential = credential
@@ -119,6 +123,7 @@ class SpeechSynthesizer:
         self.ws = None
         self.wst = None
         self.listener = listener
+        self.typed_results = False
 
         self.ready = False
 
@@ -162,6 +167,11 @@ class SpeechSynthesizer:
     def set_enable_web_search(self, enable_web_search):
         self.enable_web_search = enable_web_search
     
+    #开启后 listener 收到的消息中的字幕解码为 common.results 中带 __slots__ 的对象，
+    #仍支持原来的下标访问，需要 dict 时调用 as_dict()
+    def set_typed_results(self, enable):
+        self.typed_results = enable
+
     def _add_input_object(self, input_object):
         self.input_object_list.append(input_object)
         return True, ""
@@ -263,7 +273,7 @@ class SpeechSynthesizer:
     def __do_send(self, action, text):
         self.wait_ready()
         WSRequestMessage = self.__new_ws_request_message(action, text)
-        data = json.dumps(WSRequestMessage)
+        data = json_codec.dumps(WSRequestMessage)
         opcode = websocket.ABNF.OPCODE_TEXT
         logger.info("ws send opcode={} data={}".format(opcode, data))
         self.ws.send(data, opcode)
@@ -271,7 +281,7 @@ class SpeechSynthesizer:
     def send_input_object_list(self, action=SpeechSynthesizer_ACTION_SYNTHESIS):
         idx = 0
         for input_object in self.input_object_list:
-            input_object_str = json.dumps(input_object.to_dict())
+            input_object_str = json_codec.dumps(input_object.to_dict())
             logger.info("process[{}]: action={} data={}".format(idx, action, input_object_str))
             self.__do_send(action, input_object_str)
             idx += 1
@@ -293,14 +303,11 @@ class SpeechSynthesizer:
         self.complete()
 
     def wait_ready(self, timeout_ms=0):
-        timeout_start = int(time.time() * 1000)
-        while True:
-            if self.ready:
-                return True
-            if timeout_ms!=0 and int(time.time() * 1000) - timeout_start > timeout_ms:
-                break
-            time.sleep(0.01)
-        return False
+        # timeout_ms 为 0 表示一直等待；连接出错或关闭时立即返回
+        session_state(self).wait(
+            lambda: self.ready or self.status in (FINAL, ERROR, CLOSED),
+            timeout_ms / 1000.0 if timeout_ms != 0 else None)
+        return self.ready
 
     def start(self):
         logger.info("synthesizer start: begin")
@@ -318,7 +325,7 @@ class SpeechSynthesizer:
                 pass
             elif opcode == websocket.ABNF.OPCODE_TEXT:
                 logger.info("data={} opcode={} flag={}".format(data, opcode, flag))
-                resp = json.loads(data) # WSResponseMessage
+                resp = results.loads(data, results.TTS) if self.typed_results else json_codec.loads(data) # WSResponseMessage
                 if resp['code'] != 0:
                     logger.error("server synthesis fail request_id={} code={} msg={}".format(
                         resp['request_id'], resp['code'], resp['message']
@@ -336,6 +343,7 @@ class SpeechSynthesizer:
                 if "ready" in resp and resp['ready'] == 1:
                     logger.info("recv READY frame")
                     self.ready = True
+                    session_state(self).notify()
                     return
                 if "ping" in resp and resp['ping'] == 1:
                     logger.info("recv PING frame")
@@ -349,7 +357,7 @@ class SpeechSynthesizer:
         def _on_error(ws, error):
             if self.status == FINAL or self.status == CLOSED:
                 return
-            self.status = ERROR
+            session_state(self).set(ERROR, error)
             logger.error("error={}, session_id={}".format(error, self.session_id))
             _close_conn("after recv error")
 
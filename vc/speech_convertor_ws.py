@@ -4,12 +4,13 @@ import hmac
 import hashlib
 import base64
 import time
-import json
 import threading
 from websocket import ABNF, WebSocketApp
 import uuid
 import urllib
 from common.log import logger
+from common import json_codec
+from common.state import SessionStatus, session_state
 
 
 _PROTOCOL = "wss://"
@@ -44,6 +45,8 @@ CLOSED = 5
 
 class SpeechConvertor:
 
+    status = SessionStatus()
+
     def __init__(self, appid, credential, listener):
         self.appid = appid
         self.credential = credential
@@ -137,7 +140,7 @@ class SpeechConvertor:
                 audio_data = data[4 + length:]
                 logger.info("recv raw json: {}".format(json_str))
                 
-                resp = json.loads(json_str)
+                resp = json_codec.loads(json_str)
                 if resp['Code'] != 0:
                     logger.error("server convert fail voice_id={} code={} msg_id={} msg={}".format(
                         resp['VoiceId'], resp['Code'], resp['MessageId'], resp['Message']
@@ -160,7 +163,7 @@ class SpeechConvertor:
         def _on_error(ws, error):
             if self.status == FINAL or self.status == CLOSED:
                 return
-            self.status = ERROR
+            session_state(self).set(ERROR, error)
             logger.error("error={}, voice_id={}".format(error, self.voice_id))
             _close_conn("after recv error")
 
@@ -186,10 +189,10 @@ class SpeechConvertor:
             on_data=_on_data)
         self.ws.on_open = _on_open
         
+        self.status = STARTED
         self.wst = threading.Thread(target=self.ws.run_forever)
         self.wst.daemon = True
         self.wst.start()
-        self.status = STARTED
         self.listener.on_convert_start(voice_id)
         
         logger.info("convertor start: end")
@@ -212,26 +215,23 @@ class SpeechConvertor:
         
         # message format: HEAD + JSON + AUDIO
         # refer to https://cloud.tencent.com/document/product/1664/85973#edac94f7-2e9d-4e59-aac3-fd1bea693be0
-        json_body = json.dumps({
+        json_body_bytes = json_codec.dumpb({
             "End": 1 if is_end else 0,
         })
-        json_body_bytes = bytes(json_body, encoding='utf-8')
         json_body_len = len(json_body_bytes)
         
         head = json_body_len.to_bytes(4, byteorder='big')
         message = head + json_body_bytes + audio_data
-        logger.info("send json_body_len={} json_body={} audio_len={}".format(
-            json_body_len, json_body, len(audio_data)))
+        logger.info("send json_body_len={} end={} audio_len={}".format(json_body_len, int(is_end), len(audio_data)))
         
         self.ws.send(message, ABNF.OPCODE_BINARY)
         logger.info("convertor send: end")
         return True
 
-    def wait_to_send(self):
-        while True:
-            if self.status < OPENED:
-                time.sleep(0.01)
-            else:
-                break
+    def wait_to_send(self, timeout_ms=0):
+        # timeout_ms 为 0 表示一直等待，直到连接打开或失败
+        session_state(self).wait(
+            lambda: self.status >= OPENED,
+            timeout_ms / 1000.0 if timeout_ms != 0 else None)
         logger.info("wait_to_send: status={}".format(self.status))
         return self.status == OPENED